@@ -0,0 +1,381 @@
+from typing import List, Tuple
+from psycopg2 import sql
+from datetime import date
+
+from Utility.AsyncDBConnector import AsyncDBConnector
+from Utility.ReturnValue import ReturnValue
+from Utility.Exceptions import DatabaseException
+
+from Business.Owner import Owner
+from Business.Customer import Customer
+from Business.Apartment import Apartment
+
+import Solution
+from Solution import _owner_values, _apartment_values, _customer_values, _invalidate
+
+'''
+    asyncio version of the Solution API, same queries, Business objects and ReturnValue codes
+    every call awaits the database instead of blocking a thread, e.g. owner = await AsyncSolution.get_owner(1)
+    schema management (create_tables, drop_tables, ...) stays in Solution
+    the writes invalidate the rows they change in the Solution cache (see Solution.configure_cache), the reads
+    always go to the database
+'''
+
+
+async def run_query(query, params: tuple = None):
+    conn = None
+    return_val = ReturnValue.OK
+    num_rows_effected = None
+    entries = None
+
+    try:
+        conn = await AsyncDBConnector.connect()
+        num_rows_effected, entries = await conn.execute(query, params=params)
+
+    except DatabaseException.NOT_NULL_VIOLATION as e:
+        return_val = ReturnValue.BAD_PARAMS
+
+    except DatabaseException.CHECK_VIOLATION as e:
+        return_val = ReturnValue.BAD_PARAMS
+
+    except DatabaseException.EXCLUSION_VIOLATION as e:
+        return_val = ReturnValue.BAD_PARAMS
+
+    except DatabaseException.UNIQUE_VIOLATION as e:
+        return_val = ReturnValue.ALREADY_EXISTS
+
+    except DatabaseException.FOREIGN_KEY_VIOLATION as e:
+        return_val = ReturnValue.NOT_EXISTS
+
+    except Exception as e:
+        return_val = ReturnValue.ERROR
+
+    finally:
+        if conn is not None:
+            await conn.close()
+        return num_rows_effected, entries, return_val
+
+
+# ---------------------------------- CRUD API: ----------------------------------
+
+async def add_owner(owner: Owner) -> ReturnValue:
+    values = _owner_values(owner)
+    if values is None:
+        return ReturnValue.BAD_PARAMS
+
+    _, _, return_val = await run_query(Solution.ADD_OWNER, values)
+
+    if return_val == ReturnValue.OK:
+        _invalidate(("owner", values[0]))
+
+    return return_val
+
+
+async def get_owner(owner_id: int) -> Owner:
+    if owner_id <= 0:
+        return Owner.bad_owner()
+
+    num_rows_effected, entries, return_val = await run_query(Solution.GET_OWNER, (owner_id,))
+
+    if return_val != ReturnValue.OK or num_rows_effected == 0:
+        return Owner.bad_owner()
+
+    return Owner.from_row(entries.rows[0])
+
+
+async def delete_owner(owner_id: int) -> ReturnValue:
+    if owner_id <= 0:
+        return ReturnValue.BAD_PARAMS
+
+    num_rows_effected, _, return_val = await run_query(Solution.DELETE_OWNER, (owner_id,))
+
+    if num_rows_effected == 0:
+        return ReturnValue.NOT_EXISTS
+
+    if return_val == ReturnValue.OK:
+        _invalidate(("owner", owner_id))
+
+    return return_val
+
+
+async def add_apartment(apartment: Apartment) -> ReturnValue:
+    values = _apartment_values(apartment)
+    if values is None:
+        return ReturnValue.BAD_PARAMS
+
+    _, _, return_val = await run_query(Solution.ADD_APARTMENT, values)
+
+    if return_val == ReturnValue.OK:
+        _invalidate(("apartment", values[0]))
+
+    return return_val
+
+
+async def get_apartment(apartment_id: int) -> Apartment:
+    if apartment_id <= 0:
+        return Apartment.bad_apartment()
+
+    num_rows_effected, entries, return_val = await run_query(Solution.GET_APARTMENT, (apartment_id,))
+
+    if return_val != ReturnValue.OK or num_rows_effected == 0:
+        return Apartment.bad_apartment()
+
+    return Apartment.from_row(entries.rows[0])
+
+
+async def delete_apartment(apartment_id: int) -> ReturnValue:
+    if apartment_id <= 0:
+        return ReturnValue.BAD_PARAMS
+
+    num_rows_effected, _, return_val = await run_query(Solution.DELETE_APARTMENT, (apartment_id,))
+
+    if num_rows_effected == 0:
+        return ReturnValue.NOT_EXISTS
+
+    if return_val == ReturnValue.OK:
+        _invalidate(("apartment", apartment_id))
+
+    return return_val
+
+
+async def add_customer(customer: Customer) -> ReturnValue:
+    values = _customer_values(customer)
+    if values is None:
+        return ReturnValue.BAD_PARAMS
+
+    _, _, return_val = await run_query(Solution.ADD_CUSTOMER, values)
+
+    if return_val == ReturnValue.OK:
+        _invalidate(("customer", values[0]))
+
+    return return_val
+
+
+async def get_customer(customer_id: int) -> Customer:
+    if customer_id <= 0:
+        return Customer.bad_customer()
+
+    num_rows_effected, entries, return_val = await run_query(Solution.GET_CUSTOMER, (customer_id,))
+
+    if return_val != ReturnValue.OK or num_rows_effected == 0:
+        return Customer.bad_customer()
+
+    return Customer.from_row(entries.rows[0])
+
+
+async def delete_customer(customer_id: int) -> ReturnValue:
+    if customer_id <= 0:
+        return ReturnValue.BAD_PARAMS
+
+    num_rows_effected, _, return_val = await run_query(Solution.DELETE_CUSTOMER, (customer_id,))
+
+    if num_rows_effected == 0:
+        return ReturnValue.NOT_EXISTS
+
+    if return_val == ReturnValue.OK:
+        _invalidate(("customer", customer_id))
+
+    return return_val
+
+
+async def customer_made_reservation(customer_id: int, apartment_id: int, start_date: date, end_date: date,
+                                    total_price: float) -> ReturnValue:
+    if customer_id <= 0 or apartment_id <= 0 or start_date >= end_date or total_price <= 0:
+        return ReturnValue.BAD_PARAMS
+
+    num_rows_effected, _, return_val = await run_query(Solution.CUSTOMER_MADE_RESERVATION,
+                                                       (customer_id, apartment_id, start_date, end_date, total_price))
+
+    if return_val == ReturnValue.ALREADY_EXISTS:  # same apartment and start date, an overlap as well
+        return ReturnValue.BAD_PARAMS
+
+    return return_val
+
+
+async def customer_cancelled_reservation(customer_id: int, apartment_id: int, start_date: date) -> ReturnValue:
+    if customer_id <= 0 or apartment_id <= 0:
+        return ReturnValue.BAD_PARAMS
+
+    num_rows_effected, _, return_val = await run_query(Solution.CUSTOMER_CANCELLED_RESERVATION,
+                                                       (customer_id, apartment_id, start_date))
+
+    if num_rows_effected == 0:
+        return ReturnValue.NOT_EXISTS
+
+    return return_val
+
+
+async def customer_reviewed_apartment(customer_id: int, apartment_id: int, review_date: date, rating: int,
+                                      review_text: str) -> ReturnValue:
+    if customer_id <= 0 or apartment_id <= 0 or rating < 1 or rating > 10:
+        return ReturnValue.BAD_PARAMS
+
+    num_rows_effected, _, return_val = await run_query(Solution.CUSTOMER_REVIEWED_APARTMENT,
+                                                       (customer_id, apartment_id, review_date, rating, review_text))
+
+    if return_val == ReturnValue.OK and num_rows_effected == 0:  # customer did not have a prior reservation
+        return ReturnValue.NOT_EXISTS
+
+    return return_val
+
+
+async def customer_updated_review(customer_id: int, apartment_id: int, update_date: date, new_rating: int,
+                                  new_text: str) -> ReturnValue:
+    if customer_id <= 0 or apartment_id <= 0 or new_rating < 1 or new_rating > 10:
+        return ReturnValue.BAD_PARAMS
+
+    num_rows_effected, _, return_val = await run_query(Solution.CUSTOMER_UPDATED_REVIEW,
+                                                       (customer_id, apartment_id, update_date, new_rating, new_text))
+
+    if return_val == ReturnValue.OK and num_rows_effected == 0:  # customer did not have an old review
+        return ReturnValue.NOT_EXISTS
+
+    return return_val
+
+
+async def owner_owns_apartment(owner_id: int, apartment_id: int) -> ReturnValue:
+    if owner_id <= 0 or apartment_id <= 0:
+        return ReturnValue.BAD_PARAMS
+
+    _, _, return_val = await run_query(Solution.OWNER_OWNS_APARTMENT, (apartment_id, owner_id))
+
+    if return_val == ReturnValue.OK:
+        _invalidate(("ownedby", apartment_id))
+
+    return return_val
+
+
+async def owner_drops_apartment(owner_id: int, apartment_id: int) -> ReturnValue:
+    if owner_id <= 0 or apartment_id <= 0:
+        return ReturnValue.BAD_PARAMS
+
+    num_rows_effected, _, return_val = await run_query(Solution.OWNER_DROPS_APARTMENT, (apartment_id, owner_id))
+
+    if num_rows_effected == 0:
+        return ReturnValue.NOT_EXISTS
+
+    if return_val == ReturnValue.OK:
+        _invalidate(("ownedby", apartment_id))
+
+    return return_val
+
+
+async def get_apartment_owner(apartment_id: int) -> Owner:
+    if apartment_id <= 0:
+        return Owner.bad_owner()
+
+    num_rows_effected, entries, return_val = await run_query(Solution.GET_APARTMENT_OWNER, (apartment_id,))
+
+    if return_val != ReturnValue.OK or num_rows_effected == 0:
+        return Owner.bad_owner()
+
+    return Owner.from_row(entries.rows[0])
+
+
+async def get_owner_apartments(owner_id: int) -> List[Apartment]:
+    if owner_id <= 0:
+        return []
+
+    num_rows_effected, entries, return_val = await run_query(Solution.GET_OWNER_APARTMENTS, (owner_id,))
+
+    if return_val != ReturnValue.OK:
+        return []
+
+    return [Apartment.from_row(row) for row in entries.rows]
+
+
+# ---------------------------------- BASIC API: ----------------------------------
+
+async def get_apartment_rating(apartment_id: int) -> float:
+    if apartment_id <= 0:
+        return 0
+
+    query = sql.SQL(Solution.APARTMENT_RATING_QUERY).format(apartment_id=sql.Literal(apartment_id))
+
+    num_rows_effected, entries, return_val = await run_query(query)
+
+    if return_val != ReturnValue.OK or num_rows_effected == 0:  # apartment id does not exist
+        return 0
+
+    entry = entries[0]  # expect 1 row for the apartment (in the case of no reviews, 0 rating is returned)
+
+    return entry['average_rating']
+
+
+async def get_owner_rating(owner_id: int) -> float:
+    if owner_id <= 0:
+        return 0
+
+    query = sql.SQL(Solution.OWNER_RATING_QUERY).format(owner_id=sql.Literal(owner_id))
+
+    num_rows_effected, entries, return_val = await run_query(query)
+
+    if return_val != ReturnValue.OK or num_rows_effected == 0:
+        return 0
+
+    entry = entries[0]  # expect 1 row for the owner
+
+    return entry['owner_rating'] if entry['owner_rating'] is not None else 0
+
+
+async def get_top_customer() -> Customer:
+    num_rows_effected, entries, return_val = await run_query(sql.SQL(Solution.TOP_CUSTOMER_QUERY))
+
+    if return_val != ReturnValue.OK or num_rows_effected == 0:  # there are no customers
+        return Customer.bad_customer()
+
+    # expect 1 row for the top customer, even if there are no reservations
+    return Customer.from_row(entries.rows[0])
+
+
+async def reservations_per_owner() -> List[Tuple[str, int]]:
+    num_rows_effected, entries, return_val = await run_query(sql.SQL(Solution.RESERVATIONS_PER_OWNER_QUERY))
+
+    if return_val != ReturnValue.OK:
+        return []
+
+    return [(entry['name'], entry['reservations_per_owner']) for entry in entries]
+
+
+# ---------------------------------- ADVANCED API: ----------------------------------
+
+async def get_all_location_owners() -> List[Owner]:
+    num_rows_effected, entries, return_val = await run_query(sql.SQL(Solution.ALL_LOCATION_OWNERS_QUERY))
+
+    if return_val != ReturnValue.OK:
+        return []
+
+    return [Owner.from_row(row) for row in entries.rows]
+
+
+async def best_value_for_money() -> Apartment:
+    num_rows_effected, entries, return_val = await run_query(sql.SQL(Solution.BEST_VALUE_FOR_MONEY_QUERY))
+
+    if not num_rows_effected:
+        return Apartment.bad_apartment()
+
+    entry = entries[0]
+    return Apartment(id=entry['id'], address=entry['address'], city=entry['city'], country=entry['country'],
+                     size=entry['size'])
+
+
+async def profit_per_month(year: int, from_rollup=True) -> List[Tuple[int, float]]:
+    query = sql.SQL(Solution.PROFIT_PER_MONTH_ROLLUP_QUERY if from_rollup else Solution.PROFIT_PER_MONTH_QUERY) \
+        .format(year=sql.Literal(year))
+    num_rows_effected, entries, return_val = await run_query(query)
+
+    if return_val != ReturnValue.OK:
+        return []
+
+    return [(entry['month'], entry['profit']) for entry in entries]
+
+
+async def get_apartment_recommendation(customer_id: int) -> List[Tuple[Apartment, float]]:
+    query = sql.SQL(Solution.APARTMENT_RECOMMENDATION_QUERY).format(id=sql.Literal(customer_id))
+    _, entries, return_val = await run_query(query)
+
+    if return_val != ReturnValue.OK:
+        return []
+
+    return [(Apartment(id=entry['id'], address=entry['address'], city=entry['city'], country=entry['country'],
+                       size=entry['size']), float(entry['approx'])) for entry in entries]
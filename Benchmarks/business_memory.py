@@ -0,0 +1,59 @@
+# Memory and construction time of 1M Apartment objects, the slot-based Apartment against the previous layout
+# (an instance __dict__ per object), built from result rows like get_owner_apartments does.
+# The rows are made before measuring, only the objects are counted.
+# run from the repository root: python -m Benchmarks.business_memory [apartments]
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+from Business.Apartment import Apartment
+from Utility.DBConnector import ResultSet
+
+Column = namedtuple('Column', ['name'])
+
+
+# the fields of Apartment before __slots__
+class DictApartment:
+    def __init__(self, id: int=None, address: str=None, city: str=None, country: str=None, size: float=None) -> None:
+        self.__id = id
+        self.__address = address
+        self.__city = city
+        self.__country = country
+        self.__size = size
+
+
+# bytes per object kept and seconds to build them (timed on a second run, without tracemalloc slowing it down)
+def measure(build) -> (float, float):
+    tracemalloc.start()
+    kept = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_object = current / len(kept)
+    del kept
+    start = time.perf_counter()
+    build()
+    return per_object, time.perf_counter() - start
+
+
+def main():
+    apartments = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    description = [Column(col) for col in ['id', 'address', 'city', 'country', 'size']]
+    result = ResultSet(description, [(i, 'street %d' % i, 'city %d' % (i % 50), 'country %d' % (i % 7), 30 + i % 100)
+                                     for i in range(1, apartments + 1)])
+
+    # the previous Solution code: the fields by name from each row
+    dict_bytes, dict_seconds = measure(lambda: [
+        DictApartment(id=entry['id'], address=entry['address'], city=entry['city'], country=entry['country'],
+                      size=entry['size']) for entry in result])
+    slot_bytes, slot_seconds = measure(lambda: [Apartment.from_row(row) for row in result.rows])
+
+    print(f'{apartments} apartments')
+    print(f'instance __dict__: {dict_bytes:.0f} B/apartment, {dict_bytes * apartments / 2 ** 20:.0f} MiB, '
+          f'built in {dict_seconds:.2f} s')
+    print(f'__slots__:         {slot_bytes:.0f} B/apartment, {slot_bytes * apartments / 2 ** 20:.0f} MiB, '
+          f'built in {slot_seconds:.2f} s ({100 * (1 - slot_bytes / dict_bytes):.0f}% less memory)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# Latency of the Solution queries with and without Solution.SECONDARY_INDEXES, at 1M reservations.
+# Needs the database configured in Utility/database.ini, the schema is created and dropped by the script.
+# run from the repository root: python -m Benchmarks.index_benchmark [reservations]
+import statistics
+import sys
+import time
+
+import Solution
+from Utility.DBConnector import DBConnector
+
+OWNERS = 5000
+APARTMENTS = 50000
+CUSTOMERS = 100000
+
+
+def populate(reservations: int):
+    conn = DBConnector()
+    try:
+        conn.execute("INSERT INTO Owner SELECT i, 'owner ' || i FROM generate_series(1, %s) AS i;"
+                     "INSERT INTO Customer SELECT i, 'customer ' || i FROM generate_series(1, %s) AS i;"
+                     "INSERT INTO Apartment SELECT i, 'street ' || i, 'city ' || i %% 50, 'country ' || i %% 7, "
+                     "  30 + i %% 100 FROM generate_series(1, %s) AS i;"
+                     "INSERT INTO OwnedBy SELECT i, 1 + i %% %s FROM generate_series(1, %s) AS i;",
+                     params=(OWNERS, CUSTOMERS, APARTMENTS, OWNERS, APARTMENTS))
+        # a week per reservation of each apartment, so stays never overlap
+        conn.execute("INSERT INTO Reservations(customer_id, apartment_id, start_date, end_date, total_price) "
+                     "SELECT 1 + (i::BIGINT * 7919) %% %s, 1 + i %% %s, "
+                     "  DATE '2000-01-03' + (i / %s) * 7, DATE '2000-01-03' + (i / %s) * 7 + 1 + i %% 6, "
+                     "  100 + i %% 900 "
+                     "FROM generate_series(0, %s - 1) AS i",
+                     params=(CUSTOMERS, APARTMENTS, APARTMENTS, APARTMENTS, reservations))
+        conn.execute("INSERT INTO Reviews "
+                     "SELECT DISTINCT ON (customer_id, apartment_id) customer_id, apartment_id, end_date + 1, "
+                     "  1 + (customer_id + apartment_id) % 10, 'review' "
+                     "FROM Reservations WHERE (customer_id + apartment_id) % 5 = 0")
+    finally:
+        conn.close()
+    vacuum()
+
+
+# sets hint bits and the visibility map, so neither pass pays for the bulk load
+def vacuum():
+    conn = DBConnector()
+    try:
+        conn.connection.autocommit = True  # VACUUM cannot run in a transaction
+        conn.execute("VACUUM ANALYZE")
+    finally:
+        conn.connection.autocommit = False
+        conn.close()
+
+
+def set_indexes(create: bool):
+    conn = DBConnector()
+    try:
+        for name, on in Solution.SECONDARY_INDEXES:
+            conn.execute("CREATE INDEX %s ON %s" % (name, on) if create else "DROP INDEX %s" % name)
+    finally:
+        conn.close()
+    vacuum()
+
+
+# median seconds of a call to each of the calls (name, runs, function of the run number)
+def measure(calls) -> dict:
+    medians = {}
+    for name, runs, call in calls:
+        call(0)  # warm up the pool, the prepared statements and the cache
+        latencies = []
+        for run in range(1, runs + 1):
+            start = time.perf_counter()
+            call(run)
+            latencies.append(time.perf_counter() - start)
+        medians[name] = statistics.median(latencies)
+    return medians
+
+
+def calls(with_indexes: bool) -> list:
+    # deletes remove a different apartment / owner on each pass
+    offset = 1000 if with_indexes else 2000
+    return [
+        ("get_owner_apartments", 200, lambda run: Solution.get_owner_apartments(1 + run % OWNERS)),
+        ("get_owner_rating", 200, lambda run: Solution.get_owner_rating(1 + run % OWNERS)),
+        ("get_apartment_rating", 200, lambda run: Solution.get_apartment_rating(1 + run % APARTMENTS)),
+        ("delete_apartment", 20, lambda run: Solution.delete_apartment(offset + run)),
+        ("delete_owner", 20, lambda run: Solution.delete_owner(offset + run)),
+        ("get_top_customer", 5, lambda run: Solution.get_top_customer()),
+        ("reservations_per_owner", 5, lambda run: Solution.reservations_per_owner()),
+        ("profit_per_month", 5, lambda run: Solution.profit_per_month(2005)),
+        ("best_value_for_money", 3, lambda run: Solution.best_value_for_money()),
+    ]
+
+
+def main():
+    reservations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    Solution.drop_tables()
+    Solution.create_tables()
+    try:
+        print(f'populating {reservations} reservations...')
+        populate(reservations)
+        indexed = measure(calls(True))
+        set_indexes(False)
+        plain = measure(calls(False))
+        set_indexes(True)
+
+        print(f'{"query":<30} {"no indexes ms":>14} {"indexes ms":>12} {"speedup":>8}')
+        for name in indexed:
+            print(f'{name:<30} {plain[name] * 1e3:>14.3f} {indexed[name] * 1e3:>12.3f} '
+                  f'{plain[name] / indexed[name]:>7.1f}x')
+    finally:
+        Solution.drop_tables()
+
+
+if __name__ == '__main__':
+    main()
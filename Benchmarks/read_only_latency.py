@@ -0,0 +1,45 @@
+# Latency of the read APIs with and without the read-only (autocommit) path of run_query.
+# Needs the database configured in Utility/database.ini, the schema is created and dropped by the script.
+# run from the repository root: python -m Benchmarks.read_only_latency
+import statistics
+import time
+from psycopg2 import sql
+
+import Solution
+from Business.Owner import Owner
+
+CALLS = 2000
+
+
+def measure(query, params, read_only) -> list:
+    latencies = []
+    for _ in range(CALLS):
+        start = time.perf_counter()
+        Solution.run_query(query, params, read_only=read_only)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name, query, params):
+    measure(query, params, True)  # warm up the pool and the prepared statements
+    transactional = measure(query, params, False)
+    read_only = measure(query, params, True)
+    print(f'{name}: transactional {statistics.median(transactional) * 1e6:.0f} us, '
+          f'read-only {statistics.median(read_only) * 1e6:.0f} us (median of {CALLS} calls)')
+
+
+def main():
+    Solution.drop_tables()
+    Solution.create_tables()
+    try:
+        Solution.add_owner(Owner(1, 'owner'))
+        report('get_owner', Solution.GET_OWNER, (1,))
+        report('get_apartment_rating', sql.SQL(Solution.APARTMENT_RATING_QUERY).format(apartment_id=sql.Literal(1)),
+               None)
+        report('get_top_customer', sql.SQL(Solution.TOP_CUSTOMER_QUERY), None)
+    finally:
+        Solution.drop_tables()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+# Allocations made while iterating a ResultSet, per-row dicts (the previous ResultSetDict rows)
+# against the shared-index ResultSetRow views.
+# Result shapes are those of get_owner_apartments and get_apartment_recommendation.
+# run from the repository root: python -m Benchmarks.resultset_allocations
+import tracemalloc
+from collections import namedtuple
+
+from Utility.DBConnector import ResultSet, ResultSetDict
+
+Column = namedtuple('Column', ['name'])
+
+SHAPES = {
+    'get_owner_apartments': ['id', 'address', 'city', 'country', 'size'],
+    'get_apartment_recommendation': ['id', 'address', 'city', 'country', 'size', 'approx'],
+}
+ROWS = 100000
+
+
+def dict_rows(result: ResultSet):
+    for row in result.rows:
+        row_to_return = ResultSetDict()
+        for val, col in zip(row, result.cols_header):
+            row_to_return[col] = val
+        yield row_to_return
+
+
+def measure(rows) -> (int, int):
+    tracemalloc.start()
+    kept = [row for row in rows]  # keep the rows alive like the list comprehensions in Solution do
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(kept), peak
+
+
+def main():
+    for name, header in SHAPES.items():
+        description = [Column(col) for col in header]
+        results = [tuple(range(len(header))) for _ in range(ROWS)]
+        result = ResultSet(description, results)
+
+        _, dict_peak = measure(dict_rows(result))
+        _, view_peak = measure(iter(result))
+        print(f'{name}: {ROWS} rows, dict rows {dict_peak / ROWS:.0f} B/row, '
+              f'row views {view_peak / ROWS:.0f} B/row ({100 * (1 - view_peak / dict_peak):.0f}% less)')
+
+
+if __name__ == '__main__':
+    main()
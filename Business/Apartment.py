@@ -1,4 +1,7 @@
 class Apartment:
+    # a slot per field instead of an instance __dict__, millions of apartments are kept in memory
+    __slots__ = ('__id', '__address', '__city', '__country', '__size')
+
     def __init__(self, id: int=None, address: str=None, city: str=None, country: str=None, size: float=None) -> None:
         self.__id = id
         self.__address = address
@@ -40,9 +43,18 @@ class Apartment:
     def bad_apartment():
         return Apartment()
 
+    # from an (id, address, city, country, size) row, e.g. of ResultSet.rows of a query selecting them in that order
+    @staticmethod
+    def from_row(row: tuple) -> 'Apartment':
+        return Apartment(*row)
+
     def __eq__(self, __value: object) -> bool:
         if type(self) != type(__value): return False
         else: return self.__id == __value.__id and self.__address == __value.__address and self.__city == __value.__city and self.__country == __value.__country
 
+    # consistent with __eq__ (size is not compared), don't change an apartment while it is a key
+    def __hash__(self) -> int:
+        return hash((self.__id, self.__address, self.__city, self.__country))
+
     def __str__(self) -> str:
         return f'apartment_id={self.__id}, address={self.__address}, city={self.__city}, country={self.__country}'
\ No newline at end of file
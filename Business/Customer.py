@@ -1,4 +1,6 @@
 class Customer:
+    __slots__ = ('__id', '__name')
+
     def __init__(self, customer_id: int=None, customer_name: str=None) -> None:
         self.__id = customer_id
         self.__name = customer_name
@@ -19,9 +21,18 @@ class Customer:
     def bad_customer():
         return Customer()
 
+    # from an (id, name) row
+    @staticmethod
+    def from_row(row: tuple) -> 'Customer':
+        return Customer(*row)
+
     def __eq__(self, __value: object) -> bool:
         if type(self) != type(__value): return False
         else: return self.__id == __value.__id and self.__name == __value.__name
 
+    # don't change a customer while it is a key
+    def __hash__(self) -> int:
+        return hash((self.__id, self.__name))
+
     def __str__(self) -> str:
         return f'customer_id={self.__id}, customer_name={self.__name}'
\ No newline at end of file
@@ -1,4 +1,6 @@
 class Owner:
+    __slots__ = ('__id', '__name')
+
     def __init__(self, owner_id: int=None, owner_name: str=None) -> None:
         self.__id = owner_id
         self.__name = owner_name
@@ -19,9 +21,18 @@ class Owner:
     def bad_owner():
         return Owner()
 
+    # from an (id, name) row
+    @staticmethod
+    def from_row(row: tuple) -> 'Owner':
+        return Owner(*row)
+
     def __eq__(self, __value: object) -> bool:
         if type(self) != type(__value): return False
         else: return self.__id == __value.__id and self.__name == __value.__name
 
+    # don't change an owner while it is a key
+    def __hash__(self) -> int:
+        return hash((self.__id, self.__name))
+
     def __str__(self) -> str:
         return f'owner_id={self.__id}, owner_name={self.__name}'
\ No newline at end of file
@@ -1,26 +1,95 @@
 from typing import List, Tuple
 from psycopg2 import sql
 from datetime import date, datetime
+import contextvars
+import csv
+import hashlib
+import heapq
+import itertools
+import tempfile
+from contextlib import contextmanager
 
 import Utility.DBConnector as Connector
 from Utility.ReturnValue import ReturnValue
 from Utility.Exceptions import DatabaseException
 from Utility.DBConnector import ResultSet
+from Utility.PreparedStatement import PreparedStatement
+from Utility.Instrumentation import instrumented
+from Utility.LRUCache import LRUCache
 
 from Business.Owner import Owner
 from Business.Customer import Customer
 from Business.Apartment import Apartment
 
 
-def run_query(query):
-    conn = None
+# connection of the transaction() the current thread / task is in, None outside of one
+_transaction = contextvars.ContextVar("transaction", default=None)
+
+# names of the savepoints of nested transaction() blocks
+_savepoint_ids = itertools.count()
+
+
+# makes the Solution calls inside the with block share one connection and one commit
+# each call still returns its own ReturnValue (a failing statement is rolled back to a savepoint), the whole
+# block is rolled back if it raises
+# rollback=True rolls the block back even when it succeeds (e.g. a test fixture undoing the writes of a test)
+# a nested transaction() block runs under a savepoint of the outer one: it is rolled back on its own when it
+# raises or has rollback=True, otherwise its writes are committed (or not) with the outer block
+# with Solution.transaction():
+#     Solution.add_customer(customer)
+#     Solution.customer_made_reservation(...)
+@contextmanager
+def transaction(rollback=False):
+    outer = _transaction.get()
+    if outer is not None:
+        savepoint = "transaction_%d" % next(_savepoint_ids)
+        outer.savepoint(savepoint)
+        try:
+            yield
+        except BaseException:
+            outer.rollback_to_savepoint(savepoint)
+            raise
+        if rollback:
+            outer.rollback_to_savepoint(savepoint)
+        else:
+            outer.release_savepoint(savepoint)
+        return
+
+    conn = Connector.DBConnector()
+    token = _transaction.set(conn)
+    invalidations = set()
+    invalidations_token = _transaction_invalidations.set(invalidations)
+    try:
+        conn.begin()
+        yield
+        if rollback:
+            conn.rollback()
+        else:
+            conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _transaction.reset(token)
+        _transaction_invalidations.reset(invalidations_token)
+        conn.close()
+        # calls outside of the transaction may have cached the rows it changed before it ended
+        if invalidations:
+            _invalidate(*invalidations)
+
+
+# read_only=True for queries that do not write: they run in autocommit mode, without a COMMIT round trip
+def run_query(query, params: tuple = None, read_only=False):
+    transaction_conn = _transaction.get()
+    conn = transaction_conn
     return_val = ReturnValue.OK
     num_rows_effected = None
     entries = None
 
     try:
-        conn = Connector.DBConnector()
-        num_rows_effected, entries = conn.execute(query)
+        if conn is None:
+            conn = Connector.DBConnector()
+        num_rows_effected, entries = conn.execute(query, params=params, read_only=read_only)
 
     except DatabaseException.NOT_NULL_VIOLATION as e:
         return_val = ReturnValue.BAD_PARAMS
@@ -28,6 +97,9 @@ def run_query(query):
     except DatabaseException.CHECK_VIOLATION as e:
         return_val = ReturnValue.BAD_PARAMS
 
+    except DatabaseException.EXCLUSION_VIOLATION as e:
+        return_val = ReturnValue.BAD_PARAMS
+
     except DatabaseException.UNIQUE_VIOLATION as e:
         return_val = ReturnValue.ALREADY_EXISTS
 
@@ -38,14 +110,196 @@ def run_query(query):
         return_val = ReturnValue.ERROR
 
     finally:
-        conn.close()
+        if conn is not None and conn is not transaction_conn:
+            conn.close()
         return num_rows_effected, entries, return_val
 
 
+# yields the rows of a SELECT through a server-side cursor instead of materializing the whole result, for scans
+# too large to hold in memory
+# database errors are raised (a DatabaseException, or the psycopg2 error of a failed fetch), possibly after some
+# rows were yielded, so a caller never mistakes a partial result for a complete one
+def stream_query(query, batch_size=Connector.DEFAULT_STREAM_BATCH_SIZE):
+    transaction_conn = _transaction.get()
+    conn = transaction_conn
+    try:
+        if conn is None:
+            conn = Connector.DBConnector()
+        yield from conn.stream(query, batch_size)
+
+    finally:
+        if conn is not None and conn is not transaction_conn:
+            conn.close()
+
+
+# ---------------------------------- CACHE: ----------------------------------
+# optional read-through LRUCache in front of get_owner, get_customer, get_apartment and get_apartment_owner, off
+# until configure_cache is called
+# it holds the rows (None for a missing one), each call still builds its own Business object
+# the writes of Solution and AsyncSolution invalidate the rows they change, changes made with other SQL are only
+# seen once the entries expire (ttl) or the cache is cleared (create_tables, clear_tables, drop_tables)
+# calls inside a transaction() neither read nor fill it, and its invalidations are repeated when it ends
+
+_cache = None
+
+# tags invalidated inside the transaction() the current thread / task is in
+_transaction_invalidations = contextvars.ContextVar("transaction_invalidations", default=None)
+
+
+# max_size - rows kept, None turns the cache off
+# ttl - seconds a row is kept, None keeps it until it is invalidated or evicted
+def configure_cache(max_size: int = None, ttl: float = None):
+    global _cache
+    _cache = LRUCache(max_size, ttl) if max_size is not None else None
+
+
+# hits, misses, evictions, ... of the cache, empty while it is off
+def cache_stats() -> dict:
+    cache = _cache
+    return cache.stats() if cache is not None else {}
+
+
+def _clear_cache():
+    cache = _cache
+    if cache is not None:
+        cache.clear()
+
+
+# drops the cached rows tagged with any of tags, a tag is (table, id):
+#   ("owner", id)     - the owner, and the apartments' owners that are it (its OwnedBy rows cascade)
+#   ("customer", id)  - the customer
+#   ("apartment", id) - the apartment and its owner (its OwnedBy row cascades)
+#   ("ownedby", id)   - the owner of the apartment
+def _invalidate(*tags):
+    cache = _cache
+    if cache is not None:
+        cache.invalidate(*tags)
+    pending = _transaction_invalidations.get()
+    if pending is not None:
+        pending.update(tags)
+
+
+# the first row of a read-only query, None if there is none (or the query failed)
+# read through the cache under key, the row is tagged with key and tags(row)
+def _read_row(key: tuple, query, params: tuple, tags=lambda row: ()):
+    cache = _cache if _transaction.get() is None else None
+    token = None
+    if cache is not None:
+        found, row = cache.get(key)
+        if found:
+            return row
+        token = cache.token()
+
+    num_rows_effected, entries, return_val = run_query(query, params, read_only=True)
+
+    if return_val != ReturnValue.OK:
+        return None
+
+    row = entries.rows[0] if num_rows_effected else None
+    if cache is not None:
+        cache.put(key, row, (key,) + tuple(tags(row)), token)
+    return row
+
+
+# ---------------------------------- PREPARED STATEMENTS: ----------------------------------
+# the hot CRUD queries, parsed and planned once per pooled connection
+
+ADD_OWNER = PreparedStatement("add_owner", "INSERT INTO Owner(id, name) VALUES($1, $2)", ["INTEGER", "TEXT"])
+
+GET_OWNER = PreparedStatement("get_owner", "SELECT id, name FROM Owner WHERE id = $1", ["INTEGER"])
+
+DELETE_OWNER = PreparedStatement("delete_owner", "DELETE FROM Owner WHERE id = $1", ["INTEGER"])
+
+ADD_APARTMENT = PreparedStatement("add_apartment",
+                                  "INSERT INTO Apartment(id, address, city, country, size) VALUES($1, $2, $3, $4, $5)",
+                                  ["INTEGER", "TEXT", "TEXT", "TEXT", "INTEGER"])
+
+GET_APARTMENT = PreparedStatement("get_apartment",
+                                  "SELECT id, address, city, country, size FROM Apartment WHERE id = $1", ["INTEGER"])
+
+DELETE_APARTMENT = PreparedStatement("delete_apartment", "DELETE FROM Apartment WHERE id = $1", ["INTEGER"])
+
+ADD_CUSTOMER = PreparedStatement("add_customer", "INSERT INTO Customer(id, name) VALUES($1, $2)",
+                                 ["INTEGER", "TEXT"])
+
+GET_CUSTOMER = PreparedStatement("get_customer", "SELECT id, name FROM Customer WHERE id = $1", ["INTEGER"])
+
+DELETE_CUSTOMER = PreparedStatement("delete_customer", "DELETE FROM Customer WHERE id = $1", ["INTEGER"])
+
+# overlapping stays are refused by the exclusion constraint of Reservations
+CUSTOMER_MADE_RESERVATION = PreparedStatement("customer_made_reservation",
+                                              "INSERT INTO Reservations"
+                                              "(customer_id, apartment_id, start_date, end_date, total_price) "
+                                              "VALUES($1, $2, $3, $4, $5)",
+                                              ["INTEGER", "INTEGER", "DATE", "DATE", "FLOAT"])
+
+CUSTOMER_CANCELLED_RESERVATION = PreparedStatement("customer_cancelled_reservation",
+                                                   "DELETE FROM Reservations "
+                                                   "WHERE customer_id = $1 AND apartment_id = $2 AND start_date = $3",
+                                                   ["INTEGER", "INTEGER", "DATE"])
+
+CUSTOMER_REVIEWED_APARTMENT = PreparedStatement("customer_reviewed_apartment",
+                                                "INSERT INTO Reviews "
+                                                "SELECT $1, $2, $3, $4, $5 "
+                                                "WHERE EXISTS "
+                                                "(SELECT * FROM Reservations "
+                                                " WHERE customer_id = $1 AND apartment_id = $2 AND end_date <= $3)",
+                                                ["INTEGER", "INTEGER", "DATE", "INTEGER", "TEXT"])
+
+CUSTOMER_UPDATED_REVIEW = PreparedStatement("customer_updated_review",
+                                            "UPDATE Reviews "
+                                            "SET date = $3, rating = $4, review_text = $5 "
+                                            "WHERE customer_id = $1 AND apartment_id = $2 AND date <= $3",
+                                            ["INTEGER", "INTEGER", "DATE", "INTEGER", "TEXT"])
+
+OWNER_OWNS_APARTMENT = PreparedStatement("owner_owns_apartment", "INSERT INTO OwnedBy VALUES($1, $2)",
+                                         ["INTEGER", "INTEGER"])
+
+OWNER_DROPS_APARTMENT = PreparedStatement("owner_drops_apartment",
+                                          "DELETE FROM OwnedBy WHERE apartment_id = $1 AND owner_id = $2",
+                                          ["INTEGER", "INTEGER"])
+
+GET_APARTMENT_OWNER = PreparedStatement("get_apartment_owner",
+                                        "SELECT id, name FROM Owner "
+                                        "WHERE id IN (SELECT owner_id FROM OwnedBy WHERE apartment_id = $1)",
+                                        ["INTEGER"])
+
+GET_OWNER_APARTMENTS = PreparedStatement("get_owner_apartments",
+                                         "SELECT id, address, city, country, size FROM Apartment "
+                                         "WHERE id IN (SELECT apartment_id FROM OwnedBy WHERE owner_id = $1)",
+                                         ["INTEGER"])
+
+
 # ---------------------------------- CRUD API: ----------------------------------
 
 
-def create_tables():
+# ratings are 1 to 10, so rating / base * 2520 (the least common multiple of 1..10) is always an integer
+RATING_RATIO_SCALE = 2520
+
+# secondary indexes created with the schema, (name, table and columns)
+# Reservations(customer_id) is left out, it is the prefix of the primary key
+SECONDARY_INDEXES = [
+    # get_owner_apartments, get_owner_rating, reservations_per_owner, ON DELETE CASCADE from Owner
+    ("ownedby_owner_id", "OwnedBy(owner_id)"),
+    # rating_ratio self join of Reviews (index-only with the rating), ON DELETE CASCADE from Apartment
+    ("reviews_apartment_id", "Reviews(apartment_id) INCLUDE (rating)"),
+    # reservations per apartment, ON DELETE CASCADE from Apartment
+    ("reservations_apartment_id", "Reservations(apartment_id)"),
+    # date range scans (profit_per_month)
+    ("reservations_end_date", "Reservations(end_date)"),
+]
+
+
+# partitioned Reservations (create_tables(partitioned_reservations=True)) get yearly partitions from
+# RESERVATION_PARTITION_YEARS_BACK years ago to RESERVATION_PARTITION_YEARS_AHEAD years from now, reservations
+# ending outside of them go to the default partition
+RESERVATION_PARTITION_YEARS_BACK = 10
+RESERVATION_PARTITION_YEARS_AHEAD = 2
+
+
+# schema version 1, the schema create_tables built before SchemaVersion, a database without SchemaVersion that
+# has these tables is taken to be at this version
+def _baseline_schema(partitioned_reservations: bool) -> str:
     owner_table = "CREATE TABLE Owner(" \
                   "id INTEGER PRIMARY KEY CHECK (id > 0), " \
                   "name TEXT NOT NULL);"
@@ -101,66 +355,789 @@ def create_tables():
                         WHERE from_customer.customer_id != to_customer.customer_id
                         GROUP BY  from_customer.customer_id, to_customer.customer_id'''
 
-    query = owner_table + customer_table + apartment_table + owned_by_table + reservations_table + reviews_table \
-        + apartment_rating_view +rating_ratio_view
+    return owner_table + customer_table + apartment_table + owned_by_table + reservations_table + reviews_table \
+        + apartment_rating_view + rating_ratio_view
+
+
+# schema version 2, the database refuses overlapping stays of an apartment (the stay column and a GiST exclusion
+# constraint), with partitioned_reservations Reservations is range partitioned by end_date instead
+def _reservation_overlap_schema(partitioned_reservations: bool) -> str:
+    if not partitioned_reservations:
+        return "ALTER TABLE Reservations " \
+               "ADD stay DATERANGE GENERATED ALWAYS AS (daterange(start_date, end_date)) STORED, " \
+               "ADD EXCLUDE USING gist (int4range(apartment_id, apartment_id, '[]') WITH &&, stay WITH &&);"
+
+    reservations_columns = "customer_id INTEGER, " \
+                           "apartment_id INTEGER, " \
+                           "start_date DATE NOT NULL, " \
+                           "end_date DATE NOT NULL, " \
+                           "total_price FLOAT(2) NOT NULL CHECK (total_price > 0), " \
+                           "stay DATERANGE GENERATED ALWAYS AS (daterange(start_date, end_date)) STORED, " \
+                           "FOREIGN KEY (customer_id) REFERENCES Customer(id) ON DELETE CASCADE, " \
+                           "FOREIGN KEY (apartment_id) REFERENCES Apartment(id) ON DELETE CASCADE," \
+                           "CHECK (start_date < end_date), "
+
+    # the primary key has to include the partition key, a second reservation of the same customer, apartment
+    # and start date still can't be added: it overlaps the first
+    # exclusion constraints are not supported on partitioned tables, overlaps are refused by the
+    # reservations_no_overlap trigger instead, which serializes the bookings of an apartment with an advisory
+    # lock and raises the exclusion_violation the constraint would
+    # the reservations are copied over from the version 1 table into the default partition, the yearly partitions
+    # are created by create_tables, after the migrations
+    return "ALTER TABLE Reservations RENAME TO Reservations_unpartitioned;" \
+           "ALTER INDEX reservations_pkey RENAME TO reservations_unpartitioned_pkey;" \
+           "CREATE TABLE Reservations(" + reservations_columns + \
+           "PRIMARY KEY (customer_id, apartment_id, start_date, end_date)) " \
+           "PARTITION BY RANGE (end_date);" \
+           "CREATE TABLE Reservations_default PARTITION OF Reservations DEFAULT;" \
+           "CREATE INDEX reservations_stay ON Reservations " \
+           "USING gist (int4range(apartment_id, apartment_id, '[]'), stay);" \
+           + '''CREATE FUNCTION reservations_no_overlap() RETURNS TRIGGER AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext(current_schema() || '.Reservations'), NEW.apartment_id);
+            IF EXISTS (SELECT 1 FROM Reservations
+                       WHERE int4range(apartment_id, apartment_id, '[]')
+                             && int4range(NEW.apartment_id, NEW.apartment_id, '[]')
+                       AND stay && daterange(NEW.start_date, NEW.end_date)
+                       AND (TG_OP = 'INSERT'
+                            OR (customer_id, apartment_id, start_date, end_date)
+                               <> (OLD.customer_id, OLD.apartment_id, OLD.start_date, OLD.end_date))) THEN
+                RAISE EXCEPTION 'reservation overlaps an existing stay of the apartment'
+                    USING ERRCODE = 'exclusion_violation';
+            END IF;
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql;
+        CREATE TRIGGER reservations_no_overlap BEFORE INSERT OR UPDATE OF apartment_id, start_date, end_date
+            ON Reservations FOR EACH ROW EXECUTE FUNCTION reservations_no_overlap();
+        CREATE FUNCTION reservations_create_partitions(first_year INTEGER, last_year INTEGER) RETURNS INTEGER AS $$
+        DECLARE
+            created INTEGER := 0;
+            partition TEXT;
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext(current_schema() || '.Reservations partitions'));
+            CREATE TEMP TABLE IF NOT EXISTS reservations_moved(customer_id INTEGER, apartment_id INTEGER,
+                start_date DATE, end_date DATE, total_price FLOAT(2)) ON COMMIT DROP;
+            FOR year IN first_year..last_year LOOP
+                partition := 'reservations_' || year;
+                CONTINUE WHEN to_regclass(partition) IS NOT NULL;
+                -- a partition can't be created while the default partition holds rows of its range, they are
+                -- moved into the new partition (DML on partitions skips the statement triggers of Reservations,
+                -- so the rollups do not see the move)
+                DELETE FROM reservations_moved;
+                WITH moved AS (DELETE FROM Reservations_default
+                               WHERE end_date >= make_date(year, 1, 1) AND end_date < make_date(year + 1, 1, 1)
+                               RETURNING customer_id, apartment_id, start_date, end_date, total_price)
+                INSERT INTO reservations_moved SELECT * FROM moved;
+                EXECUTE format('CREATE TABLE %I PARTITION OF Reservations FOR VALUES FROM (%L) TO (%L)',
+                               partition, make_date(year, 1, 1), make_date(year + 1, 1, 1));
+                EXECUTE format('INSERT INTO %I(customer_id, apartment_id, start_date, end_date, total_price) '
+                               'SELECT * FROM reservations_moved', partition);
+                created := created + 1;
+            END LOOP;
+            RETURN created;
+        END $$ LANGUAGE plpgsql;''' \
+           + "INSERT INTO Reservations(customer_id, apartment_id, start_date, end_date, total_price) " \
+             "SELECT customer_id, apartment_id, start_date, end_date, total_price FROM Reservations_unpartitioned;" \
+             "DROP TABLE Reservations_unpartitioned;"
+
+
+# schema version 3, SECONDARY_INDEXES
+def _secondary_indexes_schema(partitioned_reservations: bool) -> str:
+    return "".join("CREATE INDEX %s ON %s;" % index for index in SECONDARY_INDEXES)
+
+
+# schema version 4, ApartmentRating from ApartmentRatingStats, filled from the reviews so far
+def _apartment_rating_stats_schema(partitioned_reservations: bool) -> str:
+    # sum and count of the ratings of each reviewed apartment, kept up to date by the Reviews triggers below
+    apartment_rating_stats_table = "CREATE TABLE ApartmentRatingStats(" \
+                                   "apartment_id INTEGER PRIMARY KEY, " \
+                                   "rating_sum BIGINT NOT NULL, " \
+                                   "rating_count INTEGER NOT NULL, " \
+                                   "FOREIGN KEY (apartment_id) REFERENCES Apartment(id) ON DELETE CASCADE);"
+
+    apartment_rating_stats_backfill = "INSERT INTO ApartmentRatingStats(apartment_id, rating_sum, rating_count) " \
+                                      "SELECT apartment_id, SUM(rating), COUNT(*) FROM Reviews GROUP BY apartment_id;"
+
+    # statement level, so a multi-row write (e.g. load_reviews_csv) updates each apartment once
+    # removed ratings only UPDATE: after ON DELETE CASCADE from Apartment the stats row may already be gone
+    apartment_rating_stats_triggers = '''CREATE FUNCTION apartment_rating_stats_apply() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE ApartmentRatingStats AS s
+                SET rating_sum = s.rating_sum - o.rating_sum, rating_count = s.rating_count - o.rating_count
+                FROM (SELECT apartment_id, SUM(rating) AS rating_sum, COUNT(*) AS rating_count
+                      FROM old_reviews GROUP BY apartment_id) AS o
+                WHERE s.apartment_id = o.apartment_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO ApartmentRatingStats AS s(apartment_id, rating_sum, rating_count)
+                SELECT apartment_id, SUM(rating), COUNT(*) FROM new_reviews GROUP BY apartment_id
+                ON CONFLICT (apartment_id) DO UPDATE
+                SET rating_sum = s.rating_sum + EXCLUDED.rating_sum,
+                    rating_count = s.rating_count + EXCLUDED.rating_count;
+            END IF;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+        CREATE TRIGGER reviews_insert_rating_stats AFTER INSERT ON Reviews
+            REFERENCING NEW TABLE AS new_reviews
+            FOR EACH STATEMENT EXECUTE FUNCTION apartment_rating_stats_apply();
+        CREATE TRIGGER reviews_update_rating_stats AFTER UPDATE ON Reviews
+            REFERENCING OLD TABLE AS old_reviews NEW TABLE AS new_reviews
+            FOR EACH STATEMENT EXECUTE FUNCTION apartment_rating_stats_apply();
+        CREATE TRIGGER reviews_delete_rating_stats AFTER DELETE ON Reviews
+            REFERENCING OLD TABLE AS old_reviews
+            FOR EACH STATEMENT EXECUTE FUNCTION apartment_rating_stats_apply();'''
+
+    # recomputes ApartmentRatingStats from Reviews, returns the number of apartments whose stats were wrong
+    rebuild_apartment_rating_stats_function = '''
+        CREATE FUNCTION rebuild_apartment_rating_stats() RETURNS INTEGER AS $$
+        DECLARE
+            mismatches INTEGER;
+        BEGIN
+            LOCK TABLE Reviews IN SHARE MODE;
+            LOCK TABLE ApartmentRatingStats IN EXCLUSIVE MODE;
+            SELECT COUNT(DISTINCT apartment_id) INTO mismatches FROM (
+                (SELECT apartment_id, rating_sum, rating_count FROM ApartmentRatingStats WHERE rating_count <> 0
+                 EXCEPT SELECT apartment_id, SUM(rating), COUNT(*) FROM Reviews GROUP BY apartment_id)
+                UNION ALL
+                (SELECT apartment_id, SUM(rating), COUNT(*) FROM Reviews GROUP BY apartment_id
+                 EXCEPT SELECT apartment_id, rating_sum, rating_count FROM ApartmentRatingStats)) AS diff;
+            DELETE FROM ApartmentRatingStats;
+            INSERT INTO ApartmentRatingStats(apartment_id, rating_sum, rating_count)
+            SELECT apartment_id, SUM(rating), COUNT(*) FROM Reviews GROUP BY apartment_id;
+            RETURN mismatches;
+        END $$ LANGUAGE plpgsql;'''
+
+    # numeric division, the same value AVG(rating) gives
+    apartment_rating_view = "DROP VIEW ApartmentRating;" \
+                            "CREATE VIEW ApartmentRating AS " \
+                            "SELECT Apartment.id AS apartment_id, " \
+                            "COALESCE(s.rating_sum::NUMERIC / NULLIF(s.rating_count, 0), 0) AS average_rating " \
+                            "FROM Apartment LEFT OUTER JOIN ApartmentRatingStats AS s ON Apartment.id = s.apartment_id;"
+
+    return apartment_rating_stats_table + apartment_rating_stats_backfill + apartment_rating_stats_triggers \
+        + rebuild_apartment_rating_stats_function + apartment_rating_view
+
+
+# schema version 5, rating_ratio from RatingRatio, filled from the reviews so far
+def _rating_ratio_schema(partitioned_reservations: bool) -> str:
+    # for every two customers who reviewed a common apartment, the sum of to_customer's rating divided by
+    # from_customer's rating over those apartments, scaled by RATING_RATIO_SCALE so the sum stays exact,
+    # kept up to date by the Reviews triggers below
+    rating_ratio_table = "CREATE TABLE RatingRatio(" \
+                         "from_customer INTEGER, " \
+                         "to_customer INTEGER, " \
+                         "ratio_sum BIGINT NOT NULL, " \
+                         "ratio_count INTEGER NOT NULL, " \
+                         "PRIMARY KEY (to_customer, from_customer));"
+
+    rating_ratio_backfill = "INSERT INTO RatingRatio(from_customer, to_customer, ratio_sum, ratio_count) " \
+                            "SELECT f.customer_id, t.customer_id, SUM(t.rating * (%d / f.rating)), COUNT(*) " \
+                            "FROM Reviews AS f JOIN Reviews AS t " \
+                            "ON f.apartment_id = t.apartment_id AND f.customer_id <> t.customer_id " \
+                            "GROUP BY f.customer_id, t.customer_id;" % RATING_RATIO_SCALE
+
+    # with N the reviews written by the statement, R the reviews it removed and U the other reviews of the
+    # apartments involved, the pairs gained are (U + N, N) and (N, U), the pairs lost (U + R, R) and (R, U)
+    rating_ratio_triggers = '''CREATE FUNCTION rating_ratio_apply() RETURNS TRIGGER AS $$
+        DECLARE
+            added Reviews[] := '{}';
+            removed Reviews[] := '{}';
+            from_ids INTEGER[];
+            to_ids INTEGER[];
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                SELECT COALESCE(array_agg(x), '{}') INTO added FROM new_reviews AS x;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                SELECT COALESCE(array_agg(x), '{}') INTO removed FROM old_reviews AS x;
+            END IF;
+            WITH n AS (SELECT * FROM unnest(added)),
+                 r AS (SELECT * FROM unnest(removed)),
+                 u AS (SELECT * FROM Reviews AS v
+                       WHERE v.apartment_id IN (SELECT apartment_id FROM n UNION SELECT apartment_id FROM r)
+                       AND NOT EXISTS (SELECT 1 FROM n
+                                       WHERE n.customer_id = v.customer_id AND n.apartment_id = v.apartment_id)),
+                 pairs AS (
+                    SELECT f.customer_id AS from_customer, t.customer_id AS to_customer, t.rating, f.rating AS base,
+                           1 AS sign
+                    FROM (SELECT * FROM u UNION ALL SELECT * FROM n) AS f JOIN n AS t USING (apartment_id)
+                    UNION ALL
+                    SELECT f.customer_id, t.customer_id, t.rating, f.rating, 1
+                    FROM n AS f JOIN u AS t USING (apartment_id)
+                    UNION ALL
+                    SELECT f.customer_id, t.customer_id, t.rating, f.rating, -1
+                    FROM (SELECT * FROM u UNION ALL SELECT * FROM r) AS f JOIN r AS t USING (apartment_id)
+                    UNION ALL
+                    SELECT f.customer_id, t.customer_id, t.rating, f.rating, -1
+                    FROM r AS f JOIN u AS t USING (apartment_id)),
+                 changed AS (
+                    INSERT INTO RatingRatio AS p(from_customer, to_customer, ratio_sum, ratio_count)
+                    SELECT from_customer, to_customer, SUM(sign * rating * (RATING_RATIO_SCALE / base)), SUM(sign)
+                    FROM pairs WHERE from_customer <> to_customer
+                    GROUP BY from_customer, to_customer
+                    ON CONFLICT (to_customer, from_customer) DO UPDATE
+                    SET ratio_sum = p.ratio_sum + EXCLUDED.ratio_sum, ratio_count = p.ratio_count + EXCLUDED.ratio_count
+                    RETURNING p.from_customer, p.to_customer, p.ratio_count)
+            SELECT array_agg(from_customer), array_agg(to_customer) INTO from_ids, to_ids
+            FROM changed WHERE ratio_count = 0;
+            DELETE FROM RatingRatio
+            WHERE (to_customer, from_customer) IN (SELECT * FROM unnest(to_ids, from_ids)) AND ratio_count = 0;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+        CREATE TRIGGER reviews_insert_rating_ratio AFTER INSERT ON Reviews
+            REFERENCING NEW TABLE AS new_reviews
+            FOR EACH STATEMENT EXECUTE FUNCTION rating_ratio_apply();
+        CREATE TRIGGER reviews_update_rating_ratio AFTER UPDATE ON Reviews
+            REFERENCING OLD TABLE AS old_reviews NEW TABLE AS new_reviews
+            FOR EACH STATEMENT EXECUTE FUNCTION rating_ratio_apply();
+        CREATE TRIGGER reviews_delete_rating_ratio AFTER DELETE ON Reviews
+            REFERENCING OLD TABLE AS old_reviews
+            FOR EACH STATEMENT EXECUTE FUNCTION rating_ratio_apply();'''.replace("RATING_RATIO_SCALE",
+                                                                                str(RATING_RATIO_SCALE))
+
+    # numeric, so recommendations are exact (AVG of the float ratios used to drift in the last digits)
+    rating_ratio_view = "DROP VIEW rating_ratio;" \
+                        "CREATE VIEW rating_ratio AS " \
+                        "SELECT ratio_sum::NUMERIC / (%d * ratio_count) AS rating_ratio, from_customer, to_customer " \
+                        "FROM RatingRatio;" % RATING_RATIO_SCALE
+
+    return rating_ratio_table + rating_ratio_backfill + rating_ratio_triggers + rating_ratio_view
+
+
+# schema version 6, MonthlyRevenue, filled from the reservations so far
+def _monthly_revenue_schema(partitioned_reservations: bool) -> str:
+    # total_price of the reservations ending in each month, kept up to date by the Reservations triggers below
+    # (exact numeric sums, so removing a reservation takes back exactly what adding it added)
+    monthly_revenue_table = "CREATE TABLE MonthlyRevenue(" \
+                            "year INTEGER, " \
+                            "month INTEGER, " \
+                            "revenue NUMERIC NOT NULL, " \
+                            "reservation_count INTEGER NOT NULL, " \
+                            "PRIMARY KEY (year, month));"
+
+    monthly_revenue_backfill = "INSERT INTO MonthlyRevenue(year, month, revenue, reservation_count) " \
+                               "SELECT EXTRACT(YEAR FROM end_date), EXTRACT(MONTH FROM end_date), " \
+                               "SUM(total_price::NUMERIC), COUNT(*) FROM Reservations GROUP BY 1, 2;"
+
+    monthly_revenue_triggers = '''CREATE FUNCTION monthly_revenue_apply() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE MonthlyRevenue AS m
+                SET revenue = m.revenue - o.revenue, reservation_count = m.reservation_count - o.reservation_count
+                FROM (SELECT EXTRACT(YEAR FROM end_date) AS year, EXTRACT(MONTH FROM end_date) AS month,
+                             SUM(total_price::NUMERIC) AS revenue, COUNT(*) AS reservation_count
+                      FROM old_reservations GROUP BY 1, 2) AS o
+                WHERE m.year = o.year AND m.month = o.month;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO MonthlyRevenue AS m(year, month, revenue, reservation_count)
+                SELECT EXTRACT(YEAR FROM end_date), EXTRACT(MONTH FROM end_date), SUM(total_price::NUMERIC), COUNT(*)
+                FROM new_reservations GROUP BY 1, 2
+                ON CONFLICT (year, month) DO UPDATE
+                SET revenue = m.revenue + EXCLUDED.revenue,
+                    reservation_count = m.reservation_count + EXCLUDED.reservation_count;
+            END IF;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+        CREATE TRIGGER reservations_insert_monthly_revenue AFTER INSERT ON Reservations
+            REFERENCING NEW TABLE AS new_reservations
+            FOR EACH STATEMENT EXECUTE FUNCTION monthly_revenue_apply();
+        CREATE TRIGGER reservations_update_monthly_revenue AFTER UPDATE ON Reservations
+            REFERENCING OLD TABLE AS old_reservations NEW TABLE AS new_reservations
+            FOR EACH STATEMENT EXECUTE FUNCTION monthly_revenue_apply();
+        CREATE TRIGGER reservations_delete_monthly_revenue AFTER DELETE ON Reservations
+            REFERENCING OLD TABLE AS old_reservations
+            FOR EACH STATEMENT EXECUTE FUNCTION monthly_revenue_apply();'''
+
+    return monthly_revenue_table + monthly_revenue_backfill + monthly_revenue_triggers
+
+
+# schema version 7, CustomerReservationCount and ApartmentReservationCount, filled from the reservations so far
+def _reservation_counts_schema(partitioned_reservations: bool) -> str:
+    # reservations per customer (a row for every customer, 0 until their first reservation) and per reserved
+    # apartment, kept up to date by the Customer and Reservations triggers below
+    reservation_count_tables = "CREATE TABLE CustomerReservationCount(" \
+                               "customer_id INTEGER PRIMARY KEY, " \
+                               "reservation_count INTEGER NOT NULL, " \
+                               "FOREIGN KEY (customer_id) REFERENCES Customer(id) ON DELETE CASCADE);" \
+                               "CREATE INDEX customer_reservation_count_top " \
+                               "ON CustomerReservationCount(reservation_count DESC, customer_id);" \
+                               "CREATE TABLE ApartmentReservationCount(" \
+                               "apartment_id INTEGER PRIMARY KEY, " \
+                               "reservation_count INTEGER NOT NULL, " \
+                               "FOREIGN KEY (apartment_id) REFERENCES Apartment(id) ON DELETE CASCADE);"
+
+    reservation_count_backfill = "INSERT INTO CustomerReservationCount(customer_id, reservation_count) " \
+                                 "SELECT Customer.id, COUNT(Reservations.customer_id) " \
+                                 "FROM Customer LEFT OUTER JOIN Reservations ON Customer.id = Reservations.customer_id " \
+                                 "GROUP BY Customer.id;" \
+                                 "INSERT INTO ApartmentReservationCount(apartment_id, reservation_count) " \
+                                 "SELECT apartment_id, COUNT(*) FROM Reservations GROUP BY apartment_id;"
+
+    reservation_count_triggers = '''CREATE FUNCTION customer_reservation_count_init() RETURNS TRIGGER AS $$
+        BEGIN
+            INSERT INTO CustomerReservationCount(customer_id, reservation_count)
+            SELECT id, 0 FROM new_customers ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+        CREATE TRIGGER customer_insert_reservation_count AFTER INSERT ON Customer
+            REFERENCING NEW TABLE AS new_customers
+            FOR EACH STATEMENT EXECUTE FUNCTION customer_reservation_count_init();
+        CREATE FUNCTION reservation_counts_apply() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE CustomerReservationCount AS c SET reservation_count = c.reservation_count - o.n
+                FROM (SELECT customer_id, COUNT(*) AS n FROM old_reservations GROUP BY customer_id) AS o
+                WHERE c.customer_id = o.customer_id;
+                UPDATE ApartmentReservationCount AS a SET reservation_count = a.reservation_count - o.n
+                FROM (SELECT apartment_id, COUNT(*) AS n FROM old_reservations GROUP BY apartment_id) AS o
+                WHERE a.apartment_id = o.apartment_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO CustomerReservationCount AS c(customer_id, reservation_count)
+                SELECT customer_id, COUNT(*) FROM new_reservations GROUP BY customer_id
+                ON CONFLICT (customer_id) DO UPDATE SET reservation_count = c.reservation_count + EXCLUDED.reservation_count;
+                INSERT INTO ApartmentReservationCount AS a(apartment_id, reservation_count)
+                SELECT apartment_id, COUNT(*) FROM new_reservations GROUP BY apartment_id
+                ON CONFLICT (apartment_id) DO UPDATE SET reservation_count = a.reservation_count + EXCLUDED.reservation_count;
+            END IF;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+        CREATE TRIGGER reservations_insert_counts AFTER INSERT ON Reservations
+            REFERENCING NEW TABLE AS new_reservations
+            FOR EACH STATEMENT EXECUTE FUNCTION reservation_counts_apply();
+        CREATE TRIGGER reservations_update_counts AFTER UPDATE ON Reservations
+            REFERENCING OLD TABLE AS old_reservations NEW TABLE AS new_reservations
+            FOR EACH STATEMENT EXECUTE FUNCTION reservation_counts_apply();
+        CREATE TRIGGER reservations_delete_counts AFTER DELETE ON Reservations
+            REFERENCING OLD TABLE AS old_reservations
+            FOR EACH STATEMENT EXECUTE FUNCTION reservation_counts_apply();'''
+
+    return reservation_count_tables + reservation_count_backfill + reservation_count_triggers
+
+
+# schema version 8, apartment locations and the locations of each owner, filled from the apartments so far (the
+# triggers are created last, so the backfill does not count anything twice)
+def _locations_schema(partitioned_reservations: bool) -> str:
+    # every (city, country) an apartment was ever added in, apartment_count of them are there now
+    location_table = "CREATE TABLE Location(" \
+                     "id INTEGER GENERATED ALWAYS AS IDENTITY PRIMARY KEY, " \
+                     "city TEXT NOT NULL, " \
+                     "country TEXT NOT NULL, " \
+                     "apartment_count INTEGER NOT NULL DEFAULT 0, " \
+                     "UNIQUE (city, country));"
+
+    # location_id is filled in by the apartment_location trigger
+    apartment_location = "INSERT INTO Location(city, country, apartment_count) " \
+                         "SELECT city, country, COUNT(*) FROM Apartment GROUP BY city, country ORDER BY city, country;" \
+                         "ALTER TABLE Apartment ADD location_id INTEGER REFERENCES Location(id);" \
+                         "UPDATE Apartment AS a SET location_id = l.id FROM Location AS l " \
+                         "WHERE l.city = a.city AND l.country = a.country;"
+
+    # location_id is copied from the apartment by the ownedby_location trigger
+    owned_by_location = "ALTER TABLE OwnedBy ADD location_id INTEGER;" \
+                        "UPDATE OwnedBy AS o SET location_id = a.location_id FROM Apartment AS a " \
+                        "WHERE a.id = o.apartment_id;"
+
+    # apartments of each owner per location, and the number of locations each owner has apartments in
+    owner_location_tables = "CREATE TABLE OwnerLocation(" \
+                            "owner_id INTEGER, " \
+                            "location_id INTEGER, " \
+                            "apartment_count INTEGER NOT NULL, " \
+                            "PRIMARY KEY (owner_id, location_id), " \
+                            "FOREIGN KEY (owner_id) REFERENCES Owner(id) ON DELETE CASCADE);" \
+                            "CREATE TABLE OwnerLocationCount(" \
+                            "owner_id INTEGER PRIMARY KEY, " \
+                            "location_count INTEGER NOT NULL, " \
+                            "FOREIGN KEY (owner_id) REFERENCES Owner(id) ON DELETE CASCADE);" \
+                            "CREATE INDEX owner_location_count ON OwnerLocationCount(location_count);"
+
+    owner_location_backfill = "INSERT INTO OwnerLocation(owner_id, location_id, apartment_count) " \
+                              "SELECT owner_id, location_id, COUNT(*) FROM OwnedBy " \
+                              "WHERE owner_id IS NOT NULL AND location_id IS NOT NULL GROUP BY owner_id, location_id;" \
+                              "INSERT INTO OwnerLocationCount(owner_id, location_count) " \
+                              "SELECT owner_id, COUNT(*) FROM OwnerLocation GROUP BY owner_id;"
+
+    # Location.apartment_count is counted AFTER the statement, a row a BEFORE trigger saw may still be
+    # skipped by INSERT ... ON CONFLICT DO NOTHING (add_apartments)
+    location_triggers = '''CREATE FUNCTION apartment_location() RETURNS TRIGGER AS $$
+        BEGIN
+            SELECT id INTO NEW.location_id FROM Location WHERE city = NEW.city AND country = NEW.country;
+            IF NOT FOUND THEN
+                INSERT INTO Location(city, country) VALUES (NEW.city, NEW.country) ON CONFLICT DO NOTHING;
+                SELECT id INTO NEW.location_id FROM Location WHERE city = NEW.city AND country = NEW.country;
+            END IF;
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql;
+        CREATE TRIGGER apartment_location BEFORE INSERT OR UPDATE OF city, country ON Apartment
+            FOR EACH ROW EXECUTE FUNCTION apartment_location();
+        CREATE FUNCTION location_apartment_count_apply() RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE Location AS l SET apartment_count = l.apartment_count - o.n
+                FROM (SELECT location_id, COUNT(*) AS n FROM old_apartments GROUP BY location_id) AS o
+                WHERE l.id = o.location_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE Location AS l SET apartment_count = l.apartment_count + a.n
+                FROM (SELECT location_id, COUNT(*) AS n FROM new_apartments GROUP BY location_id) AS a
+                WHERE l.id = a.location_id;
+            END IF;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+        CREATE TRIGGER apartment_insert_location_count AFTER INSERT ON Apartment
+            REFERENCING NEW TABLE AS new_apartments
+            FOR EACH STATEMENT EXECUTE FUNCTION location_apartment_count_apply();
+        CREATE TRIGGER apartment_update_location_count AFTER UPDATE ON Apartment
+            REFERENCING OLD TABLE AS old_apartments NEW TABLE AS new_apartments
+            FOR EACH STATEMENT EXECUTE FUNCTION location_apartment_count_apply();
+        CREATE TRIGGER apartment_delete_location_count AFTER DELETE ON Apartment
+            REFERENCING OLD TABLE AS old_apartments
+            FOR EACH STATEMENT EXECUTE FUNCTION location_apartment_count_apply();
+        CREATE FUNCTION ownedby_location() RETURNS TRIGGER AS $$
+        BEGIN
+            SELECT location_id INTO NEW.location_id FROM Apartment WHERE id = NEW.apartment_id;
+            RETURN NEW;
+        END $$ LANGUAGE plpgsql;
+        CREATE TRIGGER ownedby_location BEFORE INSERT OR UPDATE ON OwnedBy
+            FOR EACH ROW EXECUTE FUNCTION ownedby_location();
+        CREATE FUNCTION owner_location_apply() RETURNS TRIGGER AS $$
+        DECLARE
+            remaining INTEGER;
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.location_id IS NOT NULL THEN
+                UPDATE OwnerLocation SET apartment_count = apartment_count - 1
+                WHERE owner_id = OLD.owner_id AND location_id = OLD.location_id
+                RETURNING apartment_count INTO remaining;
+                IF remaining = 0 THEN
+                    DELETE FROM OwnerLocation WHERE owner_id = OLD.owner_id AND location_id = OLD.location_id;
+                    UPDATE OwnerLocationCount SET location_count = location_count - 1 WHERE owner_id = OLD.owner_id;
+                END IF;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.location_id IS NOT NULL THEN
+                INSERT INTO OwnerLocation AS l(owner_id, location_id, apartment_count)
+                VALUES (NEW.owner_id, NEW.location_id, 1)
+                ON CONFLICT (owner_id, location_id) DO UPDATE SET apartment_count = l.apartment_count + 1
+                RETURNING apartment_count INTO remaining;
+                IF remaining = 1 THEN
+                    INSERT INTO OwnerLocationCount AS c(owner_id, location_count) VALUES (NEW.owner_id, 1)
+                    ON CONFLICT (owner_id) DO UPDATE SET location_count = c.location_count + 1;
+                END IF;
+            END IF;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;
+        CREATE TRIGGER ownedby_owner_location AFTER INSERT OR UPDATE OR DELETE ON OwnedBy
+            FOR EACH ROW EXECUTE FUNCTION owner_location_apply();'''
+
+    return location_table + apartment_location + owned_by_location + owner_location_tables \
+        + owner_location_backfill + location_triggers
+
+
+# schema version 9, rating_ratio_apply serialized per apartment, and a consistency check of RatingRatio
+def _rating_ratio_lock_schema(partitioned_reservations: bool) -> str:
+    # U is read under an advisory lock on each apartment involved, taken in apartment order so two statements
+    # can't deadlock on them: a concurrent review of the same apartment commits before U is read (and its pairs
+    # are counted here) or waits until this transaction ends (and counts them itself)
+    rating_ratio_triggers = '''CREATE OR REPLACE FUNCTION rating_ratio_apply() RETURNS TRIGGER AS $$
+        DECLARE
+            added Reviews[] := '{}';
+            removed Reviews[] := '{}';
+            from_ids INTEGER[];
+            to_ids INTEGER[];
+            locked INTEGER;
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                SELECT COALESCE(array_agg(x), '{}') INTO added FROM new_reviews AS x;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                SELECT COALESCE(array_agg(x), '{}') INTO removed FROM old_reviews AS x;
+            END IF;
+            FOR locked IN SELECT apartment_id FROM unnest(added) UNION SELECT apartment_id FROM unnest(removed)
+                          ORDER BY 1 LOOP
+                PERFORM pg_advisory_xact_lock(hashtext(current_schema() || '.RatingRatio'), locked);
+            END LOOP;
+            WITH n AS (SELECT * FROM unnest(added)),
+                 r AS (SELECT * FROM unnest(removed)),
+                 u AS (SELECT * FROM Reviews AS v
+                       WHERE v.apartment_id IN (SELECT apartment_id FROM n UNION SELECT apartment_id FROM r)
+                       AND NOT EXISTS (SELECT 1 FROM n
+                                       WHERE n.customer_id = v.customer_id AND n.apartment_id = v.apartment_id)),
+                 pairs AS (
+                    SELECT f.customer_id AS from_customer, t.customer_id AS to_customer, t.rating, f.rating AS base,
+                           1 AS sign
+                    FROM (SELECT * FROM u UNION ALL SELECT * FROM n) AS f JOIN n AS t USING (apartment_id)
+                    UNION ALL
+                    SELECT f.customer_id, t.customer_id, t.rating, f.rating, 1
+                    FROM n AS f JOIN u AS t USING (apartment_id)
+                    UNION ALL
+                    SELECT f.customer_id, t.customer_id, t.rating, f.rating, -1
+                    FROM (SELECT * FROM u UNION ALL SELECT * FROM r) AS f JOIN r AS t USING (apartment_id)
+                    UNION ALL
+                    SELECT f.customer_id, t.customer_id, t.rating, f.rating, -1
+                    FROM r AS f JOIN u AS t USING (apartment_id)),
+                 changed AS (
+                    INSERT INTO RatingRatio AS p(from_customer, to_customer, ratio_sum, ratio_count)
+                    SELECT from_customer, to_customer, SUM(sign * rating * (RATING_RATIO_SCALE / base)), SUM(sign)
+                    FROM pairs WHERE from_customer <> to_customer
+                    GROUP BY from_customer, to_customer
+                    ON CONFLICT (to_customer, from_customer) DO UPDATE
+                    SET ratio_sum = p.ratio_sum + EXCLUDED.ratio_sum, ratio_count = p.ratio_count + EXCLUDED.ratio_count
+                    RETURNING p.from_customer, p.to_customer, p.ratio_count)
+            SELECT array_agg(from_customer), array_agg(to_customer) INTO from_ids, to_ids
+            FROM changed WHERE ratio_count = 0;
+            DELETE FROM RatingRatio
+            WHERE (to_customer, from_customer) IN (SELECT * FROM unnest(to_ids, from_ids)) AND ratio_count = 0;
+            RETURN NULL;
+        END $$ LANGUAGE plpgsql;'''
+
+    # recomputes RatingRatio from Reviews, returns the number of pairs that were wrong
+    rebuild_rating_ratio_function = '''
+        CREATE FUNCTION rebuild_rating_ratio() RETURNS INTEGER AS $$
+        DECLARE
+            mismatches INTEGER;
+        BEGIN
+            LOCK TABLE Reviews IN SHARE MODE;
+            LOCK TABLE RatingRatio IN EXCLUSIVE MODE;
+            CREATE TEMPORARY TABLE rating_ratio_rebuilt ON COMMIT DROP AS
+            SELECT f.customer_id AS from_customer, t.customer_id AS to_customer,
+                   SUM(t.rating * (RATING_RATIO_SCALE / f.rating)) AS ratio_sum, COUNT(*) AS ratio_count
+            FROM Reviews AS f JOIN Reviews AS t ON f.apartment_id = t.apartment_id AND f.customer_id <> t.customer_id
+            GROUP BY f.customer_id, t.customer_id;
+            SELECT COUNT(DISTINCT (from_customer, to_customer)) INTO mismatches FROM (
+                (SELECT from_customer, to_customer, ratio_sum, ratio_count FROM RatingRatio
+                 EXCEPT SELECT * FROM rating_ratio_rebuilt)
+                UNION ALL
+                (SELECT * FROM rating_ratio_rebuilt
+                 EXCEPT SELECT from_customer, to_customer, ratio_sum, ratio_count FROM RatingRatio)) AS diff;
+            DELETE FROM RatingRatio;
+            INSERT INTO RatingRatio(from_customer, to_customer, ratio_sum, ratio_count)
+            SELECT * FROM rating_ratio_rebuilt;
+            DROP TABLE rating_ratio_rebuilt;
+            RETURN mismatches;
+        END $$ LANGUAGE plpgsql;'''
+
+    return (rating_ratio_triggers + rebuild_rating_ratio_function).replace("RATING_RATIO_SCALE",
+                                                                          str(RATING_RATIO_SCALE))
+
+
+# ordered schema migrations, (version, function of the create_tables options returning the DDL of the version)
+# a migration keeps the data: it creates what the version adds and fills it from the rows already there
+# new versions go at the end and an applied version is never edited: create_tables refuses a database whose
+# applied versions were built from other DDL
+SCHEMA_MIGRATIONS = [
+    (1, _baseline_schema),
+    (2, _reservation_overlap_schema),
+    (3, _secondary_indexes_schema),
+    (4, _apartment_rating_stats_schema),
+    (5, _rating_ratio_schema),
+    (6, _monthly_revenue_schema),
+    (7, _reservation_counts_schema),
+    (8, _locations_schema),
+    (9, _rating_ratio_lock_schema),
+]
+
+# the applied migrations, with the fingerprint of the DDL each one ran
+SCHEMA_VERSION_TABLE = "CREATE TABLE IF NOT EXISTS SchemaVersion(" \
+                       "version INTEGER PRIMARY KEY, " \
+                       "fingerprint TEXT NOT NULL, " \
+                       "applied_at TIMESTAMP NOT NULL DEFAULT now());"
+
+DROP_TABLES_QUERY = "DROP TABLE IF EXISTS Owner, Customer, Apartment, OwnedBy, Reservations, Reviews, " \
+                    "ApartmentRatingStats, RatingRatio, MonthlyRevenue, CustomerReservationCount, " \
+                    "ApartmentReservationCount, Location, OwnerLocation, OwnerLocationCount, SchemaVersion CASCADE;" \
+                    "DROP VIEW IF EXISTS ApartmentRating, rating_ratio CASCADE;" \
+                    "DROP FUNCTION IF EXISTS apartment_rating_stats_apply, rebuild_apartment_rating_stats, " \
+                    "rating_ratio_apply, monthly_revenue_apply, customer_reservation_count_init, " \
+                    "reservation_counts_apply, apartment_location, location_apartment_count_apply, ownedby_location, " \
+                    "owner_location_apply, reservations_no_overlap, reservations_create_partitions, rebuild_rating_ratio " \
+                    "CASCADE;"
+
+
+def _schema_fingerprint(ddl: str) -> str:
+    return hashlib.sha256(ddl.encode()).hexdigest()
+
+
+# brings the schema up to date: applies the SCHEMA_MIGRATIONS missing from SchemaVersion in order, all in one
+# transaction, and runs no DDL at all when the fingerprints of the applied versions match (the startup of a service
+# and the setUp of a test only pay for one round trip)
+# tables from before SchemaVersion are taken to be version 1 and migrated from there
+# nothing is ever dropped: a version unknown to this code (applied by a newer one) or applied from other DDL (e.g.
+# the other partitioned_reservations) raises DatabaseException.SCHEMA_MISMATCH, a failing migration raises its
+# error, and either way the schema is left as it was
+# concurrent calls on a schema (e.g. workers starting together) are serialized by an advisory lock
+# partitioned_reservations - range partition Reservations by the year of end_date, so queries scoped to a range of
+# end dates only read the partitions of those years, the partitions of new years are created on every call
+@instrumented
+def create_tables(partitioned_reservations=False):
+    migrations = []  # (version, fingerprint, DDL)
+    for version, migration in SCHEMA_MIGRATIONS:
+        ddl = migration(partitioned_reservations)
+        migrations.append((version, _schema_fingerprint(ddl), ddl))
+    conn = None
+    try:
+        conn = Connector.DBConnector()
+        conn.begin()
+        # the schema of the worker (see DBConnector.schema), the DDL below goes to the first schema of the
+        # search_path
+        schema = Connector.DBConnector.schema()
+        create_schema = sql.SQL("CREATE SCHEMA IF NOT EXISTS {};").format(sql.Identifier(schema)) \
+            if schema is not None else sql.SQL("")
+        _, entries = conn.execute(sql.SQL("SELECT pg_advisory_xact_lock(hashtext(current_setting('search_path') "
+                                          "|| '.SchemaVersion'));") + create_schema + sql.SQL(SCHEMA_VERSION_TABLE) +
+                                  sql.SQL("SELECT version, fingerprint FROM SchemaVersion ORDER BY version"))
+        applied = {entry['version']: entry['fingerprint'] for entry in entries}
+
+        if not applied:
+            _, entries = conn.execute("SELECT to_regclass('Owner') IS NOT NULL AS baseline")
+            if entries[0]['baseline']:
+                version, fingerprint, _ = migrations[0]
+                conn.execute("INSERT INTO SchemaVersion(version, fingerprint) VALUES (%s, %s)",
+                             params=(version, fingerprint))
+                applied[version] = fingerprint
+
+        known = {version: fingerprint for version, fingerprint, _ in migrations}
+        for version, fingerprint in sorted(applied.items()):
+            if version not in known:
+                raise DatabaseException.SCHEMA_MISMATCH("Schema version %d is unknown, applied by newer code" % version)
+            if fingerprint != known[version]:
+                raise DatabaseException.SCHEMA_MISMATCH("Schema version %d was applied from other DDL "
+                                                        "(other create_tables options?)" % version)
+
+        for version, fingerprint, ddl in migrations:
+            if version in applied:
+                continue
+            conn.execute(ddl)
+            conn.execute("INSERT INTO SchemaVersion(version, fingerprint) VALUES (%s, %s)",
+                         params=(version, fingerprint))
+
+        if partitioned_reservations:
+            today = date.today()
+            conn.execute("SELECT reservations_create_partitions(%s, %s)",
+                         params=(today.year - RESERVATION_PARTITION_YEARS_BACK,
+                                 today.year + RESERVATION_PARTITION_YEARS_AHEAD))
+        conn.commit()
+
+    except BaseException:
+        if conn is not None and conn.in_transaction:
+            conn.rollback()
+        raise
 
-    run_query(query)
+    finally:
+        if conn is not None:
+            conn.close()
+        _clear_cache()
 
 
+# empties the tables, the schema stays (so the next create_tables has nothing to do)
+@instrumented
 def clear_tables():
-    query = "TRUNCATE Owner, Customer, Apartment, OwnedBy, Reservations, Reviews;"
+    query = "TRUNCATE Owner, Customer, Apartment, OwnedBy, Reservations, Reviews, ApartmentRatingStats, RatingRatio, " \
+            "MonthlyRevenue, CustomerReservationCount, ApartmentReservationCount, Location, OwnerLocation, " \
+            "OwnerLocationCount RESTART IDENTITY;"
     run_query(query)
+    _clear_cache()
 
 
+@instrumented
 def drop_tables():
-    query = "DROP TABLE IF EXISTS Owner, Customer, Apartment, OwnedBy, Reservations, Reviews CASCADE;" \
-            "DROP VIEW IF EXISTS ApartmentRating, rating_ratio CASCADE;"
-    run_query(query)
+    run_query(DROP_TABLES_QUERY)
+    _clear_cache()
 
 
-def add_owner(owner: Owner) -> ReturnValue:
+# consistency check of the incrementally maintained ApartmentRatingStats: rebuilds it from Reviews and returns
+# the number of apartments whose stats were wrong, None if the rebuild failed
+@instrumented
+def rebuild_apartment_rating_stats() -> int:
+    _, entries, return_val = run_query("SELECT rebuild_apartment_rating_stats() AS mismatches")
+
+    if return_val != ReturnValue.OK:
+        return None
+
+    return entries[0]['mismatches']
+
+
+# consistency check of the incrementally maintained RatingRatio: rebuilds it from Reviews and returns the number of
+# customer pairs that were wrong, None if the rebuild failed
+@instrumented
+def rebuild_rating_ratio() -> int:
+    _, entries, return_val = run_query("SELECT rebuild_rating_ratio() AS mismatches")
+
+    if return_val != ReturnValue.OK:
+        return None
+
+    return entries[0]['mismatches']
+
+
+# creates the missing yearly partitions of a partitioned Reservations table from first_year to last_year (by
+# default RESERVATION_PARTITION_YEARS_BACK years ago to RESERVATION_PARTITION_YEARS_AHEAD years from now), meant to
+# run periodically, e.g. once a year
+# reservations already in the default partition move to their new partition
+# returns the number of partitions created, None if it failed (e.g. Reservations is not partitioned)
+@instrumented
+def create_reservation_partitions(first_year: int = None, last_year: int = None) -> int:
+    today = date.today()
+    first_year = first_year if first_year is not None else today.year - RESERVATION_PARTITION_YEARS_BACK
+    last_year = last_year if last_year is not None else today.year + RESERVATION_PARTITION_YEARS_AHEAD
+    _, entries, return_val = run_query("SELECT reservations_create_partitions(%s, %s) AS created",
+                                       (first_year, last_year))
+
+    if return_val != ReturnValue.OK:
+        return None
+
+    return entries[0]['created']
+
+
+# (id, name) of the owner, None if it has bad params
+def _owner_values(owner: Owner):
     owner_id, name = owner.get_owner_id(), owner.get_owner_name()
     if owner_id is None or owner_id <= 0 or name is None:
+        return None
+    return owner_id, name
+
+
+@instrumented
+def add_owner(owner: Owner) -> ReturnValue:
+    values = _owner_values(owner)
+    if values is None:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("INSERT INTO Owner(id, name) VALUES({id}, {name})").format(id=sql.Literal(owner_id),
-                                                                               name=sql.Literal(name))
-    _, _, return_val = run_query(query)
+    _, _, return_val = run_query(ADD_OWNER, values)
+
+    if return_val == ReturnValue.OK:
+        _invalidate(("owner", values[0]))
 
     return return_val
 
 
+@instrumented
 def get_owner(owner_id: int) -> Owner:
     if owner_id <= 0:
         return Owner.bad_owner()
 
-    query = sql.SQL("SELECT id, name FROM Owner WHERE id={0}").format(sql.Literal(owner_id))
-
-    num_rows_effected, entries, return_val = run_query(query)
+    row = _read_row(("owner", owner_id), GET_OWNER, (owner_id,))
 
-    if num_rows_effected == 0:
-        return Owner.bad_owner()
-
-    entry = entries[0]
-
-    return Owner(owner_id=entry['id'], owner_name=entry['name'])
+    return Owner.from_row(row) if row is not None else Owner.bad_owner()
 
 
+@instrumented
 def delete_owner(owner_id: int) -> ReturnValue:
     if owner_id <= 0:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("DELETE FROM Owner WHERE id={0}").format(sql.Literal(owner_id))
-
-    num_rows_effected, _, return_val = run_query(query)
+    num_rows_effected, _, return_val = run_query(DELETE_OWNER, (owner_id,))
 
     if num_rows_effected == 0:
         return ReturnValue.NOT_EXISTS
 
+    if return_val == ReturnValue.OK:
+        _invalidate(("owner", owner_id))
+
     return return_val
 
 
-def add_apartment(apartment: Apartment) -> ReturnValue:
+# (id, address, city, country, size) of the apartment, None if it has bad params
+def _apartment_values(apartment: Apartment):
     apartment_id = apartment.get_id()
     address = apartment.get_address()
     city = apartment.get_city()
@@ -169,118 +1146,119 @@ def add_apartment(apartment: Apartment) -> ReturnValue:
 
     if apartment_id is None or apartment_id <= 0 or address is None or city is None or country is None or size is None \
             or size <= 0:
+        return None
+    return apartment_id, address, city, country, size
+
+
+@instrumented
+def add_apartment(apartment: Apartment) -> ReturnValue:
+    values = _apartment_values(apartment)
+    if values is None:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("INSERT INTO Apartment VALUES({id}, {address}, {city}, {country}, {size})")\
-        .format(id=sql.Literal(apartment_id), address=sql.Literal(address), city=sql.Literal(city),
-                country=sql.Literal(country), size=sql.Literal(size))
+    _, _, return_val = run_query(ADD_APARTMENT, values)
 
-    _, _, return_val = run_query(query)
+    if return_val == ReturnValue.OK:
+        _invalidate(("apartment", values[0]))
 
     return return_val
 
 
+@instrumented
 def get_apartment(apartment_id: int) -> Apartment:
     if apartment_id <= 0:
         return Apartment.bad_apartment()
 
-    query = sql.SQL("SELECT * FROM Apartment WHERE id={0}").format(sql.Literal(apartment_id))
+    row = _read_row(("apartment", apartment_id), GET_APARTMENT, (apartment_id,))
 
-    num_rows_effected, entries, return_val = run_query(query)
-
-    if num_rows_effected == 0:
-        return Apartment.bad_apartment()
-
-    entry = entries[0]
-
-    return Apartment(id=entry['id'], address=entry['address'], city=entry['city'], country=entry['country'],
-                     size=entry['size'])
+    return Apartment.from_row(row) if row is not None else Apartment.bad_apartment()
 
 
+@instrumented
 def delete_apartment(apartment_id: int) -> ReturnValue:
     if apartment_id <= 0:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("DELETE FROM Apartment WHERE id={0}").format(sql.Literal(apartment_id))
-
-    num_rows_effected, _, return_val = run_query(query)
+    num_rows_effected, _, return_val = run_query(DELETE_APARTMENT, (apartment_id,))
 
     if num_rows_effected == 0:
         return ReturnValue.NOT_EXISTS
 
+    if return_val == ReturnValue.OK:
+        _invalidate(("apartment", apartment_id))
+
     return return_val
 
 
-def add_customer(customer: Customer) -> ReturnValue:
+# (id, name) of the customer, None if it has bad params
+def _customer_values(customer: Customer):
     customer_id, name = customer.get_customer_id(), customer.get_customer_name()
     if customer_id is None or customer_id <= 0 or name is None:
+        return None
+    return customer_id, name
+
+
+@instrumented
+def add_customer(customer: Customer) -> ReturnValue:
+    values = _customer_values(customer)
+    if values is None:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("INSERT INTO Customer(id, name) VALUES({id}, {name})").format(id=sql.Literal(customer_id),
-                                                                                  name=sql.Literal(name))
-    _, _, return_val = run_query(query)
+    _, _, return_val = run_query(ADD_CUSTOMER, values)
+
+    if return_val == ReturnValue.OK:
+        _invalidate(("customer", values[0]))
 
     return return_val
 
 
+@instrumented
 def get_customer(customer_id: int) -> Customer:
     if customer_id <= 0:
         return Customer.bad_customer()
 
-    query = sql.SQL("SELECT id, name FROM Customer WHERE id={0}").format(sql.Literal(customer_id))
-
-    num_rows_effected, entries, return_val = run_query(query)
-
-    if num_rows_effected == 0:
-        return Customer.bad_customer()
-
-    entry = entries[0]
+    row = _read_row(("customer", customer_id), GET_CUSTOMER, (customer_id,))
 
-    return Customer(customer_id=entry['id'], customer_name=entry['name'])
+    return Customer.from_row(row) if row is not None else Customer.bad_customer()
 
 
+@instrumented
 def delete_customer(customer_id: int) -> ReturnValue:
     if customer_id <= 0:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("DELETE FROM Customer WHERE id={0}").format(sql.Literal(customer_id))
-
-    num_rows_effected, _, return_val = run_query(query)
+    num_rows_effected, _, return_val = run_query(DELETE_CUSTOMER, (customer_id,))
 
     if num_rows_effected == 0:
         return ReturnValue.NOT_EXISTS
 
+    if return_val == ReturnValue.OK:
+        _invalidate(("customer", customer_id))
+
     return return_val
 
 
+@instrumented
 def customer_made_reservation(customer_id: int, apartment_id: int, start_date: date, end_date: date, total_price: float) -> ReturnValue:
     if customer_id <= 0 or apartment_id <= 0 or start_date >= end_date or total_price <= 0:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("INSERT INTO Reservations "
-                    "SELECT {customer_id}, {apartment_id}, {start_date}, {end_date}, {price} "
-                    "WHERE NOT EXISTS "
-                    "(SELECT * FROM Reservations "
-                    " WHERE apartment_id = {apartment_id} AND start_date < {end_date} AND end_date > {start_date})")\
-        .format(customer_id=sql.Literal(customer_id), apartment_id=sql.Literal(apartment_id),
-                start_date=sql.Literal(start_date), end_date=sql.Literal(end_date), price=sql.Literal(total_price))
-
-    num_rows_effected, _, return_val = run_query(query)
+    num_rows_effected, _, return_val = run_query(CUSTOMER_MADE_RESERVATION,
+                                                 (customer_id, apartment_id, start_date, end_date, total_price))
 
-    if return_val == ReturnValue.OK and num_rows_effected == 0:
+    if return_val == ReturnValue.ALREADY_EXISTS:  # same apartment and start date, an overlap as well
         return ReturnValue.BAD_PARAMS
 
     return return_val
 
 
+@instrumented
 def customer_cancelled_reservation(customer_id: int, apartment_id: int, start_date: date) -> ReturnValue:
     if customer_id <= 0 or apartment_id <= 0:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("DELETE FROM Reservations WHERE customer_id={0} AND apartment_id={1} AND start_date={2}")\
-        .format(sql.Literal(customer_id), sql.Literal(apartment_id), sql.Literal(start_date))
-
-    num_rows_effected, _, return_val = run_query(query)
+    num_rows_effected, _, return_val = run_query(CUSTOMER_CANCELLED_RESERVATION,
+                                                 (customer_id, apartment_id, start_date))
 
     if num_rows_effected == 0:
         return ReturnValue.NOT_EXISTS
@@ -288,19 +1266,13 @@ def customer_cancelled_reservation(customer_id: int, apartment_id: int, start_da
     return return_val
 
 
+@instrumented
 def customer_reviewed_apartment(customer_id: int, apartment_id: int, review_date: date, rating: int, review_text: str) -> ReturnValue:
     if customer_id <= 0 or apartment_id <= 0 or rating < 1 or rating > 10:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("INSERT INTO Reviews "
-                    "SELECT {customer_id}, {apartment_id}, {date}, {rating}, {review_text} "
-                    "WHERE EXISTS "
-                    "(SELECT * FROM Reservations "
-                    " WHERE customer_id={customer_id} AND apartment_id={apartment_id} AND end_date <= {date})") \
-        .format(customer_id=sql.Literal(customer_id), apartment_id=sql.Literal(apartment_id),
-                date=sql.Literal(review_date), rating=sql.Literal(rating), review_text=sql.Literal(review_text))
-
-    num_rows_effected, _, return_val = run_query(query)
+    num_rows_effected, _, return_val = run_query(CUSTOMER_REVIEWED_APARTMENT,
+                                                 (customer_id, apartment_id, review_date, rating, review_text))
 
     if return_val == ReturnValue.OK and num_rows_effected == 0:  # customer did not have a prior reservation
         return ReturnValue.NOT_EXISTS
@@ -308,18 +1280,13 @@ def customer_reviewed_apartment(customer_id: int, apartment_id: int, review_date
     return return_val
 
 
+@instrumented
 def customer_updated_review(customer_id: int, apartment_id: int, update_date: date, new_rating: int, new_text: str) -> ReturnValue:
     if customer_id <= 0 or apartment_id <= 0 or new_rating < 1 or new_rating > 10:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("UPDATE Reviews "
-                    "SET date={update_date}, rating={new_rating}, review_text={new_text} "
-                    "WHERE customer_id={customer_id} AND apartment_id={apartment_id} AND date <= {update_date}") \
-        .format(update_date=sql.Literal(update_date), new_rating=sql.Literal(new_rating),
-                new_text=sql.Literal(new_text), customer_id=sql.Literal(customer_id),
-                apartment_id=sql.Literal(apartment_id))
-
-    num_rows_effected, _, return_val = run_query(query)
+    num_rows_effected, _, return_val = run_query(CUSTOMER_UPDATED_REVIEW,
+                                                 (customer_id, apartment_id, update_date, new_rating, new_text))
 
     if return_val == ReturnValue.OK and num_rows_effected == 0:  # customer did not have an old review
         return ReturnValue.NOT_EXISTS
@@ -327,75 +1294,72 @@ def customer_updated_review(customer_id: int, apartment_id: int, update_date: da
     return return_val
 
 
+@instrumented
 def owner_owns_apartment(owner_id: int, apartment_id: int) -> ReturnValue:
     if owner_id <= 0 or apartment_id <= 0:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("INSERT INTO OwnedBy VALUES({apartment_id}, {owner_id})")\
-        .format(apartment_id=sql.Literal(apartment_id), owner_id=sql.Literal(owner_id))
+    _, _, return_val = run_query(OWNER_OWNS_APARTMENT, (apartment_id, owner_id))
 
-    _, _, return_val = run_query(query)
+    if return_val == ReturnValue.OK:
+        _invalidate(("ownedby", apartment_id))
 
     return return_val
 
 
+@instrumented
 def owner_drops_apartment(owner_id: int, apartment_id: int) -> ReturnValue:
     if owner_id <= 0 or apartment_id <= 0:
         return ReturnValue.BAD_PARAMS
 
-    query = sql.SQL("DELETE FROM OwnedBy WHERE apartment_id={0} AND owner_id={1}")\
-        .format(sql.Literal(apartment_id), sql.Literal(owner_id))
-
-    num_rows_effected, _, return_val = run_query(query)
+    num_rows_effected, _, return_val = run_query(OWNER_DROPS_APARTMENT, (apartment_id, owner_id))
 
     if num_rows_effected == 0:
         return ReturnValue.NOT_EXISTS
 
+    if return_val == ReturnValue.OK:
+        _invalidate(("ownedby", apartment_id))
+
     return return_val
 
 
+@instrumented
 def get_apartment_owner(apartment_id: int) -> Owner:
     if apartment_id <= 0:
         return Owner.bad_owner()
 
-    query = sql.SQL("SELECT id, name FROM Owner "
-                    "WHERE id IN (SELECT owner_id FROM OwnedBy WHERE apartment_id={0})")\
-        .format(sql.Literal(apartment_id))
-
-    num_rows_effected, entries, return_val = run_query(query)
-
-    if num_rows_effected == 0:
-        return Owner.bad_owner()
-
-    entry = entries[0]
+    # also dropped with the apartment and with the owner
+    row = _read_row(("ownedby", apartment_id), GET_APARTMENT_OWNER, (apartment_id,),
+                    lambda row: [("apartment", apartment_id)] + ([("owner", row[0])] if row is not None else []))
 
-    return Owner(owner_id=entry['id'], owner_name=entry['name'])
+    return Owner.from_row(row) if row is not None else Owner.bad_owner()
 
 
+@instrumented
 def get_owner_apartments(owner_id: int) -> List[Apartment]:
     if owner_id <= 0:
         return []
 
-    query = sql.SQL("SELECT * FROM Apartment "
-                    "WHERE id IN (SELECT apartment_id FROM OwnedBy WHERE owner_id={0})") \
-        .format(sql.Literal(owner_id))
+    num_rows_effected, entries, return_val = run_query(GET_OWNER_APARTMENTS, (owner_id,), read_only=True)
 
-    num_rows_effected, entries, return_val = run_query(query)
-
-    return [Apartment(id=entry['id'], address=entry['address'], city=entry['city'], country=entry['country'],
-                      size=entry['size']) for entry in entries]
+    return [Apartment.from_row(row) for row in entries.rows]
 
 
 # ---------------------------------- BASIC API: ----------------------------------
 
+# the BASIC and ADVANCED API queries are shared with AsyncSolution
+
+APARTMENT_RATING_QUERY = "SELECT average_rating FROM ApartmentRating WHERE apartment_id={apartment_id}"
+
+
+@instrumented
 def get_apartment_rating(apartment_id: int) -> float:
     if apartment_id <= 0:
         return 0
 
-    query = sql.SQL("SELECT average_rating FROM ApartmentRating WHERE apartment_id={0}") \
-        .format(sql.Literal(apartment_id))
+    query = sql.SQL(APARTMENT_RATING_QUERY).format(apartment_id=sql.Literal(apartment_id))
 
-    num_rows_effected, entries, return_val = run_query(query)
+    num_rows_effected, entries, return_val = run_query(query, read_only=True)
 
     if num_rows_effected == 0:  # apartment id does not exist
         return 0
@@ -405,15 +1369,18 @@ def get_apartment_rating(apartment_id: int) -> float:
     return entry['average_rating']
 
 
+OWNER_RATING_QUERY = "SELECT AVG(average_rating) AS owner_rating FROM ApartmentRating " \
+                     "WHERE apartment_id IN (SELECT apartment_id FROM OwnedBy WHERE owner_id={owner_id})"
+
+
+@instrumented
 def get_owner_rating(owner_id: int) -> float:
     if owner_id <= 0:
         return 0
 
-    query = sql.SQL("SELECT AVG(average_rating) AS owner_rating FROM ApartmentRating "
-                    "WHERE apartment_id IN (SELECT apartment_id FROM OwnedBy WHERE owner_id={0})") \
-        .format(sql.Literal(owner_id))
+    query = sql.SQL(OWNER_RATING_QUERY).format(owner_id=sql.Literal(owner_id))
 
-    num_rows_effected, entries, return_val = run_query(query)
+    num_rows_effected, entries, return_val = run_query(query, read_only=True)
 
     if num_rows_effected == 0:
         return 0
@@ -424,57 +1391,61 @@ def get_owner_rating(owner_id: int) -> float:
     return entry['owner_rating'] if entry['owner_rating'] is not None else 0
 
 
+# first entry of the customer_reservation_count_top index
+TOP_CUSTOMER_QUERY = "SELECT id, name " \
+                     "FROM CustomerReservationCount JOIN Customer ON Customer.id = CustomerReservationCount.customer_id " \
+                     "ORDER BY reservation_count DESC, customer_id ASC LIMIT 1"
+
+
+@instrumented
 def get_top_customer() -> Customer:
-    query = sql.SQL("SELECT id, name "
-                    "FROM Customer LEFT OUTER JOIN Reservations ON Customer.id = Reservations.customer_id "
-                    "GROUP BY id "
-                    "ORDER BY COUNT(*) DESC, id ASC LIMIT 1")
+    query = sql.SQL(TOP_CUSTOMER_QUERY)
 
-    num_rows_effected, entries, return_val = run_query(query)
+    num_rows_effected, entries, return_val = run_query(query, read_only=True)
 
     if num_rows_effected == 0:  # there are no customers
         return Customer.bad_customer()
 
-    entry = entries[0]  # expect 1 row for the top customer, even if there are no reservations
+    # expect 1 row for the top customer, even if there are no reservations
+    return Customer.from_row(entries.rows[0])
 
-    return Customer(customer_id=entry['id'], customer_name=entry['name'])
 
+RESERVATIONS_PER_OWNER_QUERY = "SELECT name, COALESCE(SUM(reservation_count), 0) AS reservations_per_owner " \
+                               "FROM Owner LEFT OUTER JOIN OwnedBy ON Owner.id = OwnedBy.owner_id " \
+                               "LEFT OUTER JOIN ApartmentReservationCount " \
+                               "ON OwnedBy.apartment_id = ApartmentReservationCount.apartment_id " \
+                               "GROUP BY name"
 
+
+@instrumented
 def reservations_per_owner() -> List[Tuple[str, int]]:
-    query = sql.SQL("SELECT name, COALESCE(SUM(apartment_reservation_count), 0) AS reservations_per_owner "
-                    "FROM ("
-                    "(Owner LEFT OUTER JOIN OwnedBy ON Owner.id = OwnedBy.owner_id) AS OwnerApartments "
-                    "LEFT OUTER JOIN "
-                    "(SELECT apartment_id, COUNT(*) AS apartment_reservation_count "
-                    " FROM Reservations "
-                    " GROUP BY apartment_id) AS ReservationsPerApartment "
-                    " ON OwnerApartments.apartment_id = ReservationsPerApartment.apartment_id"
-                    ") "
-                    "GROUP BY name")
-
-    num_rows_effected, entries, return_val = run_query(query)
+    query = sql.SQL(RESERVATIONS_PER_OWNER_QUERY)
+
+    num_rows_effected, entries, return_val = run_query(query, read_only=True)
 
     return [(entry['name'], entry['reservations_per_owner']) for entry in entries]
 
 
 # ---------------------------------- ADVANCED API: ----------------------------------
 
+# owners with apartments in as many locations as there are locations with apartments
+ALL_LOCATION_OWNERS_QUERY = "SELECT Owner.id, Owner.name " \
+                            "FROM OwnerLocationCount JOIN Owner ON Owner.id = OwnerLocationCount.owner_id " \
+                            "WHERE location_count > 0 " \
+                            "AND location_count = (SELECT COUNT(*) FROM Location WHERE apartment_count > 0) " \
+                            "ORDER BY Owner.id"
+
+
+@instrumented
 def get_all_location_owners() -> List[Owner]:
-    query = sql.SQL('''SELECT owner.id ,owner.name
-                    FROM owner 
-                        INNER JOIN ownedby ob
-                        ON owner.id = ob.owner_id
-                        INNER JOIN apartment a
-                        ON ob.apartment_id = a.id
-                    GROUP BY owner.id
-                        HAVING COUNT(DISTINCT (city, country)) in (SELECT COUNT(DISTINCT (city, country)) FROM apartment)''')
-    num_rows_effected, entries, return_val = run_query(query)
+    query = sql.SQL(ALL_LOCATION_OWNERS_QUERY)
+
+    num_rows_effected, entries, return_val = run_query(query, read_only=True)
 
     return [Owner(entry['id'], entry['name']) for entry in entries]
 
 
-def best_value_for_money() -> Apartment:
-    query = sql.SQL('''
+BEST_VALUE_FOR_MONEY_QUERY = '''
     SELECT * FROM apartment
             LEFT OUTER JOIN
             (SELECT T.apartment_id as id, average_rating / T.average_cost as value_for_money
@@ -483,26 +1454,44 @@ def best_value_for_money() -> Apartment:
             USING(apartment_id)) as vfm
 			USING(id)
 			ORDER BY COALESCE(value_for_money, 0 ) DESC, id ASC
-			LIMIT 1''')
-    num_rows_effected, entries, return_val = run_query(query)
+			LIMIT 1'''
+
+
+@instrumented
+def best_value_for_money() -> Apartment:
+    query = sql.SQL(BEST_VALUE_FOR_MONEY_QUERY)
+    num_rows_effected, entries, return_val = run_query(query, read_only=True)
     entry = entries[0]
     return Apartment(id=entry['id'], address=entry['address'], city=entry['city'], country=entry['country'], size=entry['size'])
 
 
-def profit_per_month(year: int) -> List[Tuple[int, float]]:
-    query = sql.SQL('''SELECT  T2.month as month, 0.15 * SUM(CASE WHEN T.total_price IS NULL THEN 0 ELSE T.total_price END) as profit
-                FROM (SELECT total_price, EXTRACT(MONTH FROM DATE(end_date)) as month ,EXTRACT(YEAR FROM DATE(end_date))  as year FROM reservations WHERE EXTRACT(YEAR FROM DATE(end_date)) = {year}) as T
+# computed from Reservations, the end_date range can use the reservations_end_date index
+# total_price summed as NUMERIC like in MonthlyRevenue, so both give the same profit to the last digit
+PROFIT_PER_MONTH_QUERY = '''SELECT  T2.month as month, (0.15 * COALESCE(SUM(T.total_price::NUMERIC), 0))::DOUBLE PRECISION as profit
+                FROM (SELECT total_price, EXTRACT(MONTH FROM end_date) as month FROM reservations
+                      WHERE end_date >= make_date({year}, 1, 1) AND end_date < make_date({year} + 1, 1, 1)) as T
                 RIGHT OUTER JOIN (SELECT * FROM (VALUES (1), (2), (3), (4), (5),(6), (7), (8), (9), (10), (11), (12)) as t (month) ) T2
                 ON T.month = T2.month
                 GROUP BY T2.month
                 ORDER BY month ASC
-                '''.format(year=year))
-    num_rows_effected, entries, return_val = run_query(query)
+                '''
+
+# the 12 rows of the year in MonthlyRevenue
+PROFIT_PER_MONTH_ROLLUP_QUERY = "SELECT months.month, (0.15 * COALESCE(r.revenue, 0))::DOUBLE PRECISION AS profit " \
+                                "FROM generate_series(1, 12) AS months(month) " \
+                                "LEFT OUTER JOIN MonthlyRevenue AS r ON r.year = {year} AND r.month = months.month " \
+                                "ORDER BY months.month"
+
+
+@instrumented
+def profit_per_month(year: int, from_rollup=True) -> List[Tuple[int, float]]:
+    query = sql.SQL(PROFIT_PER_MONTH_ROLLUP_QUERY if from_rollup else PROFIT_PER_MONTH_QUERY) \
+        .format(year=sql.Literal(year))
+    num_rows_effected, entries, return_val = run_query(query, read_only=True)
     return [(entry['month'], entry['profit']) for entry in entries]
 
 
-def get_apartment_recommendation(customer_id: int) -> List[Tuple[Apartment, float]]:
-    query = sql.SQL('''SELECT * FROM 
+APARTMENT_RECOMMENDATION_QUERY = '''SELECT * FROM 
                         apartment JOIN
                             (SELECT  
                             others_reviews.apartment_id as "id", 
@@ -510,13 +1499,278 @@ def get_apartment_recommendation(customer_id: int) -> List[Tuple[Apartment, floa
                                 WHEN others_reviews.rating*rating_ratio.rating_ratio > 10 THEN 10.0 
                                 WHEN others_reviews.rating*rating_ratio.rating_ratio < 1 THEN 1.0
                                 ELSE others_reviews.rating*rating_ratio.rating_ratio END) as "approx"
-                            FROM (SELECT * FROM reviews where apartment_id NOT IN (SELECT apartment_id FROM reviews WHERE customer_id ={id})) as others_reviews
-                            INNER JOIN (SELECT * FROM  rating_ratio WHERE to_customer = {id}) rating_ratio
+                            FROM (SELECT * FROM  rating_ratio WHERE to_customer = {id}) rating_ratio
+                            INNER JOIN reviews as others_reviews
                             ON rating_ratio.from_customer = others_reviews.customer_id
+                            WHERE others_reviews.apartment_id NOT IN (SELECT apartment_id FROM reviews WHERE customer_id ={id})
                             GROUP BY others_reviews.apartment_id) as T
-                        USING(id)'''.format(id=customer_id))
-    _, entries, _ = run_query(query)
+                        USING(id)
+                        ORDER BY id'''
+
+
+@instrumented
+def get_apartment_recommendation(customer_id: int) -> List[Tuple[Apartment, float]]:
+    query = sql.SQL(APARTMENT_RECOMMENDATION_QUERY).format(id=sql.Literal(customer_id))
+    _, entries, _ = run_query(query, read_only=True)
     return [(Apartment(id=entry['id'], address=entry['address'], city=entry['city'], country=entry['country'], size=entry['size']), float(entry['approx'])) for entry in entries]
 
 
+# ---------------------------------- BULK API: ----------------------------------
+
+# rows per multi-row INSERT statement
+BULK_INSERT_CHUNK_SIZE = 1000
+
+
+# inserts values_list (tuples in the order of columns, None for items with bad params) with multi-row
+# INSERT ... ON CONFLICT DO NOTHING statements and returns a ReturnValue per item
+# items that collide on one of unique_keys inside the batch go in a later round, so the outcome is the
+# same as adding the items one by one
+# a chunk that fails as a whole (e.g. a value the database rejects) is retried item by item with add_one
+def _bulk_insert(table: str, columns: List[str], values_list: list, unique_keys: list, add_one) -> List[ReturnValue]:
+    results = [ReturnValue.BAD_PARAMS if values is None else None for values in values_list]
+    pending = [i for i, values in enumerate(values_list) if values is not None]
+
+    while pending:
+        seen = [set() for _ in unique_keys]
+        current_round, next_round = [], []
+        for i in pending:
+            keys = [key(values_list[i]) for key in unique_keys]
+            clashes = any(key in keys_seen for key, keys_seen in zip(keys, seen))
+            # a deferred item still holds its keys, so later items sharing one wait behind it and the results
+            # stay those of inserting one at a time in list order
+            for key, keys_seen in zip(keys, seen):
+                keys_seen.add(key)
+            (next_round if clashes else current_round).append(i)
+
+        for start in range(0, len(current_round), BULK_INSERT_CHUNK_SIZE):
+            chunk = current_round[start:start + BULK_INSERT_CHUNK_SIZE]
+            rows = sql.SQL(", ").join(
+                sql.SQL("({})").format(sql.SQL(", ").join(sql.Literal(value) for value in values_list[i]))
+                for i in chunk)
+            query = sql.SQL("INSERT INTO {table}({columns}) VALUES {rows} ON CONFLICT DO NOTHING RETURNING id") \
+                .format(table=sql.Identifier(table), columns=sql.SQL(", ").join(map(sql.Identifier, columns)),
+                        rows=rows)
+
+            _, entries, return_val = run_query(query)
+
+            if return_val == ReturnValue.OK:
+                inserted = {entry['id'] for entry in entries}
+                for i in chunk:
+                    results[i] = ReturnValue.OK if values_list[i][0] in inserted else ReturnValue.ALREADY_EXISTS
+            else:
+                for i in chunk:
+                    results[i] = add_one(values_list[i])
+
+        pending = next_round
+
+    # the tags of the cached rows are named after the tables
+    added = [(table, values[0]) for values, result in zip(values_list, results) if result == ReturnValue.OK]
+    if added:
+        _invalidate(*added)
+
+    return results
+
+
+@instrumented
+def add_owners(owners: List[Owner]) -> List[ReturnValue]:
+    return _bulk_insert("owner", ["id", "name"], [_owner_values(owner) for owner in owners],
+                        [lambda values: values[0]],
+                        lambda values: run_query(ADD_OWNER, values)[2])
+
+
+@instrumented
+def add_customers(customers: List[Customer]) -> List[ReturnValue]:
+    return _bulk_insert("customer", ["id", "name"], [_customer_values(customer) for customer in customers],
+                        [lambda values: values[0]],
+                        lambda values: run_query(ADD_CUSTOMER, values)[2])
+
+
+@instrumented
+def add_apartments(apartments: List[Apartment]) -> List[ReturnValue]:
+    return _bulk_insert("apartment", ["id", "address", "city", "country", "size"],
+                        [_apartment_values(apartment) for apartment in apartments],
+                        [lambda values: values[0], lambda values: values[1:4]],
+                        lambda values: run_query(ADD_APARTMENT, values)[2])
+
+
+# ---------------------------------- CSV LOADERS: ----------------------------------
+# nightly backfill of reservations and reviews: the CSV is streamed through COPY into a temporary staging
+# table and the rules of customer_made_reservation / customer_reviewed_apartment are applied set-wise there
+# rows that would have been refused are written to reject_path with the ReturnValue name they would have got
+# the first line of the CSV is a header naming the columns, rejects are identified by their row number in the
+# file (the header being row 1)
+
+RESERVATION_CSV_COLUMNS = ["customer_id", "apartment_id", "start_date", "end_date", "total_price"]
+
+REVIEW_CSV_COLUMNS = ["customer_id", "apartment_id", "date", "rating", "review_text"]
+
+
+def _reservation_csv_values(row: dict):
+    try:
+        customer_id, apartment_id = int(row['customer_id']), int(row['apartment_id'])
+        start_date, end_date = date.fromisoformat(row['start_date'].strip()), date.fromisoformat(row['end_date'].strip())
+        total_price = float(row['total_price'])
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+    if customer_id <= 0 or apartment_id <= 0 or start_date >= end_date or total_price <= 0:
+        return None
+    return customer_id, apartment_id, start_date.isoformat(), end_date.isoformat(), total_price
+
+
+def _review_csv_values(row: dict):
+    try:
+        customer_id, apartment_id = int(row['customer_id']), int(row['apartment_id'])
+        review_date = date.fromisoformat(row['date'].strip())
+        rating = int(row['rating'])
+        review_text = row['review_text']
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+    if customer_id <= 0 or apartment_id <= 0 or rating < 1 or rating > 10 or review_text is None:
+        return None
+    return customer_id, apartment_id, review_date.isoformat(), rating, review_text
+
+
+# what the rules read stays as it is until the INSERT commits: the referenced customers and apartments can't be
+# deleted, and SHARE ROW EXCLUSIVE keeps out other writers of Reservations (and a concurrent load) but not readers
+def _apply_reservation_rules(conn: Connector.DBConnector):
+    conn.execute("LOCK TABLE Reservations IN SHARE ROW EXCLUSIVE MODE;"
+                 "SELECT 1 FROM Customer WHERE id IN (SELECT customer_id FROM reservations_staging) "
+                 "ORDER BY id FOR KEY SHARE;"
+                 "SELECT 1 FROM Apartment WHERE id IN (SELECT apartment_id FROM reservations_staging) "
+                 "ORDER BY id FOR KEY SHARE;"
+                 "CREATE INDEX ON reservations_staging(apartment_id, start_date);"
+                 "ANALYZE reservations_staging;"
+                 "UPDATE reservations_staging SET reason = 'NOT_EXISTS' "
+                 "WHERE NOT EXISTS (SELECT 1 FROM Customer WHERE id = customer_id) "
+                 "OR NOT EXISTS (SELECT 1 FROM Apartment WHERE id = apartment_id);"
+                 "UPDATE reservations_staging AS s SET reason = 'BAD_PARAMS' "
+                 "WHERE reason IS NULL AND EXISTS "
+                 "(SELECT 1 FROM Reservations AS r "
+                 " WHERE int4range(r.apartment_id, r.apartment_id, '[]') "
+                 "    && int4range(s.apartment_id, s.apartment_id, '[]') "
+                 " AND r.stay && daterange(s.start_date, s.end_date))")
+
+    # reservations of the batch overlapping each other: like consecutive customer_made_reservation calls, the
+    # earlier line wins, which needs the accepted set so far, so only the conflicting rows are resolved here
+    _, entries = conn.execute("SELECT line_no, apartment_id, start_date, end_date FROM reservations_staging AS s "
+                              "WHERE reason IS NULL AND EXISTS "
+                              "(SELECT 1 FROM reservations_staging AS o "
+                              " WHERE o.reason IS NULL AND o.line_no <> s.line_no AND o.apartment_id = s.apartment_id "
+                              " AND o.start_date < s.end_date AND o.end_date > s.start_date) "
+                              "ORDER BY line_no")
+    accepted = {}
+    overlapping = []
+    for entry in entries:
+        stays = accepted.setdefault(entry['apartment_id'], [])
+        if any(start < entry['end_date'] and end > entry['start_date'] for start, end in stays):
+            overlapping.append(entry['line_no'])
+        else:
+            stays.append((entry['start_date'], entry['end_date']))
+    if overlapping:
+        conn.execute("UPDATE reservations_staging SET reason = 'BAD_PARAMS' WHERE line_no = ANY(%s)",
+                     params=(overlapping,))
+
+
+# the reservations a review relies on can't change until the INSERT commits (SHARE keeps out writers, not
+# readers), nor can the reviewing customers and the apartments, and no other review is written meanwhile
+def _apply_review_rules(conn: Connector.DBConnector):
+    conn.execute("LOCK TABLE Reservations IN SHARE MODE;"
+                 "LOCK TABLE Reviews IN SHARE ROW EXCLUSIVE MODE;"
+                 "SELECT 1 FROM Customer WHERE id IN (SELECT customer_id FROM reviews_staging) "
+                 "ORDER BY id FOR KEY SHARE;"
+                 "SELECT 1 FROM Apartment WHERE id IN (SELECT apartment_id FROM reviews_staging) "
+                 "ORDER BY id FOR KEY SHARE;"
+                 "CREATE INDEX ON reviews_staging(customer_id, apartment_id);"
+                 "ANALYZE reviews_staging;"
+                 "UPDATE reviews_staging AS s SET reason = 'NOT_EXISTS' "
+                 "WHERE NOT EXISTS "
+                 "(SELECT 1 FROM Reservations AS r "
+                 " WHERE r.customer_id = s.customer_id AND r.apartment_id = s.apartment_id AND r.end_date <= s.date);"
+                 "UPDATE reviews_staging AS s SET reason = 'ALREADY_EXISTS' "
+                 "WHERE reason IS NULL AND EXISTS "
+                 "(SELECT 1 FROM Reviews AS r WHERE r.customer_id = s.customer_id AND r.apartment_id = s.apartment_id);"
+                 "UPDATE reviews_staging AS s SET reason = 'ALREADY_EXISTS' "
+                 "WHERE reason IS NULL AND EXISTS "
+                 "(SELECT 1 FROM reviews_staging AS o "
+                 " WHERE o.reason IS NULL AND o.customer_id = s.customer_id AND o.apartment_id = s.apartment_id "
+                 " AND o.line_no < s.line_no)")
+
+
+# streams csv_path through COPY into staging (a temporary table with staging_columns), applies the rules and
+# moves the accepted rows into target, the rules and the INSERT run in one transaction, so the rows are checked
+# against the data they are inserted into (apply_rules takes the locks it needs)
+# returns (rows loaded, rows rejected), database errors are raised to the caller
+def _load_csv(csv_path: str, reject_path: str, columns: List[str], parse, staging: str, staging_columns: str,
+              apply_rules, target: str) -> Tuple[int, int]:
+    rejects = []  # (row, values, reason) of rows refused before reaching the database
+    column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+    conn = None
 
+    with open(csv_path, newline='') as csv_file, tempfile.TemporaryFile(mode='w+', newline='') as copy_file:
+        reader = csv.DictReader(csv_file)
+        writer = csv.writer(copy_file)
+        for row_no, row in enumerate(reader, start=2):
+            values = parse(row)
+            if values is None:
+                rejects.append((row_no, [row.get(column) for column in columns], ReturnValue.BAD_PARAMS.name))
+            else:
+                writer.writerow((row_no,) + values)
+        copy_file.seek(0)
+
+        try:
+            conn = Connector.DBConnector()
+            conn.execute(sql.SQL("DROP TABLE IF EXISTS {staging};"
+                                 "CREATE TEMP TABLE {staging}(line_no INTEGER PRIMARY KEY, {columns}, reason TEXT)")
+                         .format(staging=sql.Identifier(staging), columns=sql.SQL(staging_columns)))
+            conn.copy_from(sql.SQL("COPY {staging}(line_no, {columns}) FROM STDIN WITH (FORMAT csv)")
+                           .format(staging=sql.Identifier(staging), columns=column_list), copy_file)
+
+            conn.begin()
+            apply_rules(conn)
+
+            loaded, _ = conn.execute(sql.SQL("INSERT INTO {target}({columns}) "
+                                             "SELECT {columns} FROM {staging} WHERE reason IS NULL ORDER BY line_no")
+                                     .format(target=sql.Identifier(target), columns=column_list,
+                                             staging=sql.Identifier(staging)))
+            conn.commit()
+
+            staged_rejects = ((entry['line_no'], [entry[column] for column in columns], entry['reason'])
+                              for entry in conn.stream(sql.SQL("SELECT * FROM {staging} WHERE reason IS NOT NULL "
+                                                               "ORDER BY line_no")
+                                                       .format(staging=sql.Identifier(staging))))
+            rejected = 0
+            reject_file = open(reject_path, 'w', newline='') if reject_path is not None else None
+            try:
+                reject_writer = csv.writer(reject_file) if reject_file is not None else None
+                if reject_writer is not None:
+                    reject_writer.writerow(["row"] + columns + ["reason"])
+                for row_no, values, reason in heapq.merge(rejects, staged_rejects, key=lambda reject: reject[0]):
+                    rejected += 1
+                    if reject_writer is not None:
+                        reject_writer.writerow([row_no] + values + [reason])
+            finally:
+                if reject_file is not None:
+                    reject_file.close()
+
+            conn.execute(sql.SQL("DROP TABLE {staging}").format(staging=sql.Identifier(staging)))
+            return loaded, rejected
+
+        finally:
+            if conn is not None:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.close()
+
+
+@instrumented
+def load_reservations_csv(csv_path: str, reject_path: str = None) -> Tuple[int, int]:
+    return _load_csv(csv_path, reject_path, RESERVATION_CSV_COLUMNS, _reservation_csv_values, "reservations_staging",
+                     "customer_id INTEGER, apartment_id INTEGER, start_date DATE, end_date DATE, total_price FLOAT",
+                     _apply_reservation_rules, "reservations")
+
+
+@instrumented
+def load_reviews_csv(csv_path: str, reject_path: str = None) -> Tuple[int, int]:
+    return _load_csv(csv_path, reject_path, REVIEW_CSV_COLUMNS, _review_csv_values, "reviews_staging",
+                     "customer_id INTEGER, apartment_id INTEGER, date DATE, rating INTEGER, review_text TEXT",
+                     _apply_review_rules, "reviews")
@@ -1,12 +1,104 @@
+import os
 import unittest
+from psycopg2 import extensions
 import Solution as Solution
+from Utility.DBConnector import DBConnector
+
+'''
+    TEST_FIXTURE=template runs each test class in its own database, cloned (CREATE DATABASE ... TEMPLATE, a file
+    copy) from a template database the schema is built into once, the clone is dropped after the class
+    by default the test classes share the configured database
+'''
+TEST_FIXTURE = os.environ.get("TEST_FIXTURE", "schema")
+
+_template_ready = False
+
+
+# database settings with dbname switched to database, as a DSN for DBConnector.reload_config
+def _dsn(database: str) -> str:
+    params = DBConnector.config()
+    params.pop("database", None)
+    params["dbname"] = database
+    return extensions.make_dsn(**params)
+
+
+def _database_name() -> str:
+    params = DBConnector.config()
+    return params.get("dbname", params.get("database"))
+
+
+# runs a statement that can't run in a transaction (CREATE / DROP DATABASE) on the configured database
+def _execute_autocommit(query: str):
+    conn = DBConnector()
+    try:
+        conn.connection.autocommit = True
+        conn.execute(query)
+    finally:
+        conn.connection.autocommit = False
+        conn.close()
+
+
+# creates a clone of the template database and points DBConnector at it, returns the name of the clone
+def _clone_template(name: str) -> str:
+    global _template_ready
+    base = _database_name()
+    # a template per worker (see DBConnector.schema), workers can't copy a template another one is building
+    schema = DBConnector.schema()
+    template = base + "_template" + ("_" + schema if schema is not None else "")
+    if not _template_ready:
+        conn = DBConnector()
+        try:
+            _, entries = conn.execute("SELECT 1 FROM pg_database WHERE datname = %s", params=(template,))
+        finally:
+            conn.close()
+        if not entries.rows:
+            _execute_autocommit('CREATE DATABASE "%s"' % template)
+        # a no-op while the schema in the template is up to date
+        DBConnector.reload_config(_dsn(template))
+        Solution.create_tables()
+        # nobody may stay connected to a template while it is copied
+        DBConnector.reload_config()
+        _template_ready = True
+
+    clone = "%s_%s_%d" % (base, name.lower(), os.getpid())
+    _execute_autocommit('DROP DATABASE IF EXISTS "%s"' % clone)
+    _execute_autocommit('CREATE DATABASE "%s" TEMPLATE "%s"' % (clone, template))
+    DBConnector.reload_config(_dsn(clone))
+    return clone
+
+
+# points DBConnector back at the configured database and drops the clone
+def _drop_clone(clone: str):
+    DBConnector.reload_config()
+    _execute_autocommit('DROP DATABASE IF EXISTS "%s" WITH (FORCE)' % clone)
 
 
 class AbstractTest(unittest.TestCase):
-    # before each test, setUp is executed
+    # True runs each test in a Solution.transaction() that is rolled back instead of emptying the tables after it,
+    # only for tests calling Solution from the thread of the test (other connections don't see the writes)
+    rollback = False
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.clone = _clone_template(cls.__name__) if TEST_FIXTURE == "template" else None
+
+    # before each test, setUp is executed (a no-op while the schema is up to date)
     def setUp(self) -> None:
         Solution.create_tables()
+        if self.rollback:
+            transaction = Solution.transaction(rollback=True)
+            transaction.__enter__()
+            self.addCleanup(transaction.__exit__, None, None, None)
 
     # after each test, tearDown is executed
     def tearDown(self) -> None:
-        Solution.drop_tables()
+        if not self.rollback:
+            Solution.clear_tables()
+
+    # after the last test of the class
+    @classmethod
+    def tearDownClass(cls) -> None:
+        if cls.clone is not None:
+            _drop_clone(cls.clone)
+        else:
+            Solution.drop_tables()
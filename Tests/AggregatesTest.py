@@ -0,0 +1,195 @@
+import unittest
+import threading
+import time
+from datetime import date
+import Solution
+from Utility.DBConnector import DBConnector
+from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest
+
+from Business.Apartment import Apartment
+from Business.Customer import Customer
+from Business.Owner import Owner
+
+
+class AggregatesTest(AbstractTest):
+    # apartments 1, 2 owned by owner 1, customers 1-3 stayed in both
+    def setUp(self) -> None:
+        super().setUp()
+        Solution.add_owner(Owner(1, 'o1'))
+        for apartment_id in (1, 2):
+            Solution.add_apartment(Apartment(apartment_id, 'a%d' % apartment_id, 'Haifa', 'Israel', 50))
+            Solution.owner_owns_apartment(1, apartment_id)
+        for customer_id in (1, 2, 3):
+            Solution.add_customer(Customer(customer_id, 'c%d' % customer_id))
+            for apartment_id in (1, 2):
+                Solution.customer_made_reservation(customer_id, apartment_id, date(2020, customer_id, 1),
+                                                   date(2020, customer_id, 5), 100)
+
+    def test_apartment_rating_stats(self) -> None:
+        self.assertEqual(0, Solution.get_apartment_rating(1), 'no reviews')
+        for customer_id, rating in ((1, 7), (2, 8), (3, 8)):
+            self.assertEqual(ReturnValue.OK, Solution.customer_reviewed_apartment(customer_id, 1, date(2021, 1, 1),
+                                                                                  rating, 'text'))
+        self.assertAlmostEqual(23 / 3, float(Solution.get_apartment_rating(1)), msg='inserts')
+        Solution.customer_updated_review(3, 1, date(2021, 2, 1), 2, 'worse')
+        self.assertAlmostEqual(17 / 3, float(Solution.get_apartment_rating(1)), msg='update')
+        Solution.delete_customer(1)
+        self.assertAlmostEqual(5, float(Solution.get_apartment_rating(1)), msg='cascaded delete')
+        self.assertAlmostEqual(5 / 2, float(Solution.get_owner_rating(1)), msg='owner rating')
+        self.assertEqual(0, Solution.rebuild_apartment_rating_stats(), 'stats consistent')
+
+        conn = DBConnector()
+        try:
+            conn.execute("UPDATE ApartmentRatingStats SET rating_sum = 0")
+        finally:
+            conn.close()
+        self.assertEqual(1, Solution.rebuild_apartment_rating_stats(), 'one apartment corrected')
+        self.assertAlmostEqual(5, float(Solution.get_apartment_rating(1)), msg='rebuilt')
+        self.assertEqual(ReturnValue.OK, Solution.delete_apartment(1), 'stats go with the apartment')
+        self.assertEqual(0, Solution.rebuild_apartment_rating_stats(), 'stats consistent after the delete')
+
+    # rating_ratio matches the self join of Reviews, returns the number of pairs stored
+    def assertRatingRatioConsistent(self, msg) -> int:
+        conn = DBConnector()
+        try:
+            _, entries = conn.execute(
+                "(SELECT from_customer, to_customer, ROUND(rating_ratio, 12) FROM rating_ratio "
+                " EXCEPT SELECT f.customer_id, t.customer_id, ROUND(AVG(t.rating::NUMERIC / f.rating), 12) FROM Reviews AS f "
+                " JOIN Reviews AS t ON f.apartment_id = t.apartment_id AND f.customer_id <> t.customer_id "
+                " GROUP BY f.customer_id, t.customer_id) "
+                "UNION ALL "
+                "(SELECT f.customer_id, t.customer_id, ROUND(AVG(t.rating::NUMERIC / f.rating), 12) FROM Reviews AS f "
+                " JOIN Reviews AS t ON f.apartment_id = t.apartment_id AND f.customer_id <> t.customer_id "
+                " GROUP BY f.customer_id, t.customer_id "
+                " EXCEPT SELECT from_customer, to_customer, ROUND(rating_ratio, 12) FROM rating_ratio)")
+            _, pairs = conn.execute("SELECT COUNT(*) AS c FROM RatingRatio")
+        finally:
+            conn.close()
+        self.assertEqual([], list(entries), msg)
+        return pairs[0]['c']
+
+    def test_rating_ratio(self) -> None:
+        for customer_id, apartment_id, rating in ((1, 1, 7), (2, 1, 3), (3, 1, 9), (1, 2, 2), (2, 2, 10)):
+            Solution.customer_reviewed_apartment(customer_id, apartment_id, date(2021, 1, 1), rating, 'text')
+        self.assertEqual(6, self.assertRatingRatioConsistent('inserts'), 'every ordered pair of apartment 1')
+        Solution.customer_updated_review(2, 1, date(2021, 2, 1), 6, 'better')
+        self.assertRatingRatioConsistent('update')
+        # (2 * 9 / 7 + min(10 * 9 / 6, 10)) / 2
+        self.assertEqual([(Apartment(2, 'a2', 'Haifa', 'Israel', 50), 44 / 7)],
+                         Solution.get_apartment_recommendation(3), 'recommendation from the pairs')
+        Solution.delete_customer(3)
+        self.assertEqual(2, self.assertRatingRatioConsistent('customer removed'), 'pairs of customer 3 deleted')
+        Solution.delete_apartment(2)
+        self.assertRatingRatioConsistent('apartment removed')
+        conn = DBConnector()
+        try:
+            conn.execute("DELETE FROM Reviews")
+        finally:
+            conn.close()
+        self.assertEqual(0, self.assertRatingRatioConsistent('multi-row delete'), 'no pairs left')
+
+    def test_rating_ratio_rebuild(self) -> None:
+        for customer_id, rating in ((1, 7), (2, 3), (3, 9)):
+            Solution.customer_reviewed_apartment(customer_id, 1, date(2021, 1, 1), rating, 'text')
+        self.assertEqual(0, Solution.rebuild_rating_ratio(), 'pairs consistent')
+        conn = DBConnector()
+        try:
+            conn.execute("UPDATE RatingRatio SET ratio_sum = 0 WHERE from_customer = 1;"
+                         "DELETE FROM RatingRatio WHERE from_customer = 3 AND to_customer = 2")
+        finally:
+            conn.close()
+        self.assertEqual(3, Solution.rebuild_rating_ratio(), 'two wrong pairs and a missing one corrected')
+        self.assertEqual(6, self.assertRatingRatioConsistent('rebuilt'))
+
+    def test_concurrent_reviews(self) -> None:
+        first, second = DBConnector(), DBConnector()
+        try:
+            first.begin()
+            first.execute("INSERT INTO Reviews VALUES (1, 1, '2021-01-01', 7, 'first')")
+
+            def review():
+                second.begin()
+                second.execute("INSERT INTO Reviews VALUES (2, 1, '2021-01-01', 3, 'second')")
+                second.commit()
+
+            thread = threading.Thread(target=review)
+            thread.start()
+            # the second review is written, its trigger waits for the first transaction
+            conn = DBConnector()
+            try:
+                deadline = time.monotonic() + 5
+                while thread.is_alive() and time.monotonic() < deadline:
+                    _, entries = conn.execute("SELECT COUNT(*) AS c FROM pg_locks "
+                                              "WHERE locktype = 'advisory' AND NOT granted")
+                    if entries[0]['c']:
+                        break
+                    time.sleep(0.01)
+            finally:
+                conn.close()
+            first.commit()
+            thread.join()
+        finally:
+            first.close()
+            second.close()
+        self.assertEqual(2, self.assertRatingRatioConsistent('both orders of the pair counted'))
+        self.assertEqual(0, Solution.rebuild_rating_ratio(), 'pairs consistent')
+
+    def test_monthly_revenue(self) -> None:
+        expected = [(month, 0.15 * 200 if month <= 3 else 0) for month in range(1, 13)]
+        self.assertEqual(expected, Solution.profit_per_month(2020), 'from the rollup')
+        self.assertEqual(expected, Solution.profit_per_month(2020, from_rollup=False), 'from Reservations')
+        Solution.customer_cancelled_reservation(1, 1, date(2020, 1, 1))
+        Solution.delete_apartment(2)
+        Solution.customer_made_reservation(1, 1, date(2020, 12, 30), date(2021, 1, 2), 50.5)
+        expected = [(month, 0.15 * 100 if month in (2, 3) else 0) for month in range(1, 13)]
+        self.assertEqual(expected, Solution.profit_per_month(2020), 'cancellation and cascaded delete')
+        self.assertEqual(expected, Solution.profit_per_month(2020, from_rollup=False), 'same from Reservations')
+        self.assertAlmostEqual(0.15 * 50.5, Solution.profit_per_month(2021)[0][1], msg='counted on the end date')
+        # prices with no exact binary form, REAL sums of these drift in the last digits
+        for customer_id, price in ((1, 100.1), (2, 33.3), (3, 19.99)):
+            Solution.customer_made_reservation(customer_id, 1, date(2022, 1, customer_id * 5),
+                                               date(2022, 1, customer_id * 5 + 2), price)
+        self.assertEqual(23.0085, Solution.profit_per_month(2022)[0][1], 'exact from the rollup')
+        self.assertEqual(Solution.profit_per_month(2022), Solution.profit_per_month(2022, from_rollup=False),
+                         'exact from Reservations')
+
+    def test_reservation_counters(self) -> None:
+        Solution.add_customer(Customer(4, 'c4'))
+        Solution.add_owner(Owner(2, 'o2'))
+        self.assertEqual(Customer(1, 'c1'), Solution.get_top_customer(), 'tie broken by id')
+        Solution.customer_cancelled_reservation(1, 1, date(2020, 1, 1))
+        self.assertEqual(Customer(2, 'c2'), Solution.get_top_customer(), 'cancellation counted')
+        Solution.delete_customer(2)
+        Solution.delete_customer(3)
+        self.assertEqual(Customer(1, 'c1'), Solution.get_top_customer(), 'one reservation beats none')
+        self.assertEqual([('o1', 1), ('o2', 0)], sorted(Solution.reservations_per_owner()), 'cascaded deletes')
+        Solution.delete_apartment(2)
+        self.assertEqual(Customer(1, 'c1'), Solution.get_top_customer(), 'customers without reservations tie')
+        self.assertEqual([('o1', 0), ('o2', 0)], sorted(Solution.reservations_per_owner()), 'apartment removed')
+
+    def test_location_owners(self) -> None:
+        self.assertEqual([Owner(1, 'o1')], Solution.get_all_location_owners(), 'one location')
+        Solution.add_owner(Owner(2, 'o2'))
+        Solution.add_apartments([Apartment(3, 'a3', 'Akko', 'Israel', 50), Apartment(4, 'a4', 'Akko', 'Israel', 50),
+                                 Apartment(5, 'a3', 'Akko', 'Israel', 50),  # duplicate address, not added
+                                 Apartment(6, 'a6', 'Haifa', 'Israel', 50)])
+        self.assertEqual([], Solution.get_all_location_owners(), 'new location without owners')
+        Solution.owner_owns_apartment(2, 3)
+        Solution.owner_owns_apartment(2, 4)
+        Solution.owner_owns_apartment(2, 6)
+        self.assertEqual([Owner(2, 'o2')], Solution.get_all_location_owners(), 'owner 2 covers both')
+        Solution.owner_drops_apartment(2, 3)
+        self.assertEqual([Owner(2, 'o2')], Solution.get_all_location_owners(), 'still an apartment in Akko')
+        Solution.delete_apartment(4)
+        self.assertEqual([], Solution.get_all_location_owners(), 'Akko apartment left without owner 2')
+        Solution.delete_apartment(3)
+        self.assertEqual([Owner(1, 'o1'), Owner(2, 'o2')], Solution.get_all_location_owners(), 'Akko is empty')
+        for apartment_id in (1, 2, 6):
+            Solution.delete_apartment(apartment_id)
+        self.assertEqual([], Solution.get_all_location_owners(), 'no apartments')
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
@@ -0,0 +1,105 @@
+import unittest
+import asyncio
+from datetime import date
+from unittest import mock
+import Solution
+import AsyncSolution
+from Utility.AsyncDBConnector import AsyncDBConnector
+from Utility.DBConnector import DBConnector
+from Utility.ReturnValue import ReturnValue
+
+from Business.Apartment import Apartment
+from Business.Owner import Owner
+from Business.Customer import Customer
+
+
+class AsyncTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        Solution.create_tables()
+
+    def tearDown(self) -> None:
+        Solution.clear_tables()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        Solution.drop_tables()
+
+    async def test_crud(self) -> None:
+        self.assertEqual(ReturnValue.OK, await AsyncSolution.add_owner(Owner(1, 'o1')), 'regular owner')
+        self.assertEqual(ReturnValue.ALREADY_EXISTS, await AsyncSolution.add_owner(Owner(1, 'o1')), 'duplicate id')
+        self.assertEqual(ReturnValue.BAD_PARAMS, await AsyncSolution.add_owner(Owner(2, None)), 'invalid name')
+        self.assertEqual(Owner(1, 'o1'), await AsyncSolution.get_owner(1), 'get owner')
+        self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1), 'visible to the sync API')
+        self.assertEqual(ReturnValue.OK, await AsyncSolution.add_apartment(Apartment(1, 'a1', 'Haifa', 'Israel', 50)))
+        self.assertEqual(ReturnValue.OK, await AsyncSolution.owner_owns_apartment(1, 1))
+        self.assertEqual(Owner(1, 'o1'), await AsyncSolution.get_apartment_owner(1), 'apartment owner')
+        self.assertEqual([Apartment(1, 'a1', 'Haifa', 'Israel', 50)], await AsyncSolution.get_owner_apartments(1))
+        self.assertEqual(ReturnValue.OK, await AsyncSolution.delete_owner(1), 'delete owner')
+        self.assertEqual(Owner.bad_owner(), await AsyncSolution.get_apartment_owner(1), 'ownership cascaded')
+
+    async def test_reservations_and_analytics(self) -> None:
+        await asyncio.gather(AsyncSolution.add_customer(Customer(1, 'c1')), AsyncSolution.add_customer(Customer(2, 'c2')),
+                             AsyncSolution.add_apartment(Apartment(1, 'a1', 'Haifa', 'Israel', 50)),
+                             AsyncSolution.add_owner(Owner(1, 'o1')))
+        self.assertEqual(ReturnValue.OK, await AsyncSolution.owner_owns_apartment(1, 1))
+        self.assertEqual(ReturnValue.OK, await AsyncSolution.customer_made_reservation(1, 1, date(2021, 1, 1),
+                                                                                        date(2021, 1, 3), 200))
+        self.assertEqual(ReturnValue.BAD_PARAMS, await AsyncSolution.customer_made_reservation(2, 1, date(2021, 1, 2),
+                                                                                                date(2021, 1, 4), 200),
+                         'overlapping reservation')
+        self.assertEqual(ReturnValue.NOT_EXISTS, await AsyncSolution.customer_made_reservation(3, 1, date(2021, 2, 1),
+                                                                                                date(2021, 2, 4), 200),
+                         'missing customer')
+        self.assertEqual(ReturnValue.OK, await AsyncSolution.customer_reviewed_apartment(1, 1, date(2021, 1, 5), 8, 'ok'))
+        self.assertEqual(8, await AsyncSolution.get_apartment_rating(1), 'apartment rating')
+        self.assertEqual(8, await AsyncSolution.get_owner_rating(1), 'owner rating')
+        self.assertEqual(Customer(1, 'c1'), await AsyncSolution.get_top_customer(), 'top customer')
+        self.assertEqual([('o1', 1)], await AsyncSolution.reservations_per_owner(), 'reservations per owner')
+        self.assertEqual([Owner(1, 'o1')], await AsyncSolution.get_all_location_owners(), 'all location owners')
+        self.assertEqual(Apartment(1, 'a1', 'Haifa', 'Israel', 50), await AsyncSolution.best_value_for_money())
+        self.assertEqual(0.15 * 200, dict(await AsyncSolution.profit_per_month(2021))[1], 'profit in January')
+        self.assertLessEqual(AsyncDBConnector.pool_stats()['created'], 4, 'connections are pooled')
+
+
+    async def test_connection_returns_to_its_own_pool(self) -> None:
+        conn = await AsyncDBConnector.connect()
+        connection = conn.connection
+        AsyncDBConnector.configure_pool()
+        self.assertEqual(Owner.bad_owner(), await AsyncSolution.get_owner(1), 'served by a new pool')
+        await conn.close()
+        self.assertTrue(connection.closed, 'closed by the replaced pool')
+        stats = AsyncDBConnector.pool_stats()
+        self.assertEqual((0, 1), (stats['in_use'], stats['idle']), 'the new pool only holds its own connection')
+
+
+    async def test_database_errors(self) -> None:
+        with mock.patch.object(AsyncSolution, 'run_query', mock.AsyncMock(return_value=(None, None, ReturnValue.ERROR))):
+            self.assertEqual(Owner.bad_owner(), await AsyncSolution.get_owner(1))
+            self.assertEqual(Customer.bad_customer(), await AsyncSolution.get_customer(1))
+            self.assertEqual(Apartment.bad_apartment(), await AsyncSolution.get_apartment(1))
+            self.assertEqual(Owner.bad_owner(), await AsyncSolution.get_apartment_owner(1))
+            self.assertEqual(0, await AsyncSolution.get_apartment_rating(1))
+            self.assertEqual(0, await AsyncSolution.get_owner_rating(1))
+            self.assertEqual(Customer.bad_customer(), await AsyncSolution.get_top_customer())
+            self.assertEqual(Apartment.bad_apartment(), await AsyncSolution.best_value_for_money())
+
+
+    async def test_pool_follows_the_configuration(self) -> None:
+        self.assertEqual(ReturnValue.OK, await AsyncSolution.add_owner(Owner(1, 'o1')), 'pool of this event loop')
+        DBConnector.configure_schema('async_config_test')
+        try:
+            conn = await AsyncDBConnector.connect()
+            try:
+                _, entries = await conn.execute("SELECT current_setting('search_path') AS search_path")
+            finally:
+                await conn.close()
+            self.assertEqual('async_config_test', entries[0]['search_path'], 'the pool was rebuilt')
+            self.assertEqual(1, AsyncDBConnector.pool_stats()['created'], 'a new pool for the new configuration')
+        finally:
+            DBConnector.configure_schema()
+        self.assertEqual(Owner(1, 'o1'), await AsyncSolution.get_owner(1), 'back to the configured schema')
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
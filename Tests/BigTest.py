@@ -3,21 +3,11 @@ from Solution import *
 from Utility.ReturnValue import ReturnValue
 from datetime import date,datetime
 import time
+from Tests.AbstractTest import AbstractTest
 
-class TestCRUD(unittest.TestCase):
-
-    @classmethod
-    def setUpClass(cls):
-        create_tables()
-
-    #def setUp(self):
-        # This method will be called before each test
-        # Set up your test environment
-
-    def tearDown(self):
-        # This method will be called after each test
-        # Clean up your test environment
-        clear_tables()
+class TestCRUD(AbstractTest):
+    # each test is rolled back instead of emptying the tables after it
+    rollback = True
 
     def test_owner(self):
         print("Running Test: test_owner...")
@@ -608,11 +598,7 @@ class TestCRUD(unittest.TestCase):
         result = get_apartment_recommendation(15)
         self.assertEqual(result,[(Apartment(6, "RB", "Haifa", "ISR", 80),apt6),(Apartment(9, "RE", "Haifa", "Canada", 80),apt9)])
         print("// ==== test_Advanced_API2: SUCCESS! ==== //")
-        
 
-    @classmethod
-    def tearDownClass(cls):
-        drop_tables()
 
 
 if __name__ == "__main__":
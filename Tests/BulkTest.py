@@ -0,0 +1,58 @@
+import unittest
+import Solution
+from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest
+
+from Business.Apartment import Apartment
+from Business.Owner import Owner
+from Business.Customer import Customer
+
+
+class BulkTest(AbstractTest):
+    def test_add_owners(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(1, 'o1')), 'regular owner')
+        result = Solution.add_owners([Owner(1, 'again'), Owner(2, 'o2'), Owner(0, 'bad id'), Owner(3, None),
+                                      Owner(2, 'duplicate in batch'), Owner(4, 'o4')])
+        self.assertEqual([ReturnValue.ALREADY_EXISTS, ReturnValue.OK, ReturnValue.BAD_PARAMS, ReturnValue.BAD_PARAMS,
+                          ReturnValue.ALREADY_EXISTS, ReturnValue.OK], result, 'per item results')
+        self.assertEqual(Owner(2, 'o2'), Solution.get_owner(2), 'first of the duplicates wins')
+        self.assertEqual(Owner(4, 'o4'), Solution.get_owner(4), 'later items still inserted')
+        self.assertEqual([], Solution.add_owners([]), 'empty batch')
+
+    def test_add_customers_many_chunks(self) -> None:
+        customers = [Customer(i, 'c' + str(i)) for i in range(1, Solution.BULK_INSERT_CHUNK_SIZE * 2 + 10)]
+        result = Solution.add_customers(customers)
+        self.assertEqual([ReturnValue.OK] * len(customers), result, 'all inserted')
+        self.assertEqual(customers[-1], Solution.get_customer(len(customers)), 'last customer')
+
+    def test_add_apartments(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_apartment(Apartment(1, 'a1', 'Haifa', 'Israel', 50)), 'regular')
+        result = Solution.add_apartments([Apartment(2, 'a1', 'Haifa', 'Israel', 60),
+                                          Apartment(3, 'a3', 'Haifa', 'Israel', 60),
+                                          Apartment(4, 'a3', 'Haifa', 'Israel', 60),
+                                          Apartment(3, 'a5', 'Haifa', 'Israel', 60),
+                                          Apartment(5, 'a5', 'Haifa', 'Israel', 0),
+                                          Apartment(6, 'a6', 'Haifa', 'Israel', 70)])
+        self.assertEqual([ReturnValue.ALREADY_EXISTS, ReturnValue.OK, ReturnValue.ALREADY_EXISTS,
+                          ReturnValue.ALREADY_EXISTS, ReturnValue.BAD_PARAMS, ReturnValue.OK], result,
+                         'per item results')
+        self.assertEqual(Apartment(6, 'a6', 'Haifa', 'Israel', 70), Solution.get_apartment(6), 'inserted apartment')
+
+    def test_deferred_item_keeps_its_keys(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_apartment(Apartment(1, 'a1', 'Haifa', 'Israel', 50)), 'regular')
+        batch = [Apartment(1, 'x', 'Haifa', 'Israel', 60), Apartment(2, 'x', 'Haifa', 'Israel', 60),
+                 Apartment(2, 'y', 'Haifa', 'Israel', 60)]
+        self.assertEqual([ReturnValue.ALREADY_EXISTS, ReturnValue.OK, ReturnValue.ALREADY_EXISTS],
+                         Solution.add_apartments(batch), 'same results as one at a time')
+        self.assertEqual(Apartment(2, 'x', 'Haifa', 'Israel', 60), Solution.get_apartment(2), 'earlier item wins')
+
+    def test_rejected_row_does_not_abort_batch(self) -> None:
+        result = Solution.add_apartments([Apartment(1, 'a1', 'Haifa', 'Israel', 50),
+                                          Apartment(2, 'a2', 'Haifa', 'Israel', 2 ** 40),
+                                          Apartment(3, 'a3', 'Haifa', 'Israel', 50)])
+        self.assertEqual([ReturnValue.OK, ReturnValue.ERROR, ReturnValue.OK], result, 'only the bad row failed')
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
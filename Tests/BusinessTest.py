@@ -0,0 +1,27 @@
+import unittest
+
+from Business.Apartment import Apartment
+from Business.Customer import Customer
+from Business.Owner import Owner
+
+
+class BusinessTest(unittest.TestCase):
+    def test_value_types(self) -> None:
+        apartment = Apartment.from_row((1, 'a1', 'Haifa', 'Israel', 50))
+        self.assertEqual(Apartment(1, 'a1', 'Haifa', 'Israel', 50), apartment, 'from a row')
+        self.assertEqual(50, apartment.get_size())
+        self.assertEqual({apartment}, {Apartment(1, 'a1', 'Haifa', 'Israel', 80)}, 'size is not compared')
+        self.assertEqual(2, len({Owner.from_row((1, 'o1')), Owner(1, 'o1'), Owner(2, 'o1')}))
+        self.assertEqual({Customer(1, 'c1'): 1}, {Customer.from_row((1, 'c1')): 1}, 'usable as a key')
+        self.assertEqual(Owner.bad_owner(), Owner(), 'bad owner equals an empty one')
+        self.assertEqual(hash(Owner.bad_owner()), hash(Owner()))
+
+    def test_no_instance_dict(self) -> None:
+        for business in (Apartment(), Customer(), Owner()):
+            self.assertFalse(hasattr(business, '__dict__'), type(business).__name__)
+            self.assertRaises(AttributeError, setattr, business, 'extra', 1)
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
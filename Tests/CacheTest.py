@@ -0,0 +1,130 @@
+import unittest
+import asyncio
+import time
+import Solution
+import AsyncSolution
+from Utility.LRUCache import LRUCache
+from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest
+
+from Business.Apartment import Apartment
+from Business.Customer import Customer
+from Business.Owner import Owner
+
+
+class CacheTest(AbstractTest):
+    def setUp(self) -> None:
+        super().setUp()
+        Solution.configure_cache(max_size=100)
+
+    def tearDown(self) -> None:
+        Solution.configure_cache()
+        super().tearDown()
+
+    def assertCounts(self, hits, misses, msg=None) -> None:
+        stats = Solution.cache_stats()
+        self.assertEqual((hits, misses), (stats['hits'], stats['misses']), msg)
+
+    def test_read_through(self) -> None:
+        Solution.add_owner(Owner(1, 'o1'))
+        first = Solution.get_owner(1)
+        self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1))
+        self.assertIsNot(first, Solution.get_owner(1), 'a new object per call')
+        self.assertCounts(2, 1, 'one query')
+        self.assertEqual(Customer.bad_customer(), Solution.get_customer(1))
+        self.assertEqual(Customer.bad_customer(), Solution.get_customer(1), 'missing rows are cached too')
+        self.assertCounts(3, 2)
+        self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(1, 'c1')))
+        self.assertEqual(Customer(1, 'c1'), Solution.get_customer(1), 'add invalidates')
+        self.assertEqual(ReturnValue.OK, Solution.delete_customer(1))
+        self.assertEqual(Customer.bad_customer(), Solution.get_customer(1), 'delete invalidates')
+        self.assertEqual([ReturnValue.OK, ReturnValue.ALREADY_EXISTS],
+                         Solution.add_customers([Customer(1, 'c1'), Customer(1, 'c1')]))
+        self.assertEqual(Customer(1, 'c1'), Solution.get_customer(1), 'bulk add invalidates')
+
+    def test_apartment_owner_invalidation(self) -> None:
+        Solution.add_owner(Owner(1, 'o1'))
+        Solution.add_apartments([Apartment(1, 'a1', 'Haifa', 'Israel', 50), Apartment(2, 'a2', 'Haifa', 'Israel', 50)])
+        self.assertEqual(Owner.bad_owner(), Solution.get_apartment_owner(1))
+        Solution.owner_owns_apartment(1, 1)
+        self.assertEqual(Owner(1, 'o1'), Solution.get_apartment_owner(1), 'owns invalidates')
+        Solution.owner_drops_apartment(1, 1)
+        self.assertEqual(Owner.bad_owner(), Solution.get_apartment_owner(1), 'drops invalidates')
+        Solution.owner_owns_apartment(1, 1)
+        Solution.owner_owns_apartment(1, 2)
+        self.assertEqual(Owner(1, 'o1'), Solution.get_apartment_owner(2))
+        self.assertEqual(Apartment(2, 'a2', 'Haifa', 'Israel', 50), Solution.get_apartment(2))
+        Solution.delete_apartment(2)
+        self.assertEqual(Owner.bad_owner(), Solution.get_apartment_owner(2), 'apartment delete cascades')
+        self.assertEqual(Apartment.bad_apartment(), Solution.get_apartment(2))
+        self.assertEqual(Owner(1, 'o1'), Solution.get_apartment_owner(1))
+        Solution.delete_owner(1)
+        self.assertEqual(Owner.bad_owner(), Solution.get_apartment_owner(1), 'owner delete cascades')
+        self.assertEqual(Apartment(1, 'a1', 'Haifa', 'Israel', 50), Solution.get_apartment(1), 'apartment kept')
+
+    def test_async_writes_invalidate(self) -> None:
+        self.assertEqual(Owner.bad_owner(), Solution.get_owner(1))
+        self.assertEqual(ReturnValue.OK, asyncio.run(AsyncSolution.add_owner(Owner(1, 'o1'))))
+        self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1))
+        self.assertEqual(ReturnValue.OK, asyncio.run(AsyncSolution.delete_owner(1)))
+        self.assertEqual(Owner.bad_owner(), Solution.get_owner(1))
+
+    def test_transactions_bypass_the_cache(self) -> None:
+        Solution.add_owner(Owner(1, 'o1'))
+        self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1))
+        with Solution.transaction(rollback=True):
+            Solution.delete_owner(1)
+            self.assertEqual(Owner.bad_owner(), Solution.get_owner(1), 'sees its own writes')
+            Solution.add_owner(Owner(2, 'o2'))
+            self.assertCounts(0, 1, 'not read')
+        self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1), 'rolled back')
+        self.assertEqual(Owner.bad_owner(), Solution.get_owner(2))
+        with Solution.transaction():
+            Solution.delete_owner(1)
+        self.assertEqual(Owner.bad_owner(), Solution.get_owner(1), 'committed')
+
+    def test_schema_changes_clear(self) -> None:
+        Solution.add_owner(Owner(1, 'o1'))
+        Solution.get_owner(1)
+        Solution.clear_tables()
+        self.assertEqual(0, Solution.cache_stats()['size'])
+        self.assertEqual(Owner.bad_owner(), Solution.get_owner(1))
+
+
+class LRUCacheTest(unittest.TestCase):
+    def test_lru_eviction(self) -> None:
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual((True, 1), cache.get('a'))
+        cache.put('c', 3)
+        self.assertEqual((False, None), cache.get('b'), 'least recently used evicted')
+        self.assertEqual((True, 1), cache.get('a'))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_ttl(self) -> None:
+        cache = LRUCache(10, ttl=0.05)
+        cache.put('a', 1)
+        self.assertEqual((True, 1), cache.get('a'))
+        time.sleep(0.06)
+        self.assertEqual((False, None), cache.get('a'), 'expired')
+        self.assertEqual(1, cache.stats()['expirations'])
+
+    def test_tags_and_tokens(self) -> None:
+        cache = LRUCache(10)
+        cache.put('a', 1, ['x'])
+        cache.put('b', 2, ['x', 'y'])
+        cache.put('c', 3, ['y'])
+        cache.invalidate('x')
+        self.assertEqual([False, False, True], [cache.get(key)[0] for key in 'abc'])
+        token = cache.token()
+        cache.invalidate('z')
+        cache.put('d', 4, token=token)
+        self.assertEqual((False, None), cache.get('d'), 'read before an invalidation, not stored')
+        cache.put('d', 4, token=cache.token())
+        self.assertEqual((True, 4), cache.get('d'))
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
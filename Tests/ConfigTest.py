@@ -0,0 +1,76 @@
+import os
+import unittest
+from unittest import mock
+from psycopg2 import extensions
+import Solution
+from Utility.DBConnector import DBConnector
+from Utility.Exceptions import DatabaseException
+from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest, TEST_FIXTURE
+
+from Business.Owner import Owner
+
+
+class ConfigTest(AbstractTest):
+    def setUp(self) -> None:
+        super().setUp()
+        params = DBConnector.config()
+        params.pop("options", None)
+        # the template fixture points DBConnector at a clone of its own, the tests go back to it afterwards
+        self.restore = extensions.make_dsn(**params) if TEST_FIXTURE == "template" else None
+        self.params = params
+
+    def tearDown(self) -> None:
+        DBConnector.reload_config(self.restore)
+        super().tearDown()
+
+    # a DSN for the configured database, connecting as application_name
+    def make_dsn(self, application_name: str) -> str:
+        return extensions.make_dsn(**self.params, application_name=application_name)
+
+    def application_name(self) -> str:
+        conn = DBConnector()
+        try:
+            return conn.execute("SELECT current_setting('application_name') AS a")[1][0]['a']
+        finally:
+            conn.close()
+
+    def test_config_is_cached(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(1, 'o1')), 'regular owner')
+        DBConnector.config()
+        before = DBConnector.pool_stats()
+        with mock.patch.object(DBConnector, '_DBConnector__read_config') as read_config, \
+                mock.patch.dict(os.environ, {'DATABASE_DSN': self.make_dsn('not_read')}):
+            for _ in range(5):
+                self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1), 'get owner')
+                DBConnector.config()
+            self.assertEqual(0, read_config.call_count, 'database.ini not read again')
+            self.assertNotEqual('not_read', self.application_name(), 'environment not read again')
+        self.assertEqual(before['created'], DBConnector.pool_stats()['created'], 'the pool was kept')
+
+    def test_database_dsn_overrides_database_ini(self) -> None:
+        with mock.patch.dict(os.environ, {'DATABASE_DSN': self.make_dsn('from_env')}):
+            DBConnector.reload_config()
+            self.assertEqual('from_env', DBConnector.config()['application_name'])
+            self.assertEqual('from_env', self.application_name(), 'connections use DATABASE_DSN')
+            DBConnector.reload_config(self.make_dsn('from_argument'))
+            self.assertEqual('from_argument', self.application_name(), 'reload_config(dsn) overrides both')
+
+    def test_reload_config_picks_up_changes(self) -> None:
+        with mock.patch.dict(os.environ, {'DATABASE_DSN': self.make_dsn('first')}):
+            DBConnector.reload_config()
+            self.assertEqual('first', self.application_name())
+            os.environ['DATABASE_DSN'] = self.make_dsn('second')
+            self.assertEqual('first', self.application_name(), 'cached until reloaded')
+            DBConnector.reload_config()
+            self.assertEqual('second', self.application_name(), 'reloaded')
+            self.assertEqual(1, DBConnector.pool_stats()['created'], 'a new pool for the new configuration')
+            os.environ['DATABASE_DSN'] = 'not a dsn'
+            DBConnector.reload_config()
+            with self.assertRaises(DatabaseException.database_ini_ERROR):
+                DBConnector.config()
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
@@ -0,0 +1,104 @@
+import unittest
+import csv
+import os
+import tempfile
+import threading
+from datetime import date
+from unittest import mock
+import Solution
+from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest
+
+from Business.Apartment import Apartment
+from Business.Customer import Customer
+
+
+class CsvLoaderTest(AbstractTest):
+    def setUp(self) -> None:
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        for customer_id in (1, 2, 3):
+            Solution.add_customer(Customer(customer_id, 'c' + str(customer_id)))
+        for apartment_id in (1, 2):
+            Solution.add_apartment(Apartment(apartment_id, 'a' + str(apartment_id), 'Haifa', 'Israel', 50))
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+        super().tearDown()
+
+    def write_csv(self, name, rows):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', newline='') as file:
+            csv.writer(file).writerows(rows)
+        return path
+
+    def read_rejects(self, path):
+        with open(path, newline='') as file:
+            return [(int(row['row']), row['reason']) for row in csv.DictReader(file)]
+
+    def test_load_reservations(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.customer_made_reservation(1, 1, date(2020, 1, 1), date(2020, 1, 5), 100))
+        path = self.write_csv('reservations.csv', [
+            Solution.RESERVATION_CSV_COLUMNS,
+            [2, 1, '2020-01-03', '2020-01-08', 100],  # 2: overlaps an existing reservation
+            [2, 1, '2020-01-05', '2020-01-08', 100],  # 3: ok
+            [3, 1, '2020-01-07', '2020-01-10', 100],  # 4: overlaps row 3
+            [3, 1, '2020-01-08', '2020-01-10', 100],  # 5: ok, only overlaps the rejected row 4
+            [9, 1, '2021-01-01', '2021-01-02', 100],  # 6: no such customer
+            [1, 2, '2020-02-02', '2020-02-01', 100],  # 7: end before start
+            [1, 2, 'not a date', '2020-02-01', 100],  # 8: unparsable
+            [1, 2, '2020-02-01', '2020-02-03', 80],   # 9: ok
+        ])
+        rejects = os.path.join(self.directory.name, 'rejects.csv')
+
+        self.assertEqual((3, 5), Solution.load_reservations_csv(path, rejects), '(loaded, rejected)')
+        self.assertEqual([(2, 'BAD_PARAMS'), (4, 'BAD_PARAMS'), (6, 'NOT_EXISTS'), (7, 'BAD_PARAMS'), (8, 'BAD_PARAMS')],
+                         self.read_rejects(rejects), 'rejected rows and reasons')
+        self.assertEqual(ReturnValue.OK, Solution.customer_cancelled_reservation(3, 1, date(2020, 1, 8)), 'loaded')
+        self.assertEqual(ReturnValue.NOT_EXISTS, Solution.customer_cancelled_reservation(3, 1, date(2020, 1, 7)),
+                         'not loaded')
+
+    def test_load_reviews(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.customer_made_reservation(1, 1, date(2020, 1, 1), date(2020, 1, 5), 100))
+        self.assertEqual(ReturnValue.OK, Solution.customer_made_reservation(2, 1, date(2020, 1, 5), date(2020, 1, 9), 100))
+        self.assertEqual(ReturnValue.OK, Solution.customer_reviewed_apartment(2, 1, date(2020, 1, 10), 5, 'ok'))
+        path = self.write_csv('reviews.csv', [
+            Solution.REVIEW_CSV_COLUMNS,
+            [1, 1, '2020-01-04', 8, 'before the stay ended'],  # 2: no prior reservation
+            [1, 1, '2020-01-06', 8, 'great,\nreally'],         # 3: ok
+            [1, 1, '2020-01-07', 9, 'twice'],                  # 4: second review in the batch
+            [2, 1, '2020-01-11', 9, 'again'],                  # 5: already reviewed
+            [3, 2, '2020-01-11', 11, 'bad rating'],            # 6: bad rating
+        ])
+        rejects = os.path.join(self.directory.name, 'rejects.csv')
+
+        self.assertEqual((1, 4), Solution.load_reviews_csv(path, rejects), '(loaded, rejected)')
+        self.assertEqual([(2, 'NOT_EXISTS'), (4, 'ALREADY_EXISTS'), (5, 'ALREADY_EXISTS'), (6, 'BAD_PARAMS')],
+                         self.read_rejects(rejects), 'rejected rows and reasons')
+        self.assertEqual(6.5, Solution.get_apartment_rating(1), 'review of row 3 loaded')
+
+    def test_rules_hold_until_the_insert(self) -> None:
+        path = self.write_csv('reservations.csv', [Solution.RESERVATION_CSV_COLUMNS,
+                                                   [1, 2, '2020-02-01', '2020-02-03', 80]])
+        apply_rules = Solution._apply_reservation_rules
+        results = []
+
+        # a reservation for the same stay made after the rules accepted the row, before it is inserted
+        def apply_rules_then_reserve(conn):
+            apply_rules(conn)
+            reserve = threading.Thread(target=lambda: results.append(
+                Solution.customer_made_reservation(2, 2, date(2020, 2, 2), date(2020, 2, 4), 80)))
+            reserve.start()
+            reserve.join(0.3)
+            self.assertTrue(reserve.is_alive(), 'waits for the load')
+            self.reserve = reserve
+
+        with mock.patch.object(Solution, '_apply_reservation_rules', apply_rules_then_reserve):
+            self.assertEqual((1, 0), Solution.load_reservations_csv(path), '(loaded, rejected)')
+        self.reserve.join()
+        self.assertEqual([ReturnValue.BAD_PARAMS], results, 'checked against the loaded row')
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
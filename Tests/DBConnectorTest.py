@@ -0,0 +1,141 @@
+import json
+import os
+import tempfile
+import unittest
+import Solution
+from Utility.DBConnector import DBConnector
+from Utility.PreparedStatement import PreparedStatement
+from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest
+
+from Business.Owner import Owner
+
+
+COUNT_OWNERS_NAMED = PreparedStatement("test_count_owners_named",
+                                       "SELECT COUNT(*) AS c FROM Owner WHERE name LIKE $1 || '%'", ["TEXT"])
+
+
+class DBConnectorTest(AbstractTest):
+    def test_prepared_statement(self) -> None:
+        Solution.add_owner(Owner(1, 'ann'))
+        Solution.add_owner(Owner(2, 'bob'))
+        conn = DBConnector()
+        try:
+            self.assertEqual(1, conn.execute(COUNT_OWNERS_NAMED, params=('a',))[1][0]['c'], 'first execution')
+            self.assertIn(COUNT_OWNERS_NAMED.name, conn.connection.prepared, 'prepared on the connection')
+            self.assertEqual(0, conn.execute(COUNT_OWNERS_NAMED, params=('c',))[1][0]['c'], 'second execution')
+            self.assertRaises(ValueError, PreparedStatement, COUNT_OWNERS_NAMED.name, "SELECT 1")
+        finally:
+            conn.close()
+
+    def test_result_rows(self) -> None:
+        Solution.add_owner(Owner(1, 'o1'))
+        Solution.add_owner(Owner(2, 'o2'))
+        conn = DBConnector()
+        try:
+            _, entries = conn.execute("SELECT id, name FROM Owner ORDER BY id")
+        finally:
+            conn.close()
+        rows = list(entries)
+        self.assertEqual(2, len(rows), 'two rows')
+        self.assertEqual('o2', rows[1]['NAME'], 'case insensitive column access')
+        self.assertEqual(1, entries[0]['id'], 'row by index')
+        self.assertEqual([1, 2], entries['id'], 'column by name')
+        self.assertEqual({'id': 1, 'name': 'o1'}, rows[0], 'row compares equal to a dict')
+        self.assertIsNone(rows[0][0], 'non string keys')
+        self.assertRaises(KeyError, lambda: rows[0]['missing'])
+
+    def test_read_only_execute(self) -> None:
+        Solution.add_owner(Owner(1, 'o1'))
+        conn = DBConnector()
+        try:
+            self.assertEqual(1, conn.execute("SELECT id FROM Owner", read_only=True)[0], 'read in autocommit mode')
+            self.assertFalse(conn.connection.autocommit, 'autocommit switched back off')
+            conn.begin()
+            conn.execute("INSERT INTO Owner VALUES(2, 'o2')")
+            self.assertEqual(2, conn.execute("SELECT id FROM Owner", read_only=True)[0], 'joins an open transaction')
+            conn.rollback()
+        finally:
+            conn.close()
+        self.assertEqual(Owner.bad_owner(), Solution.get_owner(2), 'transaction was not committed by the read')
+
+    def test_slow_query_log(self) -> None:
+        path = os.path.join(tempfile.mkdtemp(), 'slow.jsonl')
+        DBConnector.configure_slow_query_log(threshold_ms=0, path=path, explain=True)
+        try:
+            Solution.add_owner(Owner(1, 'ann'))
+            self.assertEqual('ann', Solution.get_owner(1).get_owner_name(), 'results unaffected')
+        finally:
+            DBConnector.configure_slow_query_log(None)
+        with open(path) as file:
+            entries = [json.loads(line) for line in file]
+        self.assertEqual(['add_owner', 'get_owner'], [entry['function'] for entry in entries], 'one line per call')
+        self.assertEqual([1], entries[1]['params'], 'parameters logged')
+        self.assertIn('Plan', entries[1]['plan'][0], 'plan of the read captured')
+        self.assertIn('explain_error', entries[0], 're-running the insert fails on the row it inserted')
+        self.assertEqual('ann', Solution.get_owner(1).get_owner_name(), 'explain re-runs are rolled back')
+
+    def test_worker_schema(self) -> None:
+        Solution.add_owner(Owner(1, 'shared'))
+        schema = 'test_%d' % os.getpid()
+        DBConnector.configure_schema('Test %d' % os.getpid())
+        try:
+            self.assertEqual(schema, DBConnector.schema(), 'usable unquoted')
+            Solution.create_tables()
+            self.assertEqual(Owner.bad_owner(), Solution.get_owner(1), 'tables of the worker')
+            self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(1, 'worker')))
+            conn = DBConnector()
+            try:
+                self.assertEqual(schema, conn.execute("SELECT current_schema() AS s")[1][0]['s'])
+            finally:
+                conn.close()
+        finally:
+            DBConnector.configure_schema()
+            conn = DBConnector()
+            try:
+                conn.execute("DROP SCHEMA IF EXISTS %s CASCADE" % schema)
+            finally:
+                conn.close()
+        self.assertEqual(Owner(1, 'shared'), Solution.get_owner(1), 'other schema untouched')
+
+    def test_stream_in_batches(self) -> None:
+        for owner_id in range(1, 26):
+            Solution.add_owner(Owner(owner_id, 'owner ' + str(owner_id)))
+        conn = DBConnector()
+        try:
+            rows = conn.stream("SELECT id, name FROM Owner ORDER BY id", batch_size=4)
+            self.assertEqual(list(range(1, 26)), [row['id'] for row in rows], 'all rows streamed in order')
+            self.assertEqual('owner 3', next(iter(conn.stream("SELECT id, NAME FROM Owner WHERE id = 3")))['Name'],
+                             'case insensitive column access')
+        finally:
+            conn.close()
+
+    def test_stream_stopped_early(self) -> None:
+        for owner_id in range(1, 11):
+            Solution.add_owner(Owner(owner_id, 'owner'))
+        conn = DBConnector()
+        try:
+            rows = conn.stream("SELECT id FROM Owner ORDER BY id", batch_size=2)
+            self.assertEqual(1, next(rows)['id'], 'first row')
+            rows.close()
+            self.assertEqual(10, conn.execute("SELECT COUNT(*) AS c FROM Owner")[1][0]['c'],
+                             'connection usable after abandoning a stream')
+        finally:
+            conn.close()
+
+    def test_stream_query_raises_errors(self) -> None:
+        with self.assertRaises(Exception, msg='missing table'):
+            list(Solution.stream_query("SELECT * FROM no_such_table"))
+        for owner_id in range(1, 6):
+            Solution.add_owner(Owner(owner_id, 'owner ' + str(owner_id)))
+        rows = []
+        with self.assertRaises(Exception, msg='failing after the first batch'):
+            for entry in Solution.stream_query("SELECT id, 10 / (3 - id) AS q FROM Owner ORDER BY id", batch_size=2):
+                rows.append(entry['id'])
+        self.assertEqual([1, 2], rows, 'no partial result passed off as complete')
+        self.assertEqual(Owner(5, 'owner 5'), Solution.get_owner(5), 'connection returned in a usable state')
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
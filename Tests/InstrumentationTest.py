@@ -0,0 +1,60 @@
+import unittest
+import io
+import json
+import Solution
+from Utility import Instrumentation
+from Utility.Instrumentation import Histogram
+from Tests.AbstractTest import AbstractTest
+
+from Business.Owner import Owner
+
+
+class InstrumentationTest(AbstractTest):
+    def setUp(self) -> None:
+        super().setUp()
+        self.recorder = Instrumentation.enable()
+
+    def tearDown(self) -> None:
+        Instrumentation.disable(self.recorder)
+        super().tearDown()
+
+    def test_phases_per_function(self) -> None:
+        Solution.add_owner(Owner(1, 'o1'))
+        for _ in range(10):
+            Solution.get_owner(1)
+        snapshot = self.recorder.snapshot()
+        self.assertEqual({'connect', 'compose', 'execute', 'fetch', 'resultset', 'build', 'total'},
+                         set(snapshot['get_owner']), 'phases of a read')
+        self.assertIn('commit', snapshot['add_owner'], 'writes are committed')
+        total = snapshot['get_owner']['total']
+        self.assertEqual(10, total['count'], 'one sample per call')
+        self.assertLessEqual(total['p50'], total['p99'], 'ordered percentiles')
+        self.assertLessEqual(total['p99'], total['max'], 'percentiles within the observed range')
+
+        out = io.StringIO()
+        self.recorder.dump(out)
+        self.assertEqual(snapshot, json.loads(out.getvalue()), 'json dump')
+
+    def test_custom_hook(self) -> None:
+        samples = []
+        hook = lambda function, phase, seconds: samples.append((function, phase))
+        Instrumentation.add_hook(hook)
+        try:
+            Solution.get_customer(1)
+        finally:
+            Instrumentation.remove_hook(hook)
+        self.assertIn(('get_customer', 'execute'), samples, 'hook called with the Solution function name')
+        self.assertEqual(('get_customer', 'total'), samples[-1], 'total reported last')
+
+    def test_histogram_percentiles(self) -> None:
+        histogram = Histogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1e6)  # 1us .. 1ms
+        self.assertAlmostEqual(500e-6, histogram.percentile(50), delta=25e-6)
+        self.assertAlmostEqual(990e-6, histogram.percentile(99), delta=45e-6)
+        self.assertEqual(1e-3, histogram.percentile(100), 'max')
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
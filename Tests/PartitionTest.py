@@ -0,0 +1,74 @@
+import unittest
+from datetime import date
+import Solution
+from Utility.DBConnector import DBConnector
+from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest
+
+from Business.Apartment import Apartment
+from Business.Customer import Customer
+
+
+class PartitionTest(AbstractTest):
+    # the tables may have been created unpartitioned (e.g. in the template database), which create_tables refuses
+    def setUp(self) -> None:
+        Solution.drop_tables()
+        Solution.create_tables(partitioned_reservations=True)
+        Solution.add_apartment(Apartment(1, 'a1', 'Haifa', 'Israel', 50))
+        Solution.add_customer(Customer(1, 'c1'))
+        Solution.add_customer(Customer(2, 'c2'))
+
+    # the partitions a test creates are part of the schema, clear_tables would leave them behind
+    def tearDown(self) -> None:
+        Solution.drop_tables()
+
+    # {partition: reservations in it}
+    def partitions(self) -> dict:
+        conn = DBConnector()
+        try:
+            _, entries = conn.execute("SELECT tableoid::regclass::text AS partition, COUNT(*) AS c "
+                                      "FROM Reservations GROUP BY 1")
+        finally:
+            conn.close()
+        return {entry['partition']: entry['c'] for entry in entries}
+
+    def test_reservations_land_in_yearly_partitions(self) -> None:
+        this_year = date.today().year
+        self.assertEqual(ReturnValue.OK, Solution.customer_made_reservation(1, 1, date(this_year, 1, 1),
+                                                                            date(this_year, 1, 5), 100))
+        self.assertEqual(ReturnValue.OK, Solution.customer_made_reservation(2, 1, date(1990, 1, 1),
+                                                                            date(1990, 1, 5), 100))
+        self.assertEqual({'reservations_%d' % this_year: 1, 'reservations_default': 1}, self.partitions())
+        self.assertEqual(Customer(1, 'c1'), Solution.get_top_customer(), 'tie broken by id')
+        self.assertEqual(0.15 * 100, Solution.profit_per_month(1990, from_rollup=False)[0][1], 'from the default')
+
+        self.assertEqual(0, Solution.create_reservation_partitions(), 'partitions up to date')
+        self.assertEqual(this_year - Solution.RESERVATION_PARTITION_YEARS_BACK - 1990,
+                         Solution.create_reservation_partitions(first_year=1990), 'older years created')
+        self.assertEqual({'reservations_%d' % this_year: 1, 'reservations_1990': 1}, self.partitions(),
+                         'moved out of the default partition')
+        self.assertEqual([(1, 0.15 * 100)], Solution.profit_per_month(1990)[:1], 'rollup untouched by the move')
+        self.assertEqual(Customer(1, 'c1'), Solution.get_top_customer(), 'counters untouched by the move')
+
+    def test_overlaps_across_partitions(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.customer_made_reservation(1, 1, date(2020, 12, 30),
+                                                                            date(2021, 1, 2), 100))
+        self.assertEqual(ReturnValue.BAD_PARAMS, Solution.customer_made_reservation(2, 1, date(2020, 12, 28),
+                                                                                    date(2020, 12, 31), 100),
+                         'overlap in the previous year partition')
+        self.assertEqual(ReturnValue.BAD_PARAMS, Solution.customer_made_reservation(1, 1, date(2020, 12, 30),
+                                                                                    date(2021, 1, 1), 100),
+                         'same customer, apartment and start date')
+        self.assertEqual(ReturnValue.OK, Solution.customer_made_reservation(2, 1, date(2021, 1, 2),
+                                                                            date(2021, 1, 3), 100))
+        self.assertEqual(ReturnValue.NOT_EXISTS, Solution.customer_made_reservation(3, 1, date(2022, 1, 2),
+                                                                                    date(2022, 1, 3), 100),
+                         'foreign keys enforced')
+        self.assertEqual(ReturnValue.OK, Solution.customer_cancelled_reservation(1, 1, date(2020, 12, 30)))
+        self.assertEqual(ReturnValue.OK, Solution.delete_customer(2), 'cascades into the partitions')
+        self.assertEqual({}, self.partitions(), 'no reservations left')
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
@@ -0,0 +1,94 @@
+import unittest
+import threading
+import time
+from unittest import mock
+import Solution
+from Utility.ConnectionPool import ConnectionPool
+from Utility.DBConnector import DBConnector
+from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest
+
+from Business.Owner import Owner
+
+
+class PoolTest(AbstractTest):
+    def test_connections_are_reused(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(1, 'o1')), 'regular owner')
+        before = DBConnector.pool_stats()
+        for _ in range(20):
+            self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1), 'get owner')
+        after = DBConnector.pool_stats()
+        self.assertEqual(before['created'], after['created'], 'no new connections for sequential calls')
+        self.assertEqual(before['reused'] + 20, after['reused'], 'every call reused a pooled connection')
+        self.assertEqual(0, after['in_use'], 'all connections returned')
+
+    def test_concurrent_calls_respect_max_size(self) -> None:
+        DBConnector.configure_pool(min_size=1, max_size=3)
+        try:
+            errors = []
+
+            def add_owners(first_id):
+                for owner_id in range(first_id, first_id + 10):
+                    if Solution.add_owner(Owner(owner_id, 'o')) != ReturnValue.OK:
+                        errors.append(owner_id)
+
+            threads = [threading.Thread(target=add_owners, args=(i * 10 + 1,)) for i in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertEqual([], errors, 'all concurrent inserts succeeded')
+            self.assertLessEqual(DBConnector.pool_stats()['created'], 3, 'pool never exceeded max_size')
+            self.assertEqual(0, DBConnector.pool_stats()['in_use'], 'all connections returned')
+        finally:
+            DBConnector.configure_pool()
+
+    def test_connection_returns_to_its_own_pool(self) -> None:
+        conn = DBConnector()
+        conn.begin()
+        conn.execute("INSERT INTO Owner(id, name) VALUES(1, 'o1')")
+        connection = conn.connection
+        DBConnector.configure_pool()
+        conn.close()
+        self.assertTrue(connection.closed, 'closed by the replaced pool, not left open')
+        self.assertEqual(Owner.bad_owner(), Solution.get_owner(1), 'the open transaction was not committed')
+        self.assertEqual(1, DBConnector.pool_stats()['created'], 'not handed to the new pool')
+
+    def test_health_check_outside_the_lock(self) -> None:
+        pool = ConnectionPool(DBConnector.config(), min_size=0, max_size=2)
+        try:
+            first, second = pool.getconn(), pool.getconn()
+            pool.putconn(first)
+            pool.putconn(second)
+            pinging, release = threading.Event(), threading.Event()
+
+            # the first health check hangs like a ping to an unresponsive server
+            def healthy(connection):
+                if not pinging.is_set():
+                    pinging.set()
+                    release.wait(5)
+                return True
+
+            with mock.patch.object(ConnectionPool, '_ConnectionPool__healthy', side_effect=healthy):
+                slow = []
+                thread = threading.Thread(target=lambda: slow.append(pool.getconn()))
+                thread.start()
+                self.assertTrue(pinging.wait(5))
+                start = time.monotonic()
+                other = pool.getconn()
+                self.assertLess(time.monotonic() - start, 1, 'checkout not blocked by the ping')
+                self.assertEqual(2, pool.stats()['in_use'], 'both checked out')
+                release.set()
+                thread.join()
+            self.assertIsNot(other, slow[0], 'the connection being checked is not handed out twice')
+            pool.putconn(other)
+            pool.putconn(slow[0])
+            self.assertEqual(0, pool.stats()['in_use'])
+        finally:
+            pool.closeall()
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
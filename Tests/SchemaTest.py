@@ -0,0 +1,152 @@
+import unittest
+import threading
+import psycopg2
+from datetime import date
+import Solution
+from Utility.DBConnector import DBConnector
+from Utility.Exceptions import DatabaseException
+from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest
+
+from Business.Customer import Customer
+from Business.Owner import Owner
+
+
+class SchemaTest(AbstractTest):
+    def query(self, query) -> list:
+        conn = DBConnector()
+        try:
+            _, entries = conn.execute(query)
+        finally:
+            conn.close()
+        return [tuple(entry.values()) for entry in entries]
+
+    def versions(self) -> list:
+        return self.query("SELECT version FROM SchemaVersion ORDER BY version")
+
+    def latest(self) -> list:
+        return [(version,) for version, _ in Solution.SCHEMA_MIGRATIONS]
+
+    def relkind(self) -> list:
+        return self.query("SELECT relkind::TEXT FROM pg_class WHERE oid = 'Reservations'::regclass")
+
+    # tables of a create_tables from before SchemaVersion (schema version 1), with a few rows in them
+    def create_baseline(self) -> None:
+        Solution.drop_tables()
+        self.query(Solution._baseline_schema(False) + ";"
+                   "INSERT INTO Owner VALUES (1, 'o1'), (2, 'o2');"
+                   "INSERT INTO Customer VALUES (1, 'c1'), (2, 'c2'), (3, 'c3');"
+                   "INSERT INTO Apartment VALUES (1, 'a1', 'Haifa', 'Israel', 50), (2, 'a2', 'Paris', 'France', 40);"
+                   "INSERT INTO OwnedBy VALUES (1, 1), (2, 1);"
+                   "INSERT INTO Reservations VALUES (1, 1, '2020-01-01', '2020-01-05', 100), "
+                   "(2, 1, '2020-01-05', '2020-01-09', 200), (1, 2, '2020-02-01', '2020-02-03', 50);"
+                   "INSERT INTO Reviews VALUES (1, 1, '2020-01-06', 8, 'x'), (2, 1, '2020-01-10', 4, 'y'), "
+                   "(1, 2, '2020-02-04', 6, 'z');"
+                   "SELECT 1")
+
+    # the data of create_baseline, read through the rollups the later versions fill in
+    def assertBaselineMigrated(self) -> None:
+        self.assertEqual(self.latest(), self.versions(), 'all versions applied')
+        self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1), 'rows kept')
+        self.assertEqual(6, Solution.get_apartment_rating(1), 'ApartmentRatingStats filled')
+        self.assertEqual(0, Solution.rebuild_apartment_rating_stats(), 'ApartmentRatingStats consistent')
+        self.assertEqual([(1, 2, 0.5), (2, 1, 2)],
+                         [(f, t, float(r)) for f, t, r in
+                          self.query("SELECT from_customer, to_customer, rating_ratio FROM rating_ratio ORDER BY 1")],
+                         'RatingRatio filled')
+        self.assertEqual(0, Solution.rebuild_rating_ratio(), 'RatingRatio consistent')
+        self.assertEqual(Solution.profit_per_month(2020, from_rollup=False), Solution.profit_per_month(2020),
+                         'MonthlyRevenue filled')
+        self.assertEqual(Customer(1, 'c1'), Solution.get_top_customer(), 'reservation counts filled')
+        self.assertEqual([(1, 2), (2, 1), (3, 0)], self.query("SELECT customer_id, reservation_count "
+                                                              "FROM CustomerReservationCount ORDER BY 1"))
+        self.assertEqual([('o1', 3), ('o2', 0)], sorted(Solution.reservations_per_owner()))
+        self.assertEqual([Owner(1, 'o1')], Solution.get_all_location_owners(), 'locations filled')
+        self.assertEqual(ReturnValue.BAD_PARAMS,
+                         Solution.customer_made_reservation(3, 1, date(2020, 1, 4), date(2020, 1, 6), 10),
+                         'overlaps refused')
+
+    def test_up_to_date_schema_is_kept(self) -> None:
+        Solution.add_owner(Owner(1, 'o1'))
+        Solution.create_tables()
+        self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1), 'no DDL ran')
+        self.assertEqual(self.latest(), self.versions())
+        Solution.clear_tables()
+        self.assertEqual(self.latest(), self.versions(), 'clear_tables keeps the schema')
+        Solution.drop_tables()
+        self.assertEqual([(None,)], self.query("SELECT to_regclass('SchemaVersion')"), 'drop_tables drops all')
+
+    def test_migrations_applied_in_order(self) -> None:
+        Solution.add_owner(Owner(1, 'o1'))
+        migrations = Solution.SCHEMA_MIGRATIONS
+        latest = migrations[-1][0]
+        Solution.SCHEMA_MIGRATIONS = migrations + [
+            (latest + 1, lambda partitioned: "CREATE INDEX owner_name ON Owner(name);"),
+            (latest + 2, lambda partitioned: "ALTER TABLE Owner ADD note TEXT;")]
+        try:
+            Solution.create_tables()
+            self.assertEqual(self.latest(), self.versions(), 'missing versions applied')
+            self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1), 'data kept by the migrations')
+            self.assertEqual([(1, 'o1', None)], self.query("SELECT id, name, note FROM Owner"))
+        finally:
+            Solution.SCHEMA_MIGRATIONS = migrations
+        with self.assertRaises(DatabaseException.SCHEMA_MISMATCH, msg='versions applied by newer code'):
+            Solution.create_tables()
+        self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1), 'nothing dropped')
+        self.assertEqual(latest + 2, len(self.versions()))
+        self.addCleanup(Solution.drop_tables)
+
+    def test_failing_migration_is_raised(self) -> None:
+        Solution.add_owner(Owner(1, 'o1'))
+        migrations = Solution.SCHEMA_MIGRATIONS
+        latest = migrations[-1][0]
+        Solution.SCHEMA_MIGRATIONS = migrations + [
+            (latest + 1, lambda partitioned: "CREATE INDEX owner_name ON Owner(name);"),
+            (latest + 2, lambda partitioned: "ALTER TABLE no_such_table ADD note TEXT;")]
+        try:
+            with self.assertRaises(psycopg2.Error):
+                Solution.create_tables()
+        finally:
+            Solution.SCHEMA_MIGRATIONS = migrations
+        self.assertEqual(self.latest(), self.versions(), 'rolled back')
+        self.assertEqual([(None,)], self.query("SELECT to_regclass('owner_name')"), 'rolled back')
+        self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1))
+
+    def test_mismatching_schema_is_refused(self) -> None:
+        Solution.add_owner(Owner(1, 'o1'))
+        with self.assertRaises(DatabaseException.SCHEMA_MISMATCH, msg='other DDL'):
+            Solution.create_tables(partitioned_reservations=True)
+        self.assertEqual([('r',)], self.relkind(), 'left as it was')
+        self.assertEqual(Owner(1, 'o1'), Solution.get_owner(1), 'nothing dropped')
+        self.assertEqual(self.latest(), self.versions())
+
+    def test_baseline_is_migrated(self) -> None:
+        self.create_baseline()
+        Solution.create_tables()
+        self.assertEqual([('r',)], self.relkind())
+        self.assertBaselineMigrated()
+
+    def test_baseline_is_migrated_to_partitions(self) -> None:
+        self.create_baseline()
+        # the next setUp creates the tables unpartitioned
+        self.addCleanup(Solution.drop_tables)
+        Solution.create_tables(partitioned_reservations=True)
+        self.assertEqual([('p',)], self.relkind())
+        self.assertEqual([('reservations_2020', 3)], self.query("SELECT tableoid::regclass::TEXT, COUNT(*) "
+                                                                "FROM Reservations GROUP BY 1"), 'moved')
+        self.assertBaselineMigrated()
+
+    def test_concurrent_create_tables(self) -> None:
+        Solution.drop_tables()
+        threads = [threading.Thread(target=Solution.create_tables) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.latest(), self.versions(), 'created once')
+        self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(1, 'o1')))
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
@@ -0,0 +1,93 @@
+import threading
+import unittest
+from datetime import date
+import Solution
+from Utility.DBConnector import DBConnector
+from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest
+
+from Business.Apartment import Apartment
+from Business.Owner import Owner
+from Business.Customer import Customer
+
+
+class TransactionTest(AbstractTest):
+    def test_booking_flow_commits_once(self) -> None:
+        self.assertEqual(ReturnValue.OK, Solution.add_apartment(Apartment(1, 'a1', 'Haifa', 'Israel', 50)))
+        self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(1, 'o1')))
+        created = DBConnector.pool_stats()['checkouts']
+        with Solution.transaction():
+            self.assertEqual(ReturnValue.OK, Solution.add_customer(Customer(1, 'c1')))
+            self.assertEqual(ReturnValue.OK, Solution.customer_made_reservation(1, 1, date(2021, 1, 1),
+                                                                                date(2021, 1, 3), 100))
+            self.assertEqual(ReturnValue.OK, Solution.owner_owns_apartment(1, 1))
+            self.assertEqual(Customer(1, 'c1'), Solution.get_customer(1), 'own writes are visible')
+        self.assertEqual(created + 1, DBConnector.pool_stats()['checkouts'], 'one connection for the whole flow')
+        self.assertEqual(Customer(1, 'c1'), Solution.get_top_customer(), 'committed')
+        self.assertEqual(Owner(1, 'o1'), Solution.get_apartment_owner(1), 'committed')
+
+    def test_failing_call_does_not_abort_transaction(self) -> None:
+        with Solution.transaction():
+            self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(1, 'o1')))
+            self.assertEqual(ReturnValue.ALREADY_EXISTS, Solution.add_owner(Owner(1, 'o1')), 'duplicate id')
+            self.assertEqual(ReturnValue.NOT_EXISTS, Solution.owner_owns_apartment(1, 7), 'missing apartment')
+            self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(2, 'o2')), 'transaction still usable')
+            self.assertEqual([], Solution.get_all_location_owners(), 'query in the transaction')
+        self.assertEqual(Owner(2, 'o2'), Solution.get_owner(2), 'committed')
+
+    def test_rollback_on_error(self) -> None:
+        with self.assertRaises(RuntimeError):
+            with Solution.transaction():
+                self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(1, 'o1')))
+                with Solution.transaction():
+                    self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(2, 'o2')), 'nested transaction')
+                raise RuntimeError('booking failed')
+        self.assertEqual(Owner.bad_owner(), Solution.get_owner(1), 'rolled back')
+        self.assertEqual(Owner.bad_owner(), Solution.get_owner(2), 'nested block rolled back too')
+
+    def test_nested_rollback(self) -> None:
+        with Solution.transaction():
+            self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(1, 'o1')))
+            with Solution.transaction(rollback=True):
+                self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(2, 'o2')), 'nested transaction')
+                self.assertEqual(ReturnValue.ALREADY_EXISTS, Solution.add_owner(Owner(1, 'o1')), 'failing call')
+                self.assertEqual(Owner(2, 'o2'), Solution.get_owner(2), 'own writes are visible')
+            self.assertEqual(Owner.bad_owner(), Solution.get_owner(2), 'nested block rolled back')
+            with self.assertRaises(RuntimeError):
+                with Solution.transaction():
+                    self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(3, 'o3')))
+                    raise RuntimeError('booking failed')
+            self.assertEqual(Owner.bad_owner(), Solution.get_owner(3), 'failed nested block rolled back')
+            with Solution.transaction():
+                self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(4, 'o4')))
+            self.assertEqual(ReturnValue.OK, Solution.add_owner(Owner(5, 'o5')), 'outer transaction still usable')
+        self.assertEqual([Owner(1, 'o1'), Owner.bad_owner(), Owner.bad_owner(), Owner(4, 'o4'), Owner(5, 'o5')],
+                         [Solution.get_owner(owner_id) for owner_id in range(1, 6)], 'outer block committed')
+
+    def test_concurrent_overlapping_bookings(self) -> None:
+        Solution.add_apartment(Apartment(1, 'a1', 'Haifa', 'Israel', 50))
+        Solution.add_customer(Customer(1, 'c1'))
+        Solution.add_customer(Customer(2, 'c2'))
+        results = []
+
+        def book():
+            results.append(Solution.customer_made_reservation(2, 1, date(2021, 1, 2), date(2021, 1, 5), 100))
+
+        with Solution.transaction():
+            self.assertEqual(ReturnValue.OK, Solution.customer_made_reservation(1, 1, date(2021, 1, 1),
+                                                                                date(2021, 1, 3), 100))
+            other = threading.Thread(target=book)
+            other.start()
+            other.join(0.2)  # blocks on the uncommitted overlapping stay
+        other.join()
+        self.assertEqual([ReturnValue.BAD_PARAMS], results, 'refused once the first booking committed')
+        self.assertEqual(ReturnValue.BAD_PARAMS,
+                         Solution.customer_made_reservation(1, 1, date(2021, 1, 1), date(2021, 1, 2), 100),
+                         'same start date')
+        self.assertEqual(ReturnValue.OK, Solution.customer_made_reservation(2, 1, date(2021, 1, 3),
+                                                                            date(2021, 1, 5), 100), 'adjacent stay')
+
+
+# *** DO NOT RUN EACH TEST MANUALLY ***
+if __name__ == '__main__':
+    unittest.main(verbosity=2, exit=False)
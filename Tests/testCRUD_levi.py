@@ -1,17 +1,12 @@
 import unittest
 from Solution import *
 from Utility.ReturnValue import ReturnValue
+from Tests.AbstractTest import AbstractTest
 
 
-class TestCRUD(unittest.TestCase):
-
-    def setUp(self):
-        create_tables()
-
-    def tearDown(self):
-        # This method will be called after each test
-        # Clean up your test environment
-        clear_tables()
+class TestCRUD(AbstractTest):
+    # each test is rolled back instead of emptying the tables after it
+    rollback = True
 
     def test_Owner(self):
         self.assertEqual(add_owner(Owner(1, "Dan")), ReturnValue.OK)
@@ -0,0 +1,217 @@
+import asyncio
+import time
+import weakref
+import psycopg2
+from psycopg2 import extensions, sql
+from typing import Union
+from Utility.Exceptions import DatabaseException
+from Utility.ConnectionPool import PooledConnection
+from Utility.DBConnector import DBConnector, ResultSet, CONSTRAINT_VIOLATIONS
+from Utility.PreparedStatement import PreparedStatement
+
+
+# waits until the asynchronous connection finished its current operation without blocking the event loop
+async def wait(connection: PooledConnection):
+    loop = asyncio.get_running_loop()
+    fd = connection.fileno()
+    while True:
+        state = connection.poll()
+        if state == extensions.POLL_OK:
+            return
+        ready = loop.create_future()
+        if state == extensions.POLL_READ:
+            loop.add_reader(fd, ready.set_result, None)
+            try:
+                await ready
+            finally:
+                loop.remove_reader(fd)
+        elif state == extensions.POLL_WRITE:
+            loop.add_writer(fd, ready.set_result, None)
+            try:
+                await ready
+            finally:
+                loop.remove_writer(fd)
+        else:
+            raise psycopg2.OperationalError("poll() returned %s" % state)
+
+
+# asyncio counterpart of ConnectionPool for psycopg2 asynchronous connections
+# asynchronous connections are always in autocommit mode, so every statement is committed on its own
+class AsyncConnectionPool:
+    # constructor, see ConnectionPool for the options
+    def __init__(self, connect_params: dict, min_size=1, max_size=10, idle_timeout=300.0, checkout_timeout=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size")
+        self.connect_params = dict(connect_params)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.__idle = []  # most recently used connection is last
+        self.__in_use = 0
+        self.__available = asyncio.Condition()
+        self.__closed = False
+        self.__stats = {"created": 0, "closed": 0, "checkouts": 0, "reused": 0, "waits": 0}
+
+    async def getconn(self) -> PooledConnection:
+        async with self.__available:
+            while True:
+                if self.__closed:
+                    raise DatabaseException.ConnectionInvalid("Connection pool is closed")
+                self.__expire_idle()
+                while self.__idle:
+                    connection = self.__idle.pop()
+                    if not connection.closed:
+                        self.__in_use += 1
+                        self.__stats["checkouts"] += 1
+                        self.__stats["reused"] += 1
+                        return connection
+                    self.__discard(connection)
+                if self.__in_use < self.max_size:
+                    break
+                self.__stats["waits"] += 1
+                try:
+                    await asyncio.wait_for(self.__available.wait(), self.checkout_timeout)
+                except asyncio.TimeoutError:
+                    raise DatabaseException.ConnectionInvalid("Connection pool exhausted")
+            self.__in_use += 1
+
+        try:
+            connection = psycopg2.connect(connection_factory=PooledConnection, async_=True, **self.connect_params)
+            await wait(connection)
+        except Exception:
+            async with self.__available:
+                self.__in_use -= 1
+                self.__available.notify()
+            raise
+        self.__stats["created"] += 1
+        self.__stats["checkouts"] += 1
+        return connection
+
+    # return a connection to the pool, connections still busy (e.g. a cancelled query) are closed
+    async def putconn(self, connection: PooledConnection, discard=False):
+        async with self.__available:
+            self.__in_use -= 1
+            if discard or self.__closed or connection.closed or connection.isexecuting():
+                self.__discard(connection)
+            else:
+                connection.last_used = time.monotonic()
+                self.__idle.append(connection)
+            self.__available.notify()
+
+    def closeall(self):
+        self.__closed = True
+        while self.__idle:
+            self.__discard(self.__idle.pop())
+
+    def stats(self) -> dict:
+        stats = dict(self.__stats)
+        stats.update(idle=len(self.__idle), in_use=self.__in_use, min_size=self.min_size, max_size=self.max_size)
+        return stats
+
+    def __expire_idle(self):
+        now = time.monotonic()
+        while len(self.__idle) + self.__in_use > self.min_size and self.__idle \
+                and now - self.__idle[0].last_used > self.idle_timeout:
+            self.__discard(self.__idle.pop(0))
+
+    def __discard(self, connection: PooledConnection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self.__stats["closed"] += 1
+
+
+# asyncio counterpart of DBConnector
+# conn = await AsyncDBConnector.connect()
+# try:
+#     rows_effected, entries = await conn.execute(query)
+# finally:
+#     await conn.close()
+class AsyncDBConnector:
+    __pools = weakref.WeakKeyDictionary()  # one (DBConnector.config_generation(), pool) per event loop
+    __pool_options = {}
+
+    # pool - the pool connection was checked out of, it goes back there even if the pool is replaced meanwhile
+    def __init__(self, connection: PooledConnection, pool: AsyncConnectionPool):
+        self.connection = connection
+        self.__pool = pool
+
+    @staticmethod
+    async def connect() -> 'AsyncDBConnector':
+        try:
+            pool = AsyncDBConnector.__get_pool()
+            connection = await pool.getconn()
+        except Exception:
+            raise DatabaseException.ConnectionInvalid("Could not connect to database")
+        return AsyncDBConnector(connection, pool)
+
+    # close connection, the underlying connection goes back to the pool
+    async def close(self):
+        if self.connection is not None:
+            await self.__pool.putconn(self.connection, discard=bool(self.connection.closed))
+            self.connection = None
+
+    # set pool options for pools created from now on (min_size, max_size, idle_timeout, checkout_timeout)
+    @staticmethod
+    def configure_pool(**options):
+        AsyncDBConnector.__pool_options = dict(options)
+        for _, pool in list(AsyncDBConnector.__pools.values()):
+            pool.closeall()
+        AsyncDBConnector.__pools.clear()
+
+    # counters of the pool of the running event loop
+    @staticmethod
+    def pool_stats() -> dict:
+        _, pool = AsyncDBConnector.__pools.get(asyncio.get_running_loop(), (None, None))
+        return pool.stats() if pool is not None else {}
+
+    # executes the query, see DBConnector.execute
+    # returns the number of rows effected and a ResultSet (for SELECT)
+    async def execute(self, query: Union[str, sql.Composed, PreparedStatement],
+                      params: tuple = None) -> (int, ResultSet):
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+
+        cursor = self.connection.cursor()
+        try:
+            try:
+                if isinstance(query, PreparedStatement):
+                    if query.name not in self.connection.prepared:
+                        cursor.execute(query.prepare_sql, ())
+                        await wait(self.connection)
+                        self.connection.prepared.add(query.name)
+                    cursor.execute(query.execute_sql, params)
+                else:
+                    cursor.execute(query, params)
+                await wait(self.connection)
+            except psycopg2.Error as e:
+                exception = CONSTRAINT_VIOLATIONS.get(e.pgcode)
+                if exception is not None:
+                    raise exception(exception.__name__)
+                raise
+            row_effected = max(cursor.rowcount, 0)
+
+            # get entries in case of SELECT
+            if cursor.description is not None:
+                entries = ResultSet(cursor.description, cursor.fetchall())
+            else:
+                entries = ResultSet()
+            return row_effected, entries
+        finally:
+            cursor.close()
+
+    # the pool of the running event loop, rebuilt once DBConnector.reload_config or configure_schema changed the
+    # configuration it was built from
+    @staticmethod
+    def __get_pool() -> AsyncConnectionPool:
+        loop = asyncio.get_running_loop()
+        generation, pool = AsyncDBConnector.__pools.get(loop, (None, None))
+        if pool is None or generation != DBConnector.config_generation():
+            if pool is not None:
+                pool.closeall()
+            generation = DBConnector.config_generation()
+            pool = AsyncConnectionPool(DBConnector.config(), **AsyncDBConnector.__pool_options)
+            AsyncDBConnector.__pools[loop] = (generation, pool)
+        return pool
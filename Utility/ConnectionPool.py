@@ -0,0 +1,165 @@
+import threading
+import time
+import psycopg2
+from psycopg2 import extensions
+from Utility.Exceptions import DatabaseException
+
+
+class PooledConnection(extensions.connection):
+    # psycopg2 connection that remembers when it was last handed back to the pool
+    # and which prepared statements were already prepared on it
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_used = time.monotonic()
+        self.prepared = set()
+
+
+class ConnectionPool:
+    # constructor
+    # connect_params - keyword arguments for psycopg2.connect
+    # min_size - connections kept open even when idle
+    # max_size - upper bound on connections open at the same time
+    # idle_timeout - seconds an idle connection above min_size is kept before it is closed
+    # checkout_timeout - seconds getconn waits for a free connection when the pool is exhausted
+    # ping_after - idle seconds after which a connection is pinged with SELECT 1 on checkout
+    def __init__(self, connect_params: dict, min_size=1, max_size=10, idle_timeout=300.0, checkout_timeout=30.0,
+                 ping_after=30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size")
+        self.connect_params = dict(connect_params)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.ping_after = ping_after
+        self.__idle = []  # most recently used connection is last
+        self.__in_use = set()
+        self.__lock = threading.Condition()
+        self.__closed = False
+        self.__stats = {"created": 0, "closed": 0, "checkouts": 0, "reused": 0, "waits": 0, "health_check_failures": 0}
+
+    # take a connection out of the pool, opening a new one if none is idle and max_size was not reached
+    def getconn(self) -> PooledConnection:
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            with self.__lock:
+                while True:
+                    if self.__closed:
+                        raise DatabaseException.ConnectionInvalid("Connection pool is closed")
+                    self.__expire_idle()
+                    if self.__idle:
+                        # taken out of the pool while it is checked, so nobody else gets it
+                        connection = self.__idle.pop()
+                        self.__in_use.add(connection)
+                        break
+                    if len(self.__in_use) < self.max_size:
+                        connection = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    self.__stats["waits"] += 1
+                    if remaining <= 0 or not self.__lock.wait(remaining):
+                        raise DatabaseException.ConnectionInvalid("Connection pool exhausted")
+                if connection is None:
+                    # reserve the slot before connecting so other threads see it as taken
+                    placeholder = object()
+                    self.__in_use.add(placeholder)
+                    break
+
+            # the health check may ping the server, outside the lock (a round trip)
+            healthy = self.__healthy(connection)
+            with self.__lock:
+                if healthy:
+                    self.__stats["checkouts"] += 1
+                    self.__stats["reused"] += 1
+                    return connection
+                self.__in_use.discard(connection)
+                self.__stats["health_check_failures"] += 1
+                self.__discard(connection)
+                self.__lock.notify()
+
+        try:
+            connection = self.__connect()
+        except Exception:
+            with self.__lock:
+                self.__in_use.discard(placeholder)
+                self.__lock.notify()
+            raise
+        with self.__lock:
+            self.__in_use.discard(placeholder)
+            self.__in_use.add(connection)
+            self.__stats["checkouts"] += 1
+        return connection
+
+    # return a connection to the pool, discard=True closes it instead (e.g. after a connection error)
+    def putconn(self, connection: PooledConnection, discard=False):
+        with self.__lock:
+            if connection not in self.__in_use:
+                return
+        # never hand out a connection in the middle of a transaction, rolled back outside the lock (a round trip)
+        if not discard and not connection.closed:
+            try:
+                if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except Exception:
+                discard = True
+        with self.__lock:
+            self.__in_use.discard(connection)
+            if discard or self.__closed or connection.closed:
+                self.__discard(connection)
+            else:
+                connection.last_used = time.monotonic()
+                self.__idle.append(connection)
+            self.__lock.notify()
+
+    # close every idle connection, connections in use are closed when they are returned
+    def closeall(self):
+        with self.__lock:
+            self.__closed = True
+            while self.__idle:
+                self.__discard(self.__idle.pop())
+            self.__lock.notify_all()
+
+    # counters for sizing the pool
+    def stats(self) -> dict:
+        with self.__lock:
+            stats = dict(self.__stats)
+            stats.update(idle=len(self.__idle), in_use=len(self.__in_use), min_size=self.min_size,
+                         max_size=self.max_size)
+            return stats
+
+    def __connect(self) -> PooledConnection:
+        connection = psycopg2.connect(connection_factory=PooledConnection, **self.connect_params)
+        connection.autocommit = False
+        with self.__lock:
+            self.__stats["created"] += 1
+        return connection
+
+    def __healthy(self, connection: PooledConnection) -> bool:
+        if connection.closed:
+            return False
+        if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - connection.last_used < self.ping_after:
+            return True
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    # close connections idle for longer than idle_timeout, keeping min_size connections open
+    def __expire_idle(self):
+        now = time.monotonic()
+        while len(self.__idle) + len(self.__in_use) > self.min_size and self.__idle \
+                and now - self.__idle[0].last_used > self.idle_timeout:
+            self.__discard(self.__idle.pop(0))
+
+    def __discard(self, connection: PooledConnection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self.__stats["closed"] += 1
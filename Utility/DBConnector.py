@@ -1,8 +1,16 @@
 import psycopg2
-from psycopg2 import errors, sql
+from psycopg2 import extensions, sql
 from configparser import ConfigParser
 from Utility.Exceptions import DatabaseException
+from Utility.ConnectionPool import ConnectionPool
+from Utility.PreparedStatement import PreparedStatement
+from Utility.SlowQueryLog import SlowQueryLog
+from Utility import Instrumentation
+import itertools
 import os
+import re
+import threading
+import time
 from typing import Union
 
 
@@ -13,6 +21,67 @@ class ResultSetDict(dict):
         return super().__getitem__(item.lower())
 
 
+# read-only view of one result row, all rows of a result share one column -> index map (cols),
+# so a row costs a single small object instead of a dict
+# supports the same case-insensitive entry['name'] access as ResultSetDict
+class ResultSetRow:
+    __slots__ = ('_values', '_cols')
+
+    def __init__(self, values: tuple, cols: ResultSetDict):
+        self._values = values
+        self._cols = cols
+
+    def __getitem__(self, item):
+        if type(item) is not str:
+            return None
+        return self._values[self._cols[item]]
+
+    def get(self, item, default=None):
+        try:
+            return self[item]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self._cols.keys()
+
+    def values(self):
+        return [self._values[index] for index in self._cols.values()]
+
+    def items(self):
+        return [(col, self._values[index]) for col, index in self._cols.items()]
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def __contains__(self, item):
+        return type(item) is str and item.lower() in self._cols
+
+    def __iter__(self):
+        return iter(self._cols)
+
+    def __len__(self):
+        return len(self._cols)
+
+    def __eq__(self, other):
+        if isinstance(other, ResultSetRow):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+# column name (lower case) -> index in the row tuple, built once per result
+def columns_index(description) -> ResultSetDict:
+    cols = ResultSetDict()
+    for index, column in enumerate(description):
+        cols[column.name.lower()] = index
+    return cols
+
+
 class ResultSet:
     # constructor
     def __init__(self, description=None, results=None):
@@ -39,8 +108,9 @@ class ResultSet:
         return string
 
     def __iter__(self):
-        for row in range(len(self.rows)):
-            yield self.__getRow(row)
+        cols = self.cols
+        for row in self.rows:
+            yield ResultSetRow(row, cols)
 
     # what is the size of the ResultSet?
     def size(self):
@@ -53,46 +123,121 @@ class ResultSet:
     def __getRow(self, row: int):
         if len(self.rows) <= row:
             print('Invalid row ' + str(row))
-            return ResultSetDict()
-        row_to_return = ResultSetDict()
-        for val, col in zip(self.rows[row], self.cols_header):
-            row_to_return[col] = val
-        return row_to_return
+            return ResultSetRow((), ResultSetDict())
+        return ResultSetRow(self.rows[row], self.cols)
 
     def __fromQuery(self, description, results: list):
         if results is None or len(results) == 0:  # no results
             self.cols = ResultSetDict()
         else:
-            self.rows = results.copy()
+            self.rows = results
             self.cols_header = [d.name for d in description]
-            self.cols = ResultSetDict()
-            for col, index in zip(self.cols_header, range(len(results[0]))):
-                self.cols[col] = index
+            self.cols = columns_index(description)
+
+
+# SQLSTATE codes reported as DatabaseException subclasses
+CONSTRAINT_VIOLATIONS = {
+    "23502": DatabaseException.NOT_NULL_VIOLATION,
+    "23503": DatabaseException.FOREIGN_KEY_VIOLATION,
+    "23505": DatabaseException.UNIQUE_VIOLATION,
+    "23514": DatabaseException.CHECK_VIOLATION,
+    "23P01": DatabaseException.EXCLUSION_VIOLATION,
+}
+
+# rows fetched per round trip by DBConnector.stream
+DEFAULT_STREAM_BATCH_SIZE = 2000
 
 
 class DBConnector:
-    # constructor
+    __pool = None
+    __pool_options = {}
+    __pool_lock = threading.Lock()
+    __config_cache = None
+    __config_dsn = None
+    __config_schema = None
+    __config_generation = 0
+    __config_lock = threading.Lock()
+    __stream_ids = itertools.count()
+    __slow_query_log = None
+
+    # constructor, the connection is checked out of the process-wide pool
     def __init__(self):
+        self.connection = None
+        self.cursor = None
+        self.in_transaction = False
+        self.__savepoint = False
+        self.__home_pool = None
         try:
-            # Obtain the configuration parameters
-            params = DBConnector.__config()
-            self.connection = psycopg2.connect(**params)
-            self.connection.autocommit = False
+            # the connection goes back to the pool it came from, even if the pool is replaced meanwhile
+            self.__home_pool = DBConnector.__get_pool()
+            with Instrumentation.phase("connect"):
+                self.connection = self.__home_pool.getconn()
             self.cursor = self.connection.cursor()
         except Exception as e:
+            if self.connection is not None:
+                self.__home_pool.putconn(self.connection, discard=True)
             self.connection = None
             self.cursor = None
             raise DatabaseException.ConnectionInvalid("Could not connect to database")
 
-    # close connection
+    # close connection, the underlying connection goes back to the pool
     def close(self):
         if self.cursor is not None:
-            self.cursor.close()
+            try:
+                self.cursor.close()
+            except Exception:
+                pass
+            self.cursor = None
         if self.connection is not None:
-            self.connection.close()
+            self.__home_pool.putconn(self.connection, discard=bool(self.connection.closed))
+            self.connection = None
+
+    # set pool options (min_size, max_size, idle_timeout, checkout_timeout, ping_after), existing
+    # connections are closed and the pool is rebuilt on the next DBConnector
+    @staticmethod
+    def configure_pool(**options):
+        with DBConnector.__pool_lock:
+            DBConnector.__pool_options = dict(options)
+            if DBConnector.__pool is not None:
+                DBConnector.__pool.closeall()
+                DBConnector.__pool = None
+
+    # close all pooled connections
+    @staticmethod
+    def close_pool():
+        with DBConnector.__pool_lock:
+            if DBConnector.__pool is not None:
+                DBConnector.__pool.closeall()
+                DBConnector.__pool = None
+
+    # pool counters (created, reused, waits, idle, in_use, ...), empty if no connection was made yet
+    @staticmethod
+    def pool_stats() -> dict:
+        pool = DBConnector.__pool
+        return pool.stats() if pool is not None else {}
+
+    @staticmethod
+    def __get_pool() -> ConnectionPool:
+        pool = DBConnector.__pool
+        if pool is None:
+            with DBConnector.__pool_lock:
+                if DBConnector.__pool is None:
+                    DBConnector.__pool = ConnectionPool(DBConnector.config(), **DBConnector.__pool_options)
+                pool = DBConnector.__pool
+        return pool
+
+    # start a transaction spanning the following execute calls, until commit() or rollback()
+    # every statement in it runs under a savepoint, so a statement that fails is undone on its own and the
+    # transaction goes on, just as if each statement had been committed separately
+    def begin(self):
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+        self.in_transaction = True
+        self.__savepoint = False
 
     # commit connection's changes
     def commit(self):
+        self.in_transaction = False
         if self.connection is not None:
             try:
                 self.connection.commit()
@@ -101,63 +246,318 @@ class DBConnector:
 
     # rollback connection's changes
     def rollback(self):
+        self.in_transaction = False
         if self.connection is not None:
             try:
                 self.connection.rollback()
             except Exception:
                 raise DatabaseException.ConnectionInvalid("Could not rollback changes")
 
+    # named savepoint inside begin(), marking the start of a nested unit of work, rollback_to_savepoint(name)
+    # undoes what ran after it and release_savepoint(name) keeps it, both remove the savepoint
+    def savepoint(self, name: str):
+        self.__savepoint_command("SAVEPOINT {name}", name)
+
+    def rollback_to_savepoint(self, name: str):
+        self.__savepoint_command("ROLLBACK TO SAVEPOINT {name}; RELEASE SAVEPOINT {name}", name)
+
+    def release_savepoint(self, name: str):
+        self.__savepoint_command("RELEASE SAVEPOINT {name}", name)
+
+    def __savepoint_command(self, command: str, name: str):
+        if self.connection is None or not self.in_transaction:
+            raise DatabaseException.ConnectionInvalid("Not in a transaction")
+        # the statement savepoint goes first, later statements set their own after the named one
+        released = "RELEASE SAVEPOINT statement; " if self.__savepoint else ""
+        self.__savepoint = False
+        try:
+            self.cursor.execute(sql.SQL(released + command).format(name=sql.Identifier(name)))
+        except psycopg2.Error as e:
+            raise DatabaseException.UNKNOWN_ERROR(str(e))
+
     # executes the query, if it is SELECT you may ask to print the results with printSchema
+    # a PreparedStatement is prepared on first use on this connection and executed with params bound to it
+    # read_only=True runs the query in autocommit mode, saving the BEGIN and COMMIT round trips, only for
+    # queries that do not write (inside begin() the query simply joins the transaction)
     # returns the number of rows effected and a ResultSet (for SELECT)
-    def execute(self, query: Union[str, sql.Composed], printSchema=False) -> (int, ResultSet):
+    def execute(self, query: Union[str, sql.Composed, PreparedStatement], printSchema=False,
+                params: tuple = None, read_only=False) -> (int, ResultSet):
         if self.connection is None:
             raise DatabaseException.ConnectionInvalid("Connection Invalid")
 
+        autocommit = read_only and not self.in_transaction
+        if autocommit:
+            self.connection.autocommit = True
+
         # try execute the query
         try:
-            self.cursor.execute(query)
+            # inside a transaction the savepoint goes in the same round trip as the statement
+            savepoint = self.__savepoint_sql()
+            if isinstance(query, PreparedStatement):
+                if query.name not in self.connection.prepared:
+                    if savepoint:
+                        self.cursor.execute(savepoint)
+                        savepoint = ""
+                    with Instrumentation.phase("execute"):
+                        self.__prepare(query)
+                statement = savepoint + query.execute_sql
+            elif savepoint:
+                statement = sql.Composed([sql.SQL(savepoint), sql.SQL(query) if isinstance(query, str) else query])
+            else:
+                statement = query
+            with Instrumentation.phase("compose"):
+                statement = self.cursor.mogrify(statement, params)
+            start = time.perf_counter()
+            with Instrumentation.phase("execute"):
+                self.cursor.execute(statement)
+            duration = time.perf_counter() - start
             row_effected = max(self.cursor.rowcount, 0)
-            self.commit()
-        except errors.lookup("23502"):
-            raise DatabaseException.NOT_NULL_VIOLATION("NOT_NULL_VIOLATION")
-        except errors.lookup("23503"):
-            raise DatabaseException.FOREIGN_KEY_VIOLATION("FOREIGN_KEY_VIOLATION")
-        except errors.lookup("23505"):
-            raise DatabaseException.UNIQUE_VIOLATION("UNIQUE_VIOLATION")
-        except errors.lookup("23514"):
-            raise DatabaseException.CHECK_VIOLATION("CHECK_VIOLATION")
+            if not self.in_transaction and not autocommit:
+                with Instrumentation.phase("commit"):
+                    self.commit()
+        except psycopg2.Error as e:
+            self.__rollback_statement()
+            DBConnector.__raise_constraint_violation(e)
+            raise
+        finally:
+            if autocommit and not self.connection.closed:
+                self.connection.autocommit = False
 
         # get entries in case of SELECT
         if self.cursor.description is not None:
-            entries = ResultSet(self.cursor.description, self.cursor.fetchall())
+            with Instrumentation.phase("fetch"):
+                results = self.cursor.fetchall()
+            with Instrumentation.phase("resultset"):
+                entries = ResultSet(self.cursor.description, results)
         else:
             entries = ResultSet()
 
+        slow_query_log = DBConnector.__slow_query_log
+        if slow_query_log is not None and slow_query_log.is_slow(duration):
+            self.__log_slow_query(slow_query_log, query, params, duration, row_effected)
+
         # print SELECT entries
         if printSchema:
             print(entries)
 
         return row_effected, entries
 
+    # log statements running for at least threshold_ms milliseconds to path (JSON lines), with explain=True
+    # their plan is captured too, see SlowQueryLog, threshold_ms=None turns the log off
+    @staticmethod
+    def configure_slow_query_log(threshold_ms: float = None, path: str = "slow_queries.jsonl", explain=False):
+        DBConnector.__slow_query_log = SlowQueryLog(threshold_ms, path, explain) if threshold_ms is not None else None
+
+    def __log_slow_query(self, slow_query_log: SlowQueryLog, query, params, duration: float, rows: int):
+        if isinstance(query, PreparedStatement):
+            text, target = query.query, self.cursor.mogrify(query.execute_sql, params)
+        else:
+            text = self.cursor.mogrify(query, params)
+            target, params = text, None
+        encoding = extensions.encodings.get(self.connection.encoding, "utf-8")
+        text = text.decode(encoding, "replace") if isinstance(text, bytes) else text
+        target = target.decode(encoding, "replace")
+
+        plan, explain_error = None, None
+        if slow_query_log.explain and SlowQueryLog.explainable(target):
+            # re-run in a transaction (or below a savepoint of the open one) that is rolled back
+            try:
+                if self.in_transaction:
+                    self.cursor.execute("SAVEPOINT explain")
+                self.cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + target)
+                plan = self.cursor.fetchone()[0]
+            except psycopg2.Error as e:
+                explain_error = str(e).strip()
+            finally:
+                try:
+                    if self.in_transaction:
+                        self.cursor.execute("ROLLBACK TO SAVEPOINT explain; RELEASE SAVEPOINT explain")
+                    else:
+                        self.connection.rollback()
+                except psycopg2.Error:
+                    pass
+
+        try:
+            slow_query_log.log(Instrumentation.current_function(), text, params, duration, rows, plan, explain_error)
+        except OSError:
+            pass
+
+    # runs a COPY ... FROM STDIN statement that reads its data from file
+    # returns the number of rows copied
+    def copy_from(self, query: Union[str, sql.Composed], file) -> int:
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+
+        try:
+            if self.in_transaction:
+                self.cursor.execute(self.__savepoint_sql())
+            self.cursor.copy_expert(query, file)
+            row_effected = max(self.cursor.rowcount, 0)
+            if not self.in_transaction:
+                self.commit()
+        except psycopg2.Error as e:
+            self.__rollback_statement()
+            DBConnector.__raise_constraint_violation(e)
+            raise
+        return row_effected
+
+    # executes a SELECT through a named server-side cursor and yields its rows lazily, fetching batch_size
+    # rows per round trip, so memory stays bounded whatever the size of the result
+    # the transaction is committed once all rows were read, or rolled back if the caller stops early
+    # (inside begin() only the cursor is closed and the transaction is left to the caller)
+    def stream(self, query: Union[str, sql.Composed], batch_size=DEFAULT_STREAM_BATCH_SIZE):
+        if self.connection is None:
+            raise DatabaseException.ConnectionInvalid("Connection Invalid")
+
+        cursor = self.connection.cursor(name="stream_%d" % next(DBConnector.__stream_ids))
+        cursor.itersize = batch_size
+        done = False
+        try:
+            try:
+                if self.in_transaction:
+                    self.cursor.execute(self.__savepoint_sql())
+                with Instrumentation.phase("execute"):
+                    cursor.execute(query)
+                with Instrumentation.phase("fetch"):
+                    rows = cursor.fetchmany(batch_size)
+            except psycopg2.Error as e:
+                self.__rollback_statement()
+                DBConnector.__raise_constraint_violation(e)
+                raise
+            cols = columns_index(cursor.description) if cursor.description is not None else ResultSetDict()
+            while rows:
+                for row in rows:
+                    yield ResultSetRow(row, cols)
+                with Instrumentation.phase("fetch"):
+                    rows = cursor.fetchmany(batch_size)
+            cursor.close()
+            if not self.in_transaction:
+                self.commit()
+            done = True
+        finally:
+            if not done:
+                try:
+                    cursor.close()
+                    if not self.in_transaction:
+                        self.connection.rollback()
+                except Exception:
+                    pass
+
+    # SAVEPOINT to send before the next statement of a transaction, the previous one is released first
+    def __savepoint_sql(self) -> str:
+        if not self.in_transaction:
+            return ""
+        released = "RELEASE SAVEPOINT statement; " if self.__savepoint else ""
+        self.__savepoint = True
+        return released + "SAVEPOINT statement; "
+
+    # undo the failed statement of a transaction, keeping the statements before it
+    def __rollback_statement(self):
+        if self.in_transaction and self.__savepoint:
+            try:
+                self.cursor.execute("ROLLBACK TO SAVEPOINT statement")
+            except psycopg2.Error:
+                pass
+
+    def __prepare(self, statement: PreparedStatement):
+        if statement.name in self.connection.prepared:
+            return
+        # prepared statements outlive the transaction, even if it is rolled back
+        self.cursor.execute(statement.prepare_sql, ())
+        self.connection.prepared.add(statement.name)
+
+    @staticmethod
+    def __raise_constraint_violation(error: psycopg2.Error):
+        exception = CONSTRAINT_VIOLATIONS.get(error.pgcode)
+        if exception is not None:
+            raise exception(exception.__name__)
+
     # grant credentials
+    # the parameters are read once per process and cached, DATABASE_DSN (a libpq DSN or URI) in the
+    # environment overrides database.ini, call reload_config() after changing either
+    @staticmethod
+    def config() -> dict:
+        params = DBConnector.__config_cache
+        if params is None:
+            with DBConnector.__config_lock:
+                if DBConnector.__config_cache is None:
+                    DBConnector.__config_cache = DBConnector.__load_config()
+                params = DBConnector.__config_cache
+        return dict(params)
+
+    # drop the cached configuration (and the pool built from it), dsn overrides database.ini and DATABASE_DSN
+    @staticmethod
+    def reload_config(dsn: str = None):
+        with DBConnector.__config_lock:
+            DBConnector.__config_cache = None
+            DBConnector.__config_dsn = dsn
+            DBConnector.__config_generation += 1
+        DBConnector.close_pool()
+
+    # bumped by reload_config and configure_schema, pools kept elsewhere (AsyncDBConnector) rebuild when it changes
+    @staticmethod
+    def config_generation() -> int:
+        return DBConnector.__config_generation
+
+    # schema the connections work in: their search_path is set to it on connect (Solution.create_tables creates
+    # it), None keeps the search_path of the server
+    # unless configured, each test worker gets its own, worker_<id> for the PYTEST_XDIST_WORKER (pytest -n) or
+    # DB_WORKER_ID in the environment, so workers sharing a database don't see each other's tables
+    @staticmethod
+    def schema() -> str:
+        schema = DBConnector.__config_schema
+        if schema is None:
+            worker = os.environ.get("PYTEST_XDIST_WORKER") or os.environ.get("DB_WORKER_ID")
+            schema = "worker_" + worker if worker else None
+        # a plain lower case name, it goes unquoted into the search_path
+        return re.sub(r"\W", "_", schema.lower()) if schema else None
+
+    # drop the cached configuration (and the pool built from it), schema overrides the worker schema
     @staticmethod
-    def __config(filename=os.path.join(os.path.join(os.getcwd(), "Utility"), 'database.ini'),
-                 section='postgresql'):
+    def configure_schema(schema: str = None):
+        with DBConnector.__config_lock:
+            DBConnector.__config_cache = None
+            DBConnector.__config_schema = schema
+            DBConnector.__config_generation += 1
+        DBConnector.close_pool()
+
+    @staticmethod
+    def __load_config() -> dict:
+        params = DBConnector.__load_params()
+        schema = DBConnector.schema()
+        if schema is not None:
+            params["options"] = (params.get("options", "") + " -c search_path=" + schema).strip()
+        return params
+
+    @staticmethod
+    def __load_params() -> dict:
+        dsn = DBConnector.__config_dsn or os.environ.get("DATABASE_DSN")
+        if dsn:
+            try:
+                return extensions.parse_dsn(dsn)
+            except Exception:
+                raise DatabaseException.database_ini_ERROR("Invalid DATABASE_DSN")
+        for filename in DBConnector.__config_files():
+            db = DBConnector.__read_config(filename)
+            if db is not None:
+                return db
+        raise DatabaseException.database_ini_ERROR("Please modify database.ini file under Utility")
+
+    # database.ini is looked up under Utility in the working directory, then in its parent, then next to this module
+    @staticmethod
+    def __config_files():
+        return [os.path.join(os.getcwd(), "Utility", "database.ini"),
+                os.path.join(os.path.dirname(os.getcwd()), "Utility", "database.ini"),
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.ini")]
+
+    @staticmethod
+    def __read_config(filename, section='postgresql'):
         # create a parser
         parser = ConfigParser()
         # read config file
         parser.read(filename)
 
         # get section
-        db = {}
-        if parser.has_section(section):
-            params = parser.items(section)
-            for param in params:
-                db[param[0]] = param[1]
-        else:
-            # file not found
-            db = DBConnector.__config(
-                filename=os.path.join(os.path.join(os.path.dirname(os.getcwd()), 'Utility'), 'database.ini'))
-            if db is None:
-                raise DatabaseException.database_ini_ERROR("Please modify database.ini file under Utility")
-        return db
+        if not parser.has_section(section):
+            return None
+        return {key: value for key, value in parser.items(section)}
@@ -23,8 +23,14 @@ class DatabaseException(_Exceptions):
     class CHECK_VIOLATION(_Exceptions):
         pass
 
+    class EXCLUSION_VIOLATION(_Exceptions):
+        pass
+
     class database_ini_ERROR(_Exceptions):
         pass
 
+    class SCHEMA_MISMATCH(_Exceptions):
+        pass
+
     class UNKNOWN_ERROR(_Exceptions):
         pass
@@ -0,0 +1,219 @@
+import contextvars
+import functools
+import json
+import math
+import sys
+import threading
+import time
+
+'''
+    per-call latency breakdown of the Solution API
+    DBConnector and run_query report how long each phase of a call took:
+        connect   - getting a connection from the pool
+        compose   - turning the query and its parameters into the SQL text sent to the server
+        execute   - running the statement on the server
+        commit    - the COMMIT round trip
+        fetch     - reading the rows of the result
+        resultset - building the ResultSet
+        build     - everything else in the Solution function, mostly building the Business objects
+        total     - the whole Solution call
+    phases are tagged with the name of the Solution function they ran in (see instrumented) and handed to
+    every registered hook as hook(function, phase, seconds)
+    nothing is measured while no hook is registered, enable() registers a LatencyRecorder
+'''
+
+_hooks = []
+_hooks_lock = threading.Lock()
+_call = contextvars.ContextVar("instrumented_call", default=None)
+
+
+class Histogram:
+    # log-linear buckets, BUCKETS_PER_OCTAVE per doubling starting at 1 microsecond (~4% relative error)
+    BUCKETS_PER_OCTAVE = 16
+    MIN_SECONDS = 1e-6
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        index = 0 if seconds <= Histogram.MIN_SECONDS else \
+            int(math.log2(seconds / Histogram.MIN_SECONDS) * Histogram.BUCKETS_PER_OCTAVE) + 1
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    # upper bound of the bucket holding the p-th percentile (0 < p <= 100), clamped to the observed range
+    def percentile(self, p: float) -> float:
+        if self.count == 0:
+            return 0.0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                upper = Histogram.MIN_SECONDS * 2 ** (index / Histogram.BUCKETS_PER_OCTAVE)
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return {"count": self.count, "mean": self.total / self.count if self.count else 0.0,
+                "p50": self.percentile(50), "p95": self.percentile(95), "p99": self.percentile(99),
+                "max": self.max}
+
+
+# hook aggregating the phases into one Histogram per (function, phase)
+class LatencyRecorder:
+    def __init__(self):
+        self.__histograms = {}
+        self.__lock = threading.Lock()
+
+    def __call__(self, function: str, phase: str, seconds: float):
+        with self.__lock:
+            histogram = self.__histograms.get((function, phase))
+            if histogram is None:
+                histogram = self.__histograms[(function, phase)] = Histogram()
+            histogram.record(seconds)
+
+    # {function: {phase: {count, mean, p50, p95, p99, max}}}, times in seconds
+    def snapshot(self) -> dict:
+        with self.__lock:
+            result = {}
+            for (function, phase), histogram in sorted(self.__histograms.items()):
+                result.setdefault(function, {})[phase] = histogram.summary()
+            return result
+
+    def histogram(self, function: str, phase: str) -> Histogram:
+        with self.__lock:
+            return self.__histograms.get((function, phase))
+
+    def reset(self):
+        with self.__lock:
+            self.__histograms.clear()
+
+    # writes the snapshot as JSON (default) or as a table in milliseconds
+    def dump(self, file=None, as_json=True):
+        file = file if file is not None else sys.stdout
+        snapshot = self.snapshot()
+        if as_json:
+            json.dump(snapshot, file, indent=2)
+            file.write("\n")
+            return
+        file.write("%-32s %-10s %8s %10s %10s %10s %10s\n" % ("function", "phase", "count", "p50 ms", "p95 ms",
+                                                            "p99 ms", "max ms"))
+        for function, phases in snapshot.items():
+            for phase, summary in phases.items():
+                file.write("%-32s %-10s %8d %10.3f %10.3f %10.3f %10.3f\n" % (
+                    function, phase, summary["count"], summary["p50"] * 1e3, summary["p95"] * 1e3,
+                    summary["p99"] * 1e3, summary["max"] * 1e3))
+
+
+def add_hook(hook):
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook):
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def enabled() -> bool:
+    return bool(_hooks)
+
+
+# registers (and returns) a LatencyRecorder, the one passed in or a new one
+def enable(recorder: LatencyRecorder = None) -> LatencyRecorder:
+    recorder = recorder if recorder is not None else LatencyRecorder()
+    add_hook(recorder)
+    return recorder
+
+
+def disable(recorder: LatencyRecorder):
+    remove_hook(recorder)
+
+
+# name of the instrumented Solution function running in this thread / task
+def current_function() -> str:
+    call = _call.get()
+    return call[0] if call is not None else "unknown"
+
+
+# reports seconds spent in phase by the current Solution call
+def record(phase: str, seconds: float):
+    call = _call.get()
+    if call is not None:
+        call[1] += seconds
+        function = call[0]
+    else:
+        function = "unknown"
+    for hook in list(_hooks):
+        hook(function, phase, seconds)
+
+
+class _Phase:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+# with phase("execute"): ... times the block, free when instrumentation is disabled
+def phase(name: str):
+    return _Phase(name) if _hooks else _NO_PHASE
+
+
+# decorator naming the phases recorded during the call after the function, and recording its build and total
+# times (build being the part of the call not spent in another phase)
+def instrumented(function):
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if _call.get() is not None:  # nested Solution calls count towards the outer one
+            return function(*args, **kwargs)
+        call = [name, 0.0]
+        token = _call.set(call)
+        if not _hooks:
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _call.reset(token)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            total = time.perf_counter() - start
+            _call.reset(token)
+            for hook in list(_hooks):
+                hook(name, "build", max(total - call[1], 0.0))
+                hook(name, "total", total)
+
+    return wrapper
@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# thread-safe bounded LRU map with an optional time to live, for read-through caching of query results
+# every entry carries tags, invalidate(tag) drops all entries tagged with it (e.g. everything that depends on one
+# row), a read-through caller takes a token() before querying and passes it to put(), so a value read before a
+# concurrent invalidation is not stored after it
+class LRUCache:
+    # constructor
+    # max_size - entries kept, the least recently used one is evicted past it
+    # ttl - seconds an entry stays valid, None for no expiry
+    def __init__(self, max_size: int, ttl: float = None):
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.__entries = OrderedDict()  # key -> (value, tags, expires)
+        self.__tagged = {}  # tag -> keys of the entries tagged with it
+        self.__invalidations = 0
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # (True, value) if key is cached, (False, None) otherwise
+    def get(self, key) -> (bool, object):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+                self.__remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    # the invalidation count, for put
+    def token(self) -> int:
+        return self.__invalidations
+
+    # caches value under key, unless something was invalidated since token() returned token
+    def put(self, key, value, tags=(), token: int = None):
+        with self.__lock:
+            if token is not None and token != self.__invalidations:
+                return
+            if key in self.__entries:
+                self.__remove(key)
+            expires = time.monotonic() + self.ttl if self.ttl is not None else None
+            self.__entries[key] = (value, tuple(tags), expires)
+            for tag in tags:
+                self.__tagged.setdefault(tag, set()).add(key)
+            while len(self.__entries) > self.max_size:
+                self.__remove(next(iter(self.__entries)))
+                self.evictions += 1
+
+    # drops the entries tagged with any of tags
+    def invalidate(self, *tags):
+        with self.__lock:
+            self.__invalidations += 1
+            for tag in tags:
+                for key in list(self.__tagged.get(tag, ())):
+                    self.__remove(key)
+
+    def clear(self):
+        with self.__lock:
+            self.__invalidations += 1
+            self.__entries.clear()
+            self.__tagged.clear()
+
+    def __remove(self, key):
+        _, tags, _ = self.__entries.pop(key)
+        for tag in tags:
+            keys = self.__tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.__tagged[tag]
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def stats(self) -> dict:
+        with self.__lock:
+            return {"size": len(self.__entries), "max_size": self.max_size, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions, "expirations": self.expirations}
@@ -0,0 +1,37 @@
+import threading
+from typing import Sequence
+
+
+# a named server-side prepared statement, written with $1, $2, ... placeholders
+# DBConnector prepares it the first time it is executed on a pooled connection and afterwards only sends
+# EXECUTE with the bound parameters, so the server parses and plans the query once per connection
+class PreparedStatement:
+    __registry = {}
+    __registry_lock = threading.Lock()
+
+    # constructor
+    # name - unique statement name
+    # query - SQL text with $n placeholders
+    # param_types - SQL type of each placeholder, in order
+    def __init__(self, name: str, query: str, param_types: Sequence[str] = ()):
+        self.name = name.lower()
+        self.query = query
+        self.param_types = tuple(param_types)
+        placeholders = ", ".join(["%s"] * len(self.param_types))
+        types = " (" + ", ".join(self.param_types) + ")" if self.param_types else ""
+        # % is escaped since the statement is sent through cursor.execute with parameters
+        self.prepare_sql = ("PREPARE " + self.name + types + " AS " + self.query).replace("%", "%%")
+        self.execute_sql = "EXECUTE " + self.name + (" (" + placeholders + ")" if self.param_types else "")
+        with PreparedStatement.__registry_lock:
+            if self.name in PreparedStatement.__registry:
+                raise ValueError("Prepared statement " + self.name + " is already registered")
+            PreparedStatement.__registry[self.name] = self
+
+    # all registered statements by name
+    @staticmethod
+    def registry() -> dict:
+        with PreparedStatement.__registry_lock:
+            return dict(PreparedStatement.__registry)
+
+    def __str__(self):
+        return self.query
@@ -0,0 +1,44 @@
+import json
+import threading
+from datetime import datetime, timezone
+
+# statements EXPLAIN can run, anything else (DDL, several statements) is logged without a plan
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "VALUES", "EXECUTE", "TABLE")
+
+
+# JSON-lines log of the statements DBConnector.execute ran for at least threshold_ms milliseconds
+# every line holds the time, the Solution function, the SQL text, its parameters, the duration and, with
+# explain=True, the EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) plan of a re-run in a rolled-back transaction
+# (a re-run write may then fail, e.g. on the row it just inserted, the error is logged instead of the plan)
+class SlowQueryLog:
+    # constructor
+    # threshold_ms - statements running at least this long are logged
+    # path - file the JSON lines are appended to
+    # explain - capture the plan of logged statements
+    def __init__(self, threshold_ms: float, path: str, explain=False):
+        self.threshold = threshold_ms / 1000
+        self.path = path
+        self.explain = explain
+        self.__lock = threading.Lock()
+
+    def is_slow(self, seconds: float) -> bool:
+        return seconds >= self.threshold
+
+    # can the statement be re-run under EXPLAIN without running anything else
+    @staticmethod
+    def explainable(statement: str) -> bool:
+        statement = statement.strip().rstrip(";")
+        return ";" not in statement and statement.split(None, 1)[0].upper() in EXPLAINABLE if statement else False
+
+    def log(self, function: str, query: str, params, seconds: float, rows: int, plan=None, explain_error=None):
+        entry = {"time": datetime.now(timezone.utc).isoformat(), "function": function, "query": query,
+                 "params": list(params) if params is not None else None, "duration_ms": seconds * 1000,
+                 "rows": rows}
+        if plan is not None:
+            entry["plan"] = plan
+        if explain_error is not None:
+            entry["explain_error"] = explain_error
+        line = json.dumps(entry, default=str)
+        with self.__lock:
+            with open(self.path, "a") as file:
+                file.write(line + "\n")